@@ -0,0 +1,16 @@
+def get_recognizer(name):
+    """Async speech recognizer for ws_server voice input, or None when voice input is disabled."""
+    if name == "whisper":
+        from .whisper_module import WhisperRecognizer
+        recognizer_class = WhisperRecognizer
+    elif name == "stub":
+        from .stub import StubRecognizer
+        recognizer_class = StubRecognizer
+    elif name == "none":
+        return None
+    else:
+        raise ValueError(f"Unsupported ASR module: {name}")
+    recognizer = recognizer_class.from_config()
+    if recognizer is not None:
+        print(f"Create {recognizer_class.__name__} with model {recognizer.model}")
+    return recognizer
@@ -0,0 +1,49 @@
+ASR_SAMPLE_RATE = 16000
+ASR_FORMAT = "s16le"
+
+
+class RecognizerStream:
+    """One utterance being recognized, opened by `StreamingRecognizer.stream`.
+
+    Audio is 16-bit mono PCM at the recognizer's `sample_rate`, fed as it
+    arrives. `partial` is the best transcript of the audio so far and may
+    change as more arrives; `finish` is called once, at the endpoint, and
+    returns the final transcript.
+    """
+
+    async def feed(self, pcm: bytes):
+        raise NotImplementedError
+
+    async def partial(self) -> str:
+        raise NotImplementedError
+
+    async def finish(self) -> str:
+        raise NotImplementedError
+
+    def close(self):
+        """Drop the utterance without a final transcript."""
+
+
+class StreamingRecognizer:
+    """Async speech recognizer used by ws_server for voice input."""
+
+    name = ""
+    model = ""
+    sample_rate = ASR_SAMPLE_RATE
+
+    @classmethod
+    def from_config(cls):
+        """Build the recognizer from config, or return None if it cannot run here."""
+        return cls()
+
+    def stream(self) -> RecognizerStream:
+        raise NotImplementedError
+
+    async def warm_up(self):
+        """Called once at startup so the first utterance does not pay for loading the model."""
+
+    def get_stats(self):
+        return {}
+
+    async def close(self):
+        pass
@@ -0,0 +1,49 @@
+import globals
+from .streaming import RecognizerStream, StreamingRecognizer
+
+STUB_TEXT = "Hey Kobe, how do you stay motivated?"
+# speaking rate the stub assumes when revealing words of its transcript
+STUB_MS_PER_WORD = 300
+
+
+class StubRecognizerStream(RecognizerStream):
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+        self.samples = 0
+
+    async def feed(self, pcm):
+        self.samples += len(pcm) // 2
+
+    async def partial(self):
+        words = self.recognizer.text.split()
+        heard = self.samples * 1000 // self.recognizer.sample_rate // STUB_MS_PER_WORD
+        return " ".join(words[:heard])
+
+    async def finish(self):
+        self.recognizer.stats["utterances"] += 1
+        return self.recognizer.text
+
+
+class StubRecognizer(StreamingRecognizer):
+    """Recognizes every utterance as [asr] stub_text, revealing it word by word as audio arrives.
+
+    For tests and load tests: the voice-input path runs end to end with no
+    model installed.
+    """
+
+    name = "stub"
+    model = "stub"
+
+    def __init__(self, text=STUB_TEXT):
+        self.text = text
+        self.stats = {"utterances": 0}
+
+    @classmethod
+    def from_config(cls):
+        return cls(globals.config.get("asr", "stub_text", fallback=STUB_TEXT))
+
+    def stream(self):
+        return StubRecognizerStream(self)
+
+    def get_stats(self):
+        return dict(self.stats)
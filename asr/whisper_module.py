@@ -0,0 +1,119 @@
+import time
+import asyncio
+import logging
+import numpy as np
+from faster_whisper import WhisperModel
+import globals
+from .streaming import RecognizerStream, StreamingRecognizer
+
+logger = logging.getLogger("ws_server.asr")
+
+WHISPER_DEFAULT_MODEL = "base"
+# whisper attends to 30 s windows; partials only re-decode the tail of longer utterances
+WHISPER_WINDOW_SECONDS = 30
+
+
+class WhisperRecognizerStream(RecognizerStream):
+    """Re-decodes the utterance so far for each partial; the final decode is skipped when no audio came in since."""
+
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+        self.audio = bytearray()
+        self.last_partial = ""
+        self._decoded_bytes = 0
+        # a pause transcript may still be decoding when the final one is asked for
+        self._lock = asyncio.Lock()
+
+    async def feed(self, pcm):
+        self.audio += pcm
+
+    async def partial(self):
+        async with self._lock:
+            if len(self.audio) != self._decoded_bytes:
+                self._decoded_bytes = len(self.audio)
+                window = WHISPER_WINDOW_SECONDS * self.recognizer.sample_rate * 2
+                self.last_partial = await self.recognizer.transcribe(bytes(self.audio[-window:]))
+            return self.last_partial
+
+    async def finish(self):
+        text = await self.partial()
+        self.recognizer.stats["utterances"] += 1
+        return text
+
+    def close(self):
+        self.audio = bytearray()
+
+
+class WhisperRecognizer(StreamingRecognizer):
+    """faster-whisper (CTranslate2) on the CPU, int8 by default.
+
+    The model is loaded on first use (or at warm-up) in a worker thread.
+    Decodes run in worker threads, at most [asr] max_concurrency at a time
+    across all connections.
+    """
+
+    name = "whisper"
+
+    def __init__(self, model=WHISPER_DEFAULT_MODEL, device="cpu", compute_type="int8", cpu_threads=0,
+                 language=None, max_concurrency=2):
+        self.model = model
+        self.device = device
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.language = language or None
+        self.max_concurrency = max_concurrency
+        self.whisper: WhisperModel | None = None
+        self._load_lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.stats = {"utterances": 0, "decodes": 0, "decode_seconds_total": 0.0, "audio_seconds_total": 0.0}
+
+    @classmethod
+    def from_config(cls):
+        return cls(
+            model=globals.config.get("asr", "whisper_model", fallback=WHISPER_DEFAULT_MODEL),
+            device=globals.config.get("asr", "device", fallback="cpu"),
+            compute_type=globals.config.get("asr", "compute_type", fallback="int8"),
+            cpu_threads=globals.config.getint("asr", "cpu_threads", fallback=0),
+            language=globals.config.get("asr", "language", fallback=""),
+            max_concurrency=globals.config.getint("asr", "max_concurrency", fallback=2),
+        )
+
+    async def _ensure_loaded(self):
+        async with self._load_lock:
+            if self.whisper is None:
+                self.whisper = await asyncio.to_thread(
+                    WhisperModel, self.model, device=self.device, compute_type=self.compute_type,
+                    cpu_threads=self.cpu_threads, num_workers=self.max_concurrency,
+                )
+        return self.whisper
+
+    def _transcribe(self, pcm: bytes):
+        audio = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+        segments, _ = self.whisper.transcribe(
+            audio, language=self.language, beam_size=1, vad_filter=False, condition_on_previous_text=False,
+        )
+        return "".join(segment.text for segment in segments).strip()
+
+    async def transcribe(self, pcm: bytes):
+        if not pcm:
+            return ""
+        await self._ensure_loaded()
+        async with self._semaphore:
+            started = time.monotonic()
+            text = await asyncio.to_thread(self._transcribe, pcm)
+        self.stats["decodes"] += 1
+        self.stats["decode_seconds_total"] += time.monotonic() - started
+        self.stats["audio_seconds_total"] += len(pcm) / 2 / self.sample_rate
+        return text
+
+    def stream(self):
+        return WhisperRecognizerStream(self)
+
+    async def warm_up(self):
+        await self._ensure_loaded()
+        # one short decode so the first utterance does not pay for kernel setup
+        await self.transcribe(bytes(self.sample_rate // 2 * 2))
+        logger.info("Whisper model loaded: model=%s device=%s compute_type=%s", self.model, self.device, self.compute_type)
+
+    def get_stats(self):
+        return {"loaded": self.whisper is not None, **self.stats}
@@ -0,0 +1,126 @@
+OUTPUT_FORMAT_ALIASES = {
+    "pcm": "s16le",
+}
+OUTPUT_FORMATS = ("mp3", "wav", "s16le", "opus")
+
+# Ogg/Opus output (RFC 6716 / RFC 7845): libopus only runs at these rates
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+OPUS_FRAME_DURATIONS_MS = (10, 20, 40, 60)
+OPUS_MIN_BITRATE = 6000
+OPUS_MAX_BITRATE = 510000
+# wideband speech is transparent well below this; s16le at 32 kHz mono is 512 kbit/s
+OPUS_DEFAULT_BITRATE = 24000
+OPUS_DEFAULT_FRAME_MS = 20
+
+# https://platform.minimax.io/docs/api-reference/speech-t2a-websocket
+MINIMAX_FORMATS = ("mp3", "pcm", "flac")
+MINIMAX_SAMPLE_RATES = (8000, 16000, 22050, 24000, 32000, 44100)
+MINIMAX_CHANNELS = (1, 2)
+
+# how an utterance gets from the provider's bytes to what the client asked for
+PATH_DIRECT = "direct"        # provider already produces the client format
+PATH_WRAP = "wrap"            # provider PCM with a streaming WAV header in front
+PATH_TRANSCODE = "transcode"  # decode/encode through an AudioTranscoder
+
+
+class AudioPlan:
+    def __init__(self, provider_format, output_format, sample_rate, channels, path,
+                 provider_sample_rate=None, provider_channels=None, bitrate=128000,
+                 opus_bitrate=OPUS_DEFAULT_BITRATE, opus_frame_duration=OPUS_DEFAULT_FRAME_MS):
+        self.provider_format = provider_format
+        self.output_format = output_format
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.path = path
+        self.provider_sample_rate = provider_sample_rate or sample_rate
+        self.provider_channels = provider_channels or channels
+        # `bitrate` is what the provider is asked for; the opus encoder has its own
+        self.bitrate = bitrate
+        self.opus_bitrate = opus_bitrate
+        self.opus_frame_duration = opus_frame_duration
+
+    def set_opus_encoding(self, bitrate=None, frame_duration=None):
+        """Set the Opus encoder's bitrate (bit/s) and frame duration (ms), raising ValueError when out of range."""
+        bitrate = int(bitrate if bitrate is not None else self.opus_bitrate)
+        frame_duration = int(frame_duration if frame_duration is not None else self.opus_frame_duration)
+        if not OPUS_MIN_BITRATE <= bitrate <= OPUS_MAX_BITRATE:
+            raise ValueError(f"Unsupported opus bitrate: {bitrate} (must be {OPUS_MIN_BITRATE}-{OPUS_MAX_BITRATE})")
+        if frame_duration not in OPUS_FRAME_DURATIONS_MS:
+            raise ValueError(f"Unsupported opus frame duration: {frame_duration} ms "
+                             f"(choose from {', '.join(map(str, OPUS_FRAME_DURATIONS_MS))})")
+        self.opus_bitrate = bitrate
+        self.opus_frame_duration = frame_duration
+
+    @property
+    def output_bitrate(self):
+        """Bitrate of the audio the client receives, for compressed formats."""
+        return self.opus_bitrate if self.output_format == "opus" else self.bitrate
+
+    def provider_audio_setting(self):
+        return {
+            "sample_rate": self.provider_sample_rate,
+            "bitrate": self.bitrate,
+            "format": self.provider_format,
+            "channel": self.provider_channels
+        }
+
+    def to_dict(self):
+        result = {
+            "format": self.output_format,
+            "sample_rate": self.sample_rate,
+            "channel": self.channels,
+            "provider_format": self.provider_format,
+            "path": self.path,
+        }
+        if self.output_format == "opus":
+            result["bitrate"] = self.opus_bitrate
+            result["frame_duration"] = self.opus_frame_duration
+        return result
+
+
+def negotiate_audio_format(output_format, sample_rate=32000, channels=1,
+                           provider_formats=MINIMAX_FORMATS,
+                           provider_sample_rates=MINIMAX_SAMPLE_RATES,
+                           provider_channels=MINIMAX_CHANNELS,
+                           transcode_format="mp3"):
+    """Pick the cheapest way to produce `output_format` from the TTS provider.
+
+    Raw PCM is requested from the provider whenever the client wants s16le or
+    wav, so the only work left is at most a 44-byte header. Anything the
+    provider cannot produce at the requested rate/channels is requested as
+    `transcode_format` and transcoded.
+
+    Opus goes out at the Opus rate closest to `sample_rate` and is encoded
+    from raw PCM when the provider has it, so nothing is decoded twice.
+    """
+    output_format = OUTPUT_FORMAT_ALIASES.get(output_format.lower(), output_format.lower())
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported audio format: {output_format}")
+    if output_format == "opus":
+        sample_rate = min(OPUS_SAMPLE_RATES, key=lambda rate: abs(rate - sample_rate))
+        if "pcm" in provider_formats:
+            transcode_format = "pcm"
+
+    native_layout = sample_rate in provider_sample_rates and channels in provider_channels
+    if native_layout:
+        if output_format == "s16le" and "pcm" in provider_formats:
+            return AudioPlan("pcm", output_format, sample_rate, channels, PATH_DIRECT)
+        if output_format == "wav" and "pcm" in provider_formats:
+            return AudioPlan("pcm", output_format, sample_rate, channels, PATH_WRAP)
+        if output_format in provider_formats:
+            return AudioPlan(output_format, output_format, sample_rate, channels, PATH_DIRECT)
+
+    # the provider synthesizes at its closest rate; the transcoder resamples to the client's
+    provider_rate = min(provider_sample_rates, key=lambda rate: abs(rate - sample_rate))
+    provider_channel = channels if channels in provider_channels else provider_channels[0]
+    return AudioPlan(transcode_format, output_format, sample_rate, channels, PATH_TRANSCODE,
+                     provider_sample_rate=provider_rate, provider_channels=provider_channel)
+
+
+def audio_frame_size(audio_format, sample_rate, channels, bitrate, frame_ms):
+    """Bytes in `frame_ms` of audio: whole sample frames for PCM, the average at `bitrate` for compressed formats."""
+    if frame_ms <= 0:
+        return 0
+    if OUTPUT_FORMAT_ALIASES.get(audio_format, audio_format) in ("s16le", "wav"):
+        return max(1, sample_rate * frame_ms // 1000) * channels * 2
+    return max(1, (bitrate or 128000) * frame_ms // 8000)
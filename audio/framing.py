@@ -0,0 +1,41 @@
+import struct
+
+# Binary audio frame, sent as one WebSocket binary message:
+#   version (u8) | format (u8) | stream id (u32) | sequence number (u32) | payload
+# Multi-byte fields are big-endian. Control events stay JSON text frames.
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("!BBII")
+
+FORMAT_CODES = {
+    "mp3": 1,
+    "wav": 2,
+    "s16le": 3,
+    "pcm": 3,
+    "opus": 4,
+}
+FORMAT_NAMES = {
+    1: "mp3",
+    2: "wav",
+    3: "s16le",
+    4: "opus",
+}
+
+
+def pack_audio_frame(stream_id, seq, audio_format, payload):
+    header = FRAME_HEADER.pack(FRAME_VERSION, FORMAT_CODES.get(audio_format, 0), stream_id, seq)
+    return header + payload
+
+
+def pack_audio_header_into(buffer, stream_id, seq, audio_format):
+    """Write the frame header over the first FRAME_HEADER.size bytes of `buffer`, whose payload follows it."""
+    FRAME_HEADER.pack_into(buffer, 0, FRAME_VERSION, FORMAT_CODES.get(audio_format, 0), stream_id, seq)
+
+
+def unpack_audio_frame(frame):
+    """Return (stream_id, seq, audio_format, payload) for a binary audio frame."""
+    if len(frame) < FRAME_HEADER.size:
+        raise ValueError("Audio frame shorter than header")
+    version, format_code, stream_id, seq = FRAME_HEADER.unpack_from(frame)
+    if version != FRAME_VERSION:
+        raise ValueError(f"Unsupported audio frame version: {version}")
+    return stream_id, seq, FORMAT_NAMES.get(format_code, "unknown"), frame[FRAME_HEADER.size:]
@@ -0,0 +1,327 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from fastapi import WebSocket
+from .formats import audio_frame_size
+from .framing import FRAME_HEADER, pack_audio_header_into
+
+logger = logging.getLogger("ws_server.sender")
+
+AUDIO_TRANSPORTS = ("hex", "binary")
+
+
+SLOW_CLIENT_POLICIES = ("pause", "downgrade", "disconnect")
+
+# sent frame buffers kept per connection for reuse
+MAX_FREE_FRAMES = 8
+
+# every live sender, for the buffered-bytes metrics
+active_senders: set["ClientAudioSender"] = set()
+
+
+class ClientAudioSender:
+    """Send one connection's audio streams to the client.
+
+    In "hex" mode (the default, kept for older UE5 clients) each chunk is a
+    JSON `audio_chunk` event with hex-encoded data. In "binary" mode chunks
+    go out as binary frames (see audio.framing) and only audio_start /
+    audio_done stay JSON.
+
+    Messages go through a per-connection buffer drained by a writer task,
+    so a jittery link does not stall synthesis. The buffer is bounded: once
+    more than `max_buffered` bytes are waiting, the slow-client `policy`
+    applies. "pause" blocks the producer (and with it the transcoder and
+    provider reads) until the buffer is back under `low_water`;
+    "downgrade" does the same and flags the connection so the next turn
+    uses a cheaper format; "disconnect" closes the connection.
+
+    Audio is coalesced into messages of `frame_ms` of audio each: chunks
+    are copied once, straight into the buffer of the outgoing message
+    (after room for the binary frame header), and a partial frame goes out
+    after at most `frame_ms`. Buffers are reused once sent. With
+    `frame_ms` 0 every chunk goes out as its own message.
+    """
+
+    def __init__(self, client_ws: WebSocket, transport="hex", max_buffered=256 * 1024, low_water=64 * 1024,
+                 policy="pause", connection_id=None, frame_ms=20):
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unsupported slow client policy: {policy}")
+        self.client_ws = client_ws
+        self.transport = transport
+        self.max_buffered = max_buffered
+        self.low_water = min(low_water, max_buffered)
+        self.policy = policy
+        self.connection_id = connection_id if connection_id is not None else id(client_ws)
+        self.stream_id = 0
+        self.seq = 0
+        # last (stream_id, seq) the client has actually been sent
+        self.sent = (0, 0)
+        self.audio_format = None
+        # TurnTimer of the turn being voiced; its spans go out with audio_done
+        self.timer = None
+        self.buffered_bytes = 0
+        self.downgrade_requested = False
+        self.closed = False
+        self.frame_ms = frame_ms
+        # payload bytes per message for the current stream, 0 = no coalescing
+        self.frame_bytes = 0
+        # room for the binary frame header in front of the payload; set per stream, like the transport in audio_start
+        self._headroom = 0
+        self.stats = {"high_water_hits": 0, "paused_time_total": 0.0, "discarded_chunks": 0}
+        self._frame: bytearray | None = None
+        self._filled = 0
+        self._frame_started_at = 0.0
+        self._flush_timer: asyncio.TimerHandle | None = None
+        self._free: list[bytearray] = []
+        self._pending: deque = deque()
+        self._has_pending = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._writer: asyncio.Task | None = None
+        active_senders.add(self)
+
+    def _push(self, payload, size, seq=0):
+        """Queue a message (a binary frame, a text message, a dict, or a callable building the dict at send time)."""
+        if self.closed:
+            return
+        self._pending.append((payload, size, self.stream_id, seq, self.timer))
+        self.buffered_bytes += size
+        self._has_pending.set()
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+
+    async def _enqueue(self, payload, size, seq=0):
+        self._push(payload, size, seq)
+        if self.buffered_bytes > self.max_buffered and not self.closed:
+            await self._on_high_water()
+
+    async def _on_high_water(self):
+        self.stats["high_water_hits"] += 1
+        if self.policy == "disconnect":
+            logger.warning("Client too slow, disconnecting: connection=%s buffered=%s", self.connection_id, self.buffered_bytes)
+            await self.close()
+            try:
+                await self.client_ws.close(code=1013, reason="client too slow")
+            except Exception:
+                pass
+            return
+        if self.policy == "downgrade" and not self.downgrade_requested:
+            logger.warning("Client too slow, downgrading next turn: connection=%s", self.connection_id)
+            self.downgrade_requested = True
+        self._drained.clear()
+        start = time.monotonic()
+        await self._drained.wait()
+        self.stats["paused_time_total"] += time.monotonic() - start
+
+    def _sent(self, size):
+        self.buffered_bytes -= size
+        if self.buffered_bytes <= self.low_water:
+            self._drained.set()
+
+    async def _write_loop(self):
+        try:
+            while True:
+                if not self._pending:
+                    self._has_pending.clear()
+                    await self._has_pending.wait()
+                    continue
+                payload, size, stream_id, seq, timer = self._pending.popleft()
+                if callable(payload):
+                    payload = payload()
+                if isinstance(payload, dict):
+                    await self.client_ws.send_json(payload)
+                elif isinstance(payload, str):
+                    await self.client_ws.send_text(payload)
+                else:
+                    await self.client_ws.send_bytes(payload)
+                    # the message has been serialized by now, so its buffer can take the next frame
+                    self._recycle(payload)
+                if seq:
+                    self.sent = (stream_id, seq)
+                    if timer:
+                        timer.mark("client_first_chunk")
+                        timer.update("client_last_chunk")
+                self._sent(size)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # the connection is gone; drop everything so producers never wait on it
+            logger.info("Audio send failed, dropping buffered audio: connection=%s", self.connection_id)
+            self.closed = True
+            self._pending.clear()
+            self.buffered_bytes = 0
+            self._drained.set()
+
+    def discard_pending(self):
+        """Drop audio that is queued but not yet sent (barge-in); control events still go out."""
+        self._drop_partial()
+        kept = deque()
+        for item in self._pending:
+            if item[3]:
+                self.buffered_bytes -= item[1]
+                self.stats["discarded_chunks"] += 1
+            else:
+                kept.append(item)
+        self._pending = kept
+        if self.buffered_bytes <= self.low_water:
+            self._drained.set()
+
+    async def close(self):
+        self.closed = True
+        self._drop_partial()
+        self._pending.clear()
+        self.buffered_bytes = 0
+        self._drained.set()
+        active_senders.discard(self)
+        if self._writer and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    async def send_event(self, message: dict):
+        """Send a JSON event in order with the audio already queued."""
+        await self._enqueue(message, 0)
+
+    async def start(self, audio_format, sample_rate=32000, channel=1, bitrate=128000, path=None):
+        self.flush()
+        self.stream_id += 1
+        self.seq = 0
+        self.audio_format = audio_format
+        self.frame_bytes = audio_frame_size(audio_format, sample_rate, channel, bitrate, self.frame_ms)
+        self._headroom = FRAME_HEADER.size if self.transport == "binary" else 0
+        if self._free and len(self._free[0]) != self._buffer_size():
+            self._free.clear()
+        await self._enqueue({
+            "event": "audio_start",
+            "format": audio_format,
+            "sample_rate": sample_rate,
+            "channel": channel,
+            "bitrate": bitrate,
+            "stream_id": self.stream_id,
+            "transport": self.transport,
+            "path": path,
+        }, 0)
+
+    def _buffer_size(self):
+        return self._headroom + self.frame_bytes
+
+    def _take_buffer(self):
+        return self._free.pop() if self._free else bytearray(self._buffer_size())
+
+    def _recycle(self, payload):
+        buffer = payload.obj if isinstance(payload, memoryview) else payload
+        if (isinstance(buffer, bytearray) and len(buffer) == self._buffer_size()
+                and len(self._free) < MAX_FREE_FRAMES):
+            self._free.append(buffer)
+
+    def _seal(self, buffer, size):
+        """The message for a buffer holding `size` bytes of audio, with the next seq."""
+        self.seq += 1
+        if self._headroom:
+            pack_audio_header_into(buffer, self.stream_id, self.seq, self.audio_format)
+            end = self._headroom + size
+            return (buffer if end == len(buffer) else memoryview(buffer)[:end]), size
+        message = '{"event":"audio_chunk","data":"%s","format":"%s"}' % (memoryview(buffer)[:size].hex(), self.audio_format)
+        self._recycle(buffer)
+        return message, 2 * size
+
+    def flush(self):
+        """Send the frame being filled now, e.g. at the end of a sentence, instead of waiting for the rest of it."""
+        if self._frame is None:
+            return
+        buffer, self._frame = self._frame, None
+        payload, size = self._seal(buffer, self._filled)
+        self._push(payload, size, self.seq)
+
+    def _flush_late(self):
+        """Timer callback: a frame still unfilled `frame_ms` after it was started goes out partial.
+
+        One timer per connection, moved on to the current frame's deadline
+        when it fires early, so bursts of frames do not each schedule one.
+        """
+        self._flush_timer = None
+        if self._frame is None:
+            return
+        loop = asyncio.get_running_loop()
+        due = self._frame_started_at + self.frame_ms / 1000
+        if loop.time() >= due:
+            self.flush()
+        else:
+            self._flush_timer = loop.call_at(due, self._flush_late)
+
+    def _drop_partial(self):
+        self._frame = None
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    async def send_chunk(self, chunk):
+        """Queue audio (any bytes-like object); it is copied once, into the frames that go out."""
+        if self.closed:
+            return
+        view = memoryview(chunk)
+        headroom = self._headroom
+        if not self.frame_bytes:
+            buffer = bytearray(headroom + len(view))
+            buffer[headroom:] = view
+            payload, size = self._seal(buffer, len(view))
+            await self._enqueue(payload, size, self.seq)
+            return
+        pos, total = 0, len(view)
+        while pos < total:
+            if self._frame is None:
+                self._frame = self._take_buffer()
+                self._filled = 0
+                # bounds the delay coalescing adds: a frame waits at most frame_ms for the rest of its audio
+                loop = asyncio.get_running_loop()
+                self._frame_started_at = loop.time()
+                if self._flush_timer is None:
+                    self._flush_timer = loop.call_at(self._frame_started_at + self.frame_ms / 1000, self._flush_late)
+            n = min(total - pos, self.frame_bytes - self._filled)
+            start = headroom + self._filled
+            self._frame[start:start + n] = view[pos:pos + n]
+            self._filled += n
+            pos += n
+            if self._filled == self.frame_bytes:
+                buffer, self._frame = self._frame, None
+                payload, size = self._seal(buffer, self.frame_bytes)
+                await self._enqueue(payload, size, self.seq)
+
+    async def send_hex_chunk(self, audio_hex: str):
+        """Forward a provider chunk that is already hex encoded without re-encoding it in hex mode."""
+        if self._headroom:
+            await self.send_chunk(bytes.fromhex(audio_hex))
+            return
+        self.flush()
+        self.seq += 1
+        await self._enqueue({
+            "event": "audio_chunk",
+            "data": audio_hex,
+            "format": self.audio_format,
+        }, len(audio_hex), self.seq)
+
+    async def done(self):
+        self.flush()
+        stream_id, last_seq, timer = self.stream_id, self.seq, self.timer
+
+        def message():
+            # built when it is sent, so the timing covers every chunk before it
+            done = {"event": "audio_done", "stream_id": stream_id, "last_seq": last_seq}
+            if timer:
+                done["timing"] = timer.to_dict()
+            return done
+
+        await self._enqueue(message, 0)
+
+    async def cancelled(self):
+        """Drop the current stream's unsent audio and tell the client the last seq it actually got."""
+        self.discard_pending()
+        stream_id = self.stream_id
+
+        def message():
+            sent_stream, sent_seq = self.sent
+            return {"event": "audio_cancelled", "stream_id": stream_id, "last_seq": sent_seq if sent_stream == stream_id else 0}
+
+        await self._enqueue(message, 0)
+
+    def get_stats(self):
+        return {"buffered_bytes": self.buffered_bytes, "downgrade_requested": self.downgrade_requested, **self.stats}
@@ -0,0 +1,486 @@
+import io
+import struct
+import shutil
+import importlib
+import asyncio
+import logging
+from .formats import OPUS_DEFAULT_BITRATE, OPUS_DEFAULT_FRAME_MS, OUTPUT_FORMAT_ALIASES, PATH_TRANSCODE, PATH_WRAP
+
+logger = logging.getLogger("ws_server.transcoder")
+
+TRANSCODER_BACKENDS = ("pyav", "ffmpeg")
+# what PyAVTranscoder / PyAVOpusTranscoder can produce; anything else goes through ffmpeg
+PYAV_OUTPUT_FORMATS = ("s16le", "wav", "opus")
+# largest ffmpeg stdout read; reads return whatever is there, and the sender coalesces them into frames
+FFMPEG_READ_SIZE = 65536
+
+
+def wav_stream_header(sample_rate, channels, bits_per_sample=16):
+    """RIFF/WAVE header for a stream whose length is not known up front."""
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    return (
+        b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample)
+        + b"data" + struct.pack("<I", 0xFFFFFFFF)
+    )
+
+
+class AudioTranscoder:
+    """Convert one audio stream incrementally.
+
+    Callers `feed` input bytes as they arrive from the provider, call `close`
+    at the end of the stream and consume converted bytes from `chunks()`,
+    which ends once everything fed before `close` has been emitted.
+    Chunks may be memoryviews over decoder output rather than bytes.
+    Output is bounded: once `max_buffered` converted bytes are waiting,
+    `feed` blocks until `chunks()` has caught up, so a stalled consumer
+    stops provider reads instead of growing the queue.
+    """
+
+    max_buffered = 256 * 1024
+
+    def __init__(self, input_format, output_format, sample_rate=32000, channels=1,
+                 input_sample_rate=None, input_channels=None):
+        self.input_format = input_format
+        self.output_format = output_format
+        self.sample_rate = sample_rate
+        self.channels = channels
+        # only meaningful for raw s16le input, which carries no header to read them from
+        self.input_sample_rate = input_sample_rate or sample_rate
+        self.input_channels = input_channels or channels
+        self._output: asyncio.Queue = asyncio.Queue()
+        self._buffered = 0
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    def _put(self, chunk: bytes):
+        self._output.put_nowait(chunk)
+        self._buffered += len(chunk)
+        if self._buffered > self.max_buffered:
+            self._writable.clear()
+
+    async def _wait_writable(self):
+        await self._writable.wait()
+
+    async def feed(self, data: bytes):
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    async def abort(self):
+        """Drop any pending output and release resources without flushing."""
+        self._writable.set()
+        self._output.put_nowait(None)
+
+    async def chunks(self):
+        while True:
+            chunk = await self._output.get()
+            if chunk is None:
+                break
+            self._buffered -= len(chunk)
+            if self._buffered <= self.max_buffered:
+                self._writable.set()
+            yield chunk
+
+
+class PyAVTranscoder(AudioTranscoder):
+    """In-process decoder: parse compressed input with libavcodec and resample to s16le.
+
+    Raw s16le input skips the decoder and goes straight to the resampler.
+    Decoding a provider chunk takes well under a millisecond, so it runs
+    inline on the event loop rather than paying for a thread hop.
+    """
+
+    def __init__(self, input_format, output_format, sample_rate=32000, channels=1,
+                 input_sample_rate=None, input_channels=None):
+        super().__init__(input_format, output_format, sample_rate, channels, input_sample_rate, input_channels)
+        import av
+
+        self.av = av
+        self.codec = None if input_format == "s16le" else av.CodecContext.create(input_format, "r")
+        self._pcm_remainder = b""
+        self.resampler = av.AudioResampler(
+            format="s16",
+            layout="mono" if channels == 1 else "stereo",
+            rate=sample_rate,
+        )
+        self._header_sent = output_format != "wav"
+
+    def _emit_frames(self, frames):
+        for frame in frames:
+            for out_frame in self.resampler.resample(frame):
+                self._emit(out_frame)
+
+    def _emit(self, out_frame):
+        if out_frame is None or not out_frame.samples:
+            return
+        if not self._header_sent:
+            self._put(wav_stream_header(self.sample_rate, self.channels))
+            self._header_sent = True
+        size = out_frame.samples * 2 * self.channels
+        # a view of the resampled frame, which it keeps alive; the sender copies it once into the outgoing frame
+        self._put(memoryview(out_frame.planes[0])[:size])
+
+    def _decode(self, packet):
+        try:
+            frames = self.codec.decode(packet)
+        except self.av.error.InvalidDataError:
+            # ID3 tags and partial frames at stream boundaries; the parser resyncs on the next frame
+            return
+        self._emit_frames(frames)
+
+    def _pcm_frame(self, data: bytes):
+        frame_bytes = 2 * self.input_channels
+        if self._pcm_remainder:
+            data = self._pcm_remainder + data
+        data = memoryview(data)
+        usable = len(data) - len(data) % frame_bytes
+        self._pcm_remainder = bytes(data[usable:])
+        if not usable:
+            return None
+        frame = self.av.AudioFrame(format="s16", layout="mono" if self.input_channels == 1 else "stereo",
+                                   samples=usable // frame_bytes)
+        frame.planes[0].update(data[:usable])
+        frame.sample_rate = self.input_sample_rate
+        return frame
+
+    def _process(self, data: bytes):
+        if self.codec is None:
+            frame = self._pcm_frame(data)
+            if frame is not None:
+                self._emit_frames([frame])
+        else:
+            for packet in self.codec.parse(data):
+                self._decode(packet)
+
+    def _flush(self):
+        if self.codec is not None:
+            for packet in self.codec.parse(None):
+                self._decode(packet)
+            self._emit_frames(self.codec.decode(None))
+        for out_frame in self.resampler.resample(None):
+            self._emit(out_frame)
+
+    async def feed(self, data: bytes):
+        self._process(data)
+        await self._wait_writable()
+
+    async def close(self):
+        try:
+            self._flush()
+        except Exception:
+            logger.exception("PyAV flush failed")
+        self._output.put_nowait(None)
+
+
+class _MuxerSink(io.RawIOBase):
+    """Write target for an output container; collects muxed bytes until they are taken."""
+
+    def __init__(self):
+        super().__init__()
+        self.pending: list[bytes] = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.pending.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self.pending)
+        self.pending.clear()
+        return data
+
+
+class PyAVOpusTranscoder(PyAVTranscoder):
+    """Encode to Opus in an Ogg container with libopus, a page per Opus frame.
+
+    Input is decoded and resampled as in PyAVTranscoder, cut into
+    `frame_duration` ms frames and encoded as they arrive; whatever the
+    muxer wrote while handling one provider chunk goes out as one chunk,
+    so a client can start decoding after the first few pages.
+    """
+
+    def __init__(self, input_format, sample_rate=24000, channels=1, input_sample_rate=None, input_channels=None,
+                 bitrate=OPUS_DEFAULT_BITRATE, frame_duration=OPUS_DEFAULT_FRAME_MS):
+        super().__init__(input_format, "opus", sample_rate, channels, input_sample_rate, input_channels)
+        layout = "mono" if channels == 1 else "stereo"
+        self.resampler = self.av.AudioResampler(format="s16", layout=layout, rate=sample_rate,
+                                                frame_size=sample_rate * frame_duration // 1000)
+        self._sink = _MuxerSink()
+        # Ogg buffers a second of packets per page by default; flush every frame instead
+        self.container = self.av.open(self._sink, "w", format="ogg",
+                                      options={"page_duration": str(frame_duration * 1000)})
+        self.stream = self.container.add_stream("libopus", rate=sample_rate, options={
+            "frame_duration": str(frame_duration),
+            "application": "voip",
+        })
+        self.stream.bit_rate = bitrate
+        self.stream.layout = layout
+        self.stream.format = "s16"
+        self._pts = 0
+
+    def _emit(self, out_frame):
+        if out_frame is None or not out_frame.samples:
+            return
+        out_frame.pts = self._pts
+        self._pts += out_frame.samples
+        for packet in self.stream.encode(out_frame):
+            self.container.mux(packet)
+
+    def _put_muxed(self):
+        data = self._sink.take()
+        if data:
+            self._put(data)
+
+    def _process(self, data: bytes):
+        super()._process(data)
+        self._put_muxed()
+
+    def _flush(self):
+        try:
+            super()._flush()
+            for packet in self.stream.encode(None):
+                self.container.mux(packet)
+        finally:
+            self.container.close()
+            self._put_muxed()
+
+    async def abort(self):
+        try:
+            self.container.close()
+        except Exception:
+            pass
+        await super().abort()
+
+
+class WavHeaderTranscoder(AudioTranscoder):
+    """Pass provider PCM through unchanged, prefixed with a streaming WAV header."""
+
+    def __init__(self, sample_rate=32000, channels=1):
+        super().__init__("s16le", "wav", sample_rate, channels)
+        self._header_sent = False
+
+    async def feed(self, data: bytes):
+        if not self._header_sent:
+            self._put(wav_stream_header(self.sample_rate, self.channels))
+            self._header_sent = True
+        self._put(data)
+        await self._wait_writable()
+
+    async def close(self):
+        self._output.put_nowait(None)
+
+
+class FFmpegWorkerPool:
+    """Pre-spawned ffmpeg processes for one input/output conversion.
+
+    ffmpeg cannot be told where one stream ends without closing its stdin,
+    so each process still serves a single utterance. The fork/exec happens
+    in the background ahead of time instead of on the turn's critical path,
+    and all pipe I/O goes through asyncio so nothing blocks the loop.
+    """
+
+    def __init__(self, input_format, output_format, sample_rate=32000, channels=1, size=2,
+                 input_sample_rate=None, input_channels=None, bitrate=None, frame_duration=None):
+        self.input_format = input_format
+        self.output_format = output_format
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.input_sample_rate = input_sample_rate or sample_rate
+        self.input_channels = input_channels or channels
+        # encoder settings, only used for opus output
+        self.bitrate = bitrate or OPUS_DEFAULT_BITRATE
+        self.frame_duration = frame_duration or OPUS_DEFAULT_FRAME_MS
+        self.size = size
+        self._idle: list[asyncio.subprocess.Process] = []
+        self._filling = False
+        self._background: set[asyncio.Task] = set()
+
+    def _command(self):
+        input_args = ["-f", self.input_format]
+        if self.input_format == "s16le":
+            input_args += ["-ar", str(self.input_sample_rate), "-ac", str(self.input_channels)]
+        output_args = ["-f", self.output_format]
+        if self.output_format == "opus":
+            # ffmpeg's opus muxer is Ogg; -flush_packets so each page reaches stdout as it is written
+            output_args += ["-c:a", "libopus", "-b:a", str(self.bitrate), "-frame_duration", str(self.frame_duration),
+                            "-application", "voip", "-page_duration", str(self.frame_duration * 1000), "-flush_packets", "1"]
+        return ["ffmpeg", "-loglevel", "quiet", *input_args, "-i", "pipe:0",
+                *output_args, "-ar", str(self.sample_rate), "-ac", str(self.channels), "pipe:1"]
+
+    async def _spawn(self):
+        return await asyncio.create_subprocess_exec(
+            *self._command(),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+
+    async def fill(self):
+        if self._filling:
+            return
+        self._filling = True
+        try:
+            while len(self._idle) < self.size:
+                self._idle.append(await self._spawn())
+        except Exception:
+            logger.exception("ffmpeg spawn failed")
+        finally:
+            self._filling = False
+
+    async def acquire(self):
+        proc = None
+        while self._idle:
+            candidate = self._idle.pop()
+            if candidate.returncode is None:
+                proc = candidate
+                break
+        if proc is None:
+            proc = await self._spawn()
+        task = asyncio.create_task(self.fill())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return proc
+
+    async def close(self):
+        for proc in self._idle:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+        self._idle.clear()
+
+
+class FFmpegTranscoder(AudioTranscoder):
+    def __init__(self, pool: FFmpegWorkerPool):
+        super().__init__(pool.input_format, pool.output_format, pool.sample_rate, pool.channels,
+                         pool.input_sample_rate, pool.input_channels)
+        self.pool = pool
+        self.proc = None
+        self._reader = None
+
+    async def _ensure_started(self):
+        if self.proc is None:
+            self.proc = await self.pool.acquire()
+            self._reader = asyncio.create_task(self._read_output())
+
+    async def _read_output(self):
+        try:
+            while True:
+                chunk = await self.proc.stdout.read(FFMPEG_READ_SIZE)
+                if not chunk:
+                    break
+                self._put(chunk)
+                # stop reading while the consumer is behind; ffmpeg then blocks on its full stdout pipe
+                await self._wait_writable()
+        finally:
+            self._output.put_nowait(None)
+
+    async def feed(self, data: bytes):
+        await self._ensure_started()
+        self.proc.stdin.write(data)
+        await self.proc.stdin.drain()
+
+    async def close(self):
+        if self.proc is None:
+            self._output.put_nowait(None)
+            return
+        try:
+            self.proc.stdin.close()
+            await self.proc.stdin.wait_closed()
+        except Exception:
+            pass
+        await self._reader
+        await self.proc.wait()
+
+    async def abort(self):
+        if self.proc is None:
+            await super().abort()
+            return
+        self._writable.set()
+        if self.proc.returncode is None:
+            self.proc.kill()
+        await self._reader
+        await self.proc.wait()
+
+
+ffmpeg_pools: dict[tuple, FFmpegWorkerPool] = {}
+
+
+def get_ffmpeg_pool(input_format, output_format, sample_rate=32000, channels=1,
+                    input_sample_rate=None, input_channels=None, bitrate=None, frame_duration=None):
+    key = (input_format, output_format, sample_rate, channels, input_sample_rate, input_channels, bitrate, frame_duration)
+    if key not in ffmpeg_pools:
+        ffmpeg_pools[key] = FFmpegWorkerPool(input_format, output_format, sample_rate, channels,
+                                             input_sample_rate=input_sample_rate, input_channels=input_channels,
+                                             bitrate=bitrate, frame_duration=frame_duration)
+    return ffmpeg_pools[key]
+
+
+async def close_ffmpeg_pools():
+    for pool in ffmpeg_pools.values():
+        await pool.close()
+    ffmpeg_pools.clear()
+
+
+def create_transcoder(backend, input_format, output_format, sample_rate=32000, channels=1,
+                      input_sample_rate=None, input_channels=None, bitrate=None, frame_duration=None):
+    """Return a transcoder for the given conversion, or None if no conversion is needed.
+
+    `bitrate` and `frame_duration` (ms) configure the encoder for opus output.
+    """
+    same_layout = (input_sample_rate or sample_rate) == sample_rate and (input_channels or channels) == channels
+    if input_format == output_format and same_layout:
+        return None
+    if backend == "pyav" and output_format in PYAV_OUTPUT_FORMATS:
+        try:
+            if output_format == "opus":
+                return PyAVOpusTranscoder(input_format, sample_rate, channels, input_sample_rate, input_channels,
+                                          bitrate or OPUS_DEFAULT_BITRATE, frame_duration or OPUS_DEFAULT_FRAME_MS)
+            return PyAVTranscoder(input_format, output_format, sample_rate, channels, input_sample_rate, input_channels)
+        except ImportError:
+            logger.warning("PyAV not installed, falling back to ffmpeg transcoder")
+    elif backend not in TRANSCODER_BACKENDS:
+        raise ValueError(f"Unsupported transcoder backend: {backend}")
+    if not shutil.which("ffmpeg"):
+        logger.warning("ffmpeg not found, falling back to raw %s", input_format)
+        return None
+    return FFmpegTranscoder(get_ffmpeg_pool(input_format, output_format, sample_rate, channels,
+                                            input_sample_rate, input_channels, bitrate, frame_duration))
+
+
+def plan_transcoder_args(plan):
+    """`create_transcoder` / `get_ffmpeg_pool` arguments for a PATH_TRANSCODE plan."""
+    input_format = OUTPUT_FORMAT_ALIASES.get(plan.provider_format, plan.provider_format)
+    if plan.output_format == "opus":
+        encoder = (plan.opus_bitrate, plan.opus_frame_duration)
+    else:
+        encoder = (None, None)
+    return (input_format, plan.output_format, plan.sample_rate, plan.channels,
+            plan.provider_sample_rate, plan.provider_channels, *encoder)
+
+
+def create_transcoder_for_plan(backend, plan):
+    """Return the transcoder an AudioPlan needs, or None when provider bytes go out as they are."""
+    if plan.path == PATH_WRAP:
+        return WavHeaderTranscoder(plan.sample_rate, plan.channels)
+    if plan.path == PATH_TRANSCODE:
+        return create_transcoder(backend, *plan_transcoder_args(plan))
+    return None
+
+
+async def warm_up_transcoder(backend, plan):
+    """Get the plan's transcoder ready before the first turn: import PyAV, or pre-spawn ffmpeg workers."""
+    if plan.path != PATH_TRANSCODE:
+        return
+    if backend == "pyav" and plan.output_format in PYAV_OUTPUT_FORMATS:
+        try:
+            await asyncio.to_thread(importlib.import_module, "av")
+            return
+        except ImportError:
+            logger.warning("PyAV not installed, warming up ffmpeg instead")
+    if shutil.which("ffmpeg"):
+        await get_ffmpeg_pool(*plan_transcoder_args(plan)).fill()
@@ -0,0 +1,110 @@
+import sys
+import math
+from array import array
+
+VAD_FRAME_MS = 20
+SILENCE_DB = -120.0
+
+SPEECH_START = "start"
+SPEECH_PAUSE = "pause"
+SPEECH_RESUME = "resume"
+SPEECH_END = "end"
+
+
+def frame_level_db(frame: bytes) -> float:
+    """RMS level of a 16-bit little-endian PCM frame, in dBFS."""
+    samples = array("h")
+    samples.frombytes(frame[:len(frame) & ~1])
+    if sys.byteorder == "big":
+        samples.byteswap()
+    if not samples:
+        return SILENCE_DB
+    power = sum(sample * sample for sample in samples) / len(samples)
+    return 10 * math.log10(power / (32768 * 32768)) if power else SILENCE_DB
+
+
+class EnergyVAD:
+    """Speech / non-speech per frame, from its level against an adaptive noise floor.
+
+    A frame is speech when it is louder than `threshold_db` and at least
+    `margin_db` above the background level, which tracks non-speech frames.
+    """
+
+    def __init__(self, threshold_db=-45.0, margin_db=12.0):
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.noise_db = threshold_db - margin_db
+
+    def is_speech(self, frame: bytes) -> bool:
+        level = frame_level_db(frame)
+        speech = level > max(self.threshold_db, self.noise_db + self.margin_db)
+        if not speech:
+            # the floor follows background noise slowly, so a fan or hum does not count as speech
+            self.noise_db += 0.05 * (level - self.noise_db)
+        return speech
+
+
+class Endpointer:
+    """Turn per-frame VAD decisions into utterance events.
+
+    `process` returns, for each frame, None or one of:
+    - SPEECH_START: `min_speech_ms` of speech in a row, so clicks do not count
+    - SPEECH_PAUSE: `pause_ms` of silence in an utterance; the user may be
+      done, and a transcript taken now is likely the final one
+    - SPEECH_RESUME: `min_speech_ms` of speech again after a pause
+    - SPEECH_END: `endpoint_ms` of silence, or the utterance reached `max_utterance_ms`
+    """
+
+    def __init__(self, vad: EnergyVAD, frame_ms=VAD_FRAME_MS, min_speech_ms=100, pause_ms=300, endpoint_ms=700,
+                 max_utterance_ms=30000):
+        self.vad = vad
+        self.frame_ms = frame_ms
+        self.min_speech_ms = min_speech_ms
+        self.pause_ms = pause_ms
+        self.endpoint_ms = endpoint_ms
+        self.max_utterance_ms = max_utterance_ms
+        self.active = False
+        self.paused = False
+        self.speech_ms = 0
+        self.silence_ms = 0
+        self.utterance_ms = 0
+
+    def reset(self):
+        """Forget the current utterance, e.g. when the client stops sending audio mid-way."""
+        self.active = self.paused = False
+        self.speech_ms = self.silence_ms = self.utterance_ms = 0
+
+    def _end(self):
+        self.reset()
+        return SPEECH_END
+
+    def process(self, frame: bytes):
+        speech = self.vad.is_speech(frame)
+        self.speech_ms = self.speech_ms + self.frame_ms if speech else 0
+        if not self.active:
+            if self.speech_ms >= self.min_speech_ms:
+                self.active = True
+                self.silence_ms = 0
+                self.utterance_ms = self.speech_ms
+                return SPEECH_START
+            return None
+
+        self.utterance_ms += self.frame_ms
+        if self.utterance_ms >= self.max_utterance_ms:
+            return self._end()
+        if self.paused:
+            if self.speech_ms >= self.min_speech_ms:
+                self.paused = False
+                self.silence_ms = 0
+                return SPEECH_RESUME
+        elif speech:
+            self.silence_ms = 0
+            return None
+        if not speech:
+            self.silence_ms += self.frame_ms
+        if self.silence_ms >= self.endpoint_ms:
+            return self._end()
+        if not self.paused and self.silence_ms >= self.pause_ms:
+            self.paused = True
+            return SPEECH_PAUSE
+        return None
@@ -0,0 +1,166 @@
+"""Micro-benchmark of the server's audio hot path, from provider frame to client message.
+
+Synthetic Minimax responses (hex PCM inside JSON, as the provider sends
+them, in irregular chunk sizes) go through the path as it was before
+audio was handled zero-copy and through the current one (parse_audio_message
+and ClientAudioSender), for both client transports. Client messages are
+serialized into WebSocket frames as uvicorn does and written to /dev/null.
+
+    python -m bench.audio_path --seconds 120 --chunk-ms 10 --frame-ms 20
+
+"copied" counts the bytes written into newly made buffers on the way, per
+second of audio: every str, bytes or message the path materializes, up to
+the WebSocket frame (serializing that costs the same per byte in both).
+CPU is the best of `--repeat` runs.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from websockets.frames import Frame, Opcode
+from audio.framing import pack_audio_frame
+from audio.sender import ClientAudioSender
+from tts.minimax_ws import parse_audio_message
+
+SAMPLE_RATE = 32000
+
+
+def provider_messages(seconds, chunk_ms, seed=0):
+    """Raw Minimax text frames carrying `seconds` of 16-bit mono PCM, chunk sizes jittered around `chunk_ms`."""
+    rng = random.Random(seed)
+    remaining = SAMPLE_RATE * 2 * seconds
+    messages = []
+    while remaining:
+        size = min(remaining, max(2, int(rng.uniform(0.5, 1.5) * SAMPLE_RATE * chunk_ms / 1000)) & ~1)
+        remaining -= size
+        messages.append(json.dumps({
+            "data": {"audio": os.urandom(size).hex(), "status": 1, "ced": ""},
+            "extra_info": {"audio_length": size, "audio_sample_rate": SAMPLE_RATE, "audio_format": "pcm"},
+            "trace_id": "0" * 32,
+            "session_id": "1" * 24,
+            "event": "task_continued",
+            "is_final": False,
+            "base_resp": {"status_code": 0, "status_msg": "success"},
+        }, separators=(",", ":")).encode())
+    return messages
+
+
+class NullWebSocket:
+    """Stands in for the client connection: counts messages and the bytes copied to build them."""
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.messages = 0
+        self.copied = 0
+
+    def _write(self, opcode, data):
+        self.messages += 1
+        os.write(self.fd, Frame(opcode, data).serialize(mask=False))
+
+    async def send_bytes(self, data):
+        # a frame is assembled in one copy, header and payload
+        self.copied += len(data)
+        self._write(Opcode.BINARY, data)
+
+    async def send_text(self, data):
+        # the hex string, then the message around it
+        self.copied += 2 * len(data)
+        self._write(Opcode.TEXT, data.encode())
+
+    async def send_json(self, data):
+        # the hex string, then Starlette's json.dumps of the message
+        text = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        self.copied += len(data.get("data", "")) + len(text)
+        self._write(Opcode.TEXT, text.encode())
+
+
+class LegacySender(ClientAudioSender):
+    """ClientAudioSender as it sent audio before: a message per chunk, built from a copy of it."""
+
+    async def send_chunk(self, chunk: bytes):
+        self.seq += 1
+        if self.transport == "binary":
+            await self._enqueue(pack_audio_frame(self.stream_id, self.seq, self.audio_format, chunk), len(chunk), self.seq)
+        else:
+            await self._enqueue({
+                "event": "audio_chunk",
+                "data": chunk.hex(),
+                "format": self.audio_format,
+            }, 2 * len(chunk), self.seq)
+
+
+def legacy_parse(raw):
+    """Returns (audio, bytes copied): the frame handed over as str, parsed whole, audio decoded from the str."""
+    text = raw.decode()
+    audio_hex = json.loads(text)["data"]["audio"]
+    audio = bytes.fromhex(audio_hex)
+    return audio, len(text) + len(audio_hex) + len(audio)
+
+
+def current_parse(raw):
+    """Returns (audio, bytes copied): the audio, and the JSON around it."""
+    _, audio = parse_audio_message(raw)
+    return audio, len(audio) + len(raw) - 2 * len(audio)
+
+
+async def drive(messages, sender: ClientAudioSender, parse):
+    """Feed provider frames through `parse` into `sender`; returns (client messages, bytes copied)."""
+    await sender.start("s16le", SAMPLE_RATE, 1, path="direct")
+    copied = 0
+    for raw in messages:
+        audio, parse_copied = parse(raw)
+        copied += parse_copied
+        await sender.send_chunk(audio)
+        # each provider frame is a recv() in the server, so the writer gets its turn in between
+        await asyncio.sleep(0)
+    await sender.done()
+    while sender.buffered_bytes:
+        await asyncio.sleep(0)
+    await sender.close()
+    return sender.client_ws.messages, copied + sender.client_ws.copied
+
+
+def measure(make_sender, parse, messages, audio_seconds, repeat):
+    best = None
+    for _ in range(repeat):
+        sender = make_sender()
+        started = time.process_time()
+        sent, copied = asyncio.run(drive(messages, sender, parse))
+        cpu = time.process_time() - started
+        best = cpu if best is None else min(best, cpu)
+    return sent / audio_seconds, copied / audio_seconds, best / audio_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=120, help="seconds of audio per run")
+    parser.add_argument("--chunk-ms", type=float, default=10, help="average provider chunk, in ms of audio")
+    parser.add_argument("--frame-ms", type=int, default=20, help="client frame size ([tts] client_frame_ms)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per path, the fastest is reported")
+    args = parser.parse_args()
+
+    messages = provider_messages(args.seconds, args.chunk_ms)
+    print(f"{args.seconds} s of 32 kHz s16le in {len(messages)} provider chunks, client frames of {args.frame_ms} ms")
+    print(f"  {'path':<8} {'transport':<10} {'messages/s':>11} {'copied KB/s':>12} {'CPU ms/s':>9}")
+    fd = os.open(os.devnull, os.O_WRONLY)
+    try:
+        for transport in ("binary", "hex"):
+            runs = (
+                ("before", lambda: LegacySender(NullWebSocket(fd), transport=transport, max_buffered=1 << 30),
+                 legacy_parse),
+                ("after", lambda: ClientAudioSender(NullWebSocket(fd), transport=transport, max_buffered=1 << 30,
+                                                    frame_ms=args.frame_ms),
+                 current_parse),
+            )
+            for label, make_sender, parse in runs:
+                rate, copied, cpu = measure(make_sender, parse, messages, args.seconds, args.repeat)
+                print(f"  {label:<8} {transport:<10} {rate:>11.1f} {copied / 1024:>12.1f} {cpu * 1000:>9.3f}")
+    finally:
+        os.close(fd)
+
+
+if __name__ == "__main__":
+    main()
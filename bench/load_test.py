@@ -0,0 +1,310 @@
+"""Drive ws_server with many simulated clients and report latency, throughput and resource use.
+
+By default everything runs offline: stand-in Ollama and Minimax servers
+(bench.mock_ollama / bench.mock_minimax) are started with the chosen
+latency profile, ws_server is started against them with a temporary
+config, and N asyncio clients speak the normal chat protocol to it.
+
+    python -m bench.load_test --clients 50 --turns 3 --rate 10 --profile realistic
+    python -m bench.load_test --url ws://127.0.0.1:8024/ --clients 20   # an already running server
+
+Exit status is 1 when any connection was dropped or any turn timed out.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import configparser
+import subprocess
+import urllib.request
+import websockets
+from .profiles import PROFILES
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MESSAGES = ["Hey Kobe, how do you stay motivated?", "What did you eat before games?", "Any advice for a rookie?"]
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ProcessMonitor:
+    """Sample a process's CPU use and RSS from /proc (psutil when installed)."""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu_samples: list[float] = []
+        self.rss_samples: list[int] = []
+        try:
+            import psutil
+            self.process = psutil.Process(pid)
+        except ImportError:
+            self.process = None
+
+    def _cpu_seconds(self):
+        if self.process:
+            times = self.process.cpu_times()
+            return times.user + times.system
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def _rss_bytes(self):
+        if self.process:
+            return self.process.memory_info().rss
+        with open(f"/proc/{self.pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    async def run(self):
+        last_cpu, last_time = self._cpu_seconds(), time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                cpu, now = self._cpu_seconds(), time.monotonic()
+                self.rss_samples.append(self._rss_bytes())
+            except (OSError, ValueError):
+                return
+            self.cpu_samples.append(100 * (cpu - last_cpu) / (now - last_time))
+            last_cpu, last_time = cpu, now
+
+
+class Results:
+    def __init__(self):
+        self.ttfa: list[float] = []
+        self.first_text: list[float] = []
+        self.turn_time: list[float] = []
+        self.turns = 0
+        self.audio_bytes = 0
+        self.dropped = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.connected = 0
+
+
+async def run_turn(ws, message, results: Results, turn_timeout):
+    sent = time.monotonic()
+    await ws.send(json.dumps({"action": "chat", "message": message}))
+    first_audio = first_text = None
+
+    async def receive_until_done():
+        nonlocal first_audio, first_text
+        while True:
+            frame = await ws.recv()
+            now = time.monotonic()
+            if isinstance(frame, bytes):
+                first_audio = first_audio or now
+                results.audio_bytes += len(frame)
+                continue
+            event = json.loads(frame)
+            kind = event.get("event")
+            if kind == "text_delta":
+                first_text = first_text or now
+            elif kind == "audio_chunk":
+                first_audio = first_audio or now
+                results.audio_bytes += len(event.get("data", "")) // 2
+            elif kind == "error":
+                results.errors += 1
+            elif kind in ("audio_done", "audio_cancelled"):
+                return
+
+    try:
+        await asyncio.wait_for(receive_until_done(), turn_timeout)
+    except asyncio.TimeoutError:
+        results.timeouts += 1
+        return
+    results.turns += 1
+    results.turn_time.append(time.monotonic() - sent)
+    if first_text:
+        results.first_text.append(first_text - sent)
+    if first_audio:
+        results.ttfa.append(first_audio - sent)
+
+
+async def run_client(url, args, results: Results, index):
+    try:
+        async with websockets.connect(url, max_size=None, open_timeout=args.turn_timeout) as ws:
+            created = json.loads(await ws.recv())
+            if created.get("event") != "session_created":
+                results.errors += 1
+                return
+            results.connected += 1
+            configure = {"action": "configure"}
+            if args.transport != "hex" and args.transport in created.get("audio_transports", []):
+                configure["audio_transport"] = args.transport
+            if args.format:
+                configure["format"] = args.format
+            if len(configure) > 1:
+                await ws.send(json.dumps(configure))
+                await ws.recv()
+            for turn in range(args.turns):
+                await run_turn(ws, MESSAGES[(index + turn) % len(MESSAGES)], results, args.turn_timeout)
+                if args.think_time:
+                    await asyncio.sleep(args.think_time)
+    except (websockets.ConnectionClosed, OSError, asyncio.TimeoutError):
+        results.dropped += 1
+
+
+def write_config(path, ollama_port, minimax_port, server_port, args):
+    config = configparser.ConfigParser()
+    config.read(os.path.join(REPO_ROOT, "config", "config.ini"))
+    config.set("host", "ip", "127.0.0.1")
+    config.set("host", "port", str(server_port))
+    config.set("llm", "type", "ollama")
+    config.set("llm", "host", f"http://127.0.0.1:{ollama_port}")
+    config.set("tts", "type", "minimax")
+    config.set("tts", "minimax_url", f"ws://127.0.0.1:{minimax_port}")
+    config.set("tts", "pool_max_concurrency", str(max(16, args.clients)))
+    # every turn should hit the providers, not the phrase cache
+    config.set("tts", "cache_enabled", "false")
+    with open(path, "w") as f:
+        config.write(f)
+
+
+def wait_ready(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def start_stack(args, workdir):
+    """Start the stand-in backends and ws_server; return (processes, server pid, ws url)."""
+    ollama_port, minimax_port, server_port = free_port(), free_port(), free_port()
+    config_path = os.path.join(workdir, "config.ini")
+    write_config(config_path, ollama_port, minimax_port, server_port, args)
+    env = dict(os.environ, MINIMAX_API_KEY="bench")
+    log = open(os.path.join(workdir, "stack.log"), "w")
+    processes = [
+        subprocess.Popen([sys.executable, "-m", "bench.mock_ollama", "--port", str(ollama_port), "--profile", args.profile],
+                         cwd=REPO_ROOT, stdout=log, stderr=subprocess.STDOUT),
+        subprocess.Popen([sys.executable, "-m", "bench.mock_minimax", "--port", str(minimax_port), "--profile", args.profile],
+                         cwd=REPO_ROOT, stdout=log, stderr=subprocess.STDOUT),
+    ]
+    # the server runs in the temp dir so its log/ and cache/ do not land in the repo
+    server = subprocess.Popen([sys.executable, "-m", "bench.run_server", config_path],
+                              cwd=workdir, env=dict(env, PYTHONPATH=REPO_ROOT), stdout=log, stderr=subprocess.STDOUT)
+    processes.append(server)
+    if not wait_ready(server_port):
+        stop_stack(processes)
+        raise RuntimeError(f"ws_server did not become ready, see {log.name}")
+    return processes, server.pid, f"ws://127.0.0.1:{server_port}/"
+
+
+def stop_stack(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def ms(value):
+    return f"{value * 1000:.0f} ms" if value is not None else "-"
+
+
+def report(args, results: Results, elapsed, monitor: ProcessMonitor | None):
+    summary = {
+        "clients": args.clients,
+        "profile": args.profile,
+        "connected": results.connected,
+        "turns": results.turns,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_turns_per_s": round(results.turns / elapsed, 2) if elapsed else 0,
+        "audio_mb_per_s": round(results.audio_bytes / elapsed / 1e6, 3) if elapsed else 0,
+        "dropped_connections": results.dropped,
+        "timeouts": results.timeouts,
+        "errors": results.errors,
+    }
+    for name, values in (("ttfa", results.ttfa), ("first_text", results.first_text), ("turn", results.turn_time)):
+        for p in (50, 95, 99):
+            value = percentile(values, p)
+            summary[f"{name}_p{p}_ms"] = round(value * 1000, 1) if value is not None else None
+    if monitor and monitor.cpu_samples:
+        summary["server_cpu_avg_pct"] = round(sum(monitor.cpu_samples) / len(monitor.cpu_samples), 1)
+        summary["server_cpu_max_pct"] = round(max(monitor.cpu_samples), 1)
+        summary["server_rss_max_mb"] = round(max(monitor.rss_samples) / 1e6, 1)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return summary
+    print(f"{results.turns} turns from {results.connected}/{args.clients} clients in {elapsed:.1f} s "
+          f"({summary['throughput_turns_per_s']} turns/s, {summary['audio_mb_per_s']} MB/s audio)")
+    for label, values in (("time to first audio", results.ttfa), ("time to first text", results.first_text), ("turn duration", results.turn_time)):
+        print(f"  {label:<20} p50 {ms(percentile(values, 50)):>8}  p95 {ms(percentile(values, 95)):>8}  p99 {ms(percentile(values, 99)):>8}")
+    if "server_cpu_avg_pct" in summary:
+        print(f"  server CPU avg {summary['server_cpu_avg_pct']}% max {summary['server_cpu_max_pct']}%, RSS max {summary['server_rss_max_mb']} MB")
+    print(f"  dropped connections {results.dropped}, turn timeouts {results.timeouts}, errors {results.errors}")
+    return summary
+
+
+async def run(args):
+    results = Results()
+    processes = []
+    monitor = None
+    with tempfile.TemporaryDirectory(prefix="kobe_bench_") as workdir:
+        url = args.url
+        if not url:
+            processes, server_pid, url = start_stack(args, workdir)
+            monitor = ProcessMonitor(server_pid)
+        monitor_task = asyncio.create_task(monitor.run()) if monitor else None
+        # set before anything can fail, so an error in a client surfaces as itself
+        start = time.monotonic()
+        elapsed = 0.0
+        try:
+            clients = []
+            for i in range(args.clients):
+                clients.append(asyncio.create_task(run_client(url, args, results, i)))
+                if args.rate:
+                    await asyncio.sleep(1 / args.rate)
+            await asyncio.gather(*clients)
+        finally:
+            elapsed = time.monotonic() - start
+            if monitor_task:
+                monitor_task.cancel()
+            stop_stack(processes)
+    summary = report(args, results, elapsed, monitor)
+    return 1 if summary["dropped_connections"] or summary["timeouts"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="ws_server to test; by default one is started against stand-in backends")
+    parser.add_argument("--clients", type=int, default=10, help="concurrent simulated clients")
+    parser.add_argument("--turns", type=int, default=3, help="chat turns per client")
+    parser.add_argument("--rate", type=float, default=20, help="new connections per second while ramping up (0 = all at once)")
+    parser.add_argument("--think-time", type=float, default=0.5, help="pause between a client's turns, in seconds")
+    parser.add_argument("--turn-timeout", type=float, default=30, help="seconds before a turn counts as timed out")
+    parser.add_argument("--profile", default="realistic", choices=list(PROFILES), help="stand-in backend latency profile")
+    parser.add_argument("--transport", default="binary", choices=["hex", "binary"])
+    parser.add_argument("--format", help="audio format to negotiate (mp3 / wav / s16le / opus)")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
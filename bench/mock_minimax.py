@@ -0,0 +1,75 @@
+"""Offline stand-in for the Minimax t2a_v2 WebSocket API, answering with silence.
+
+    python -m bench.mock_minimax --port 11501 --profile realistic
+"""
+
+import json
+import random
+import asyncio
+import argparse
+import websockets
+from .profiles import PROFILES, get_profile
+
+# one MPEG-1 Layer III frame of silence: 128 kbps, 32 kHz, mono, 1152 samples
+MP3_SILENT_FRAME = bytes([0xFF, 0xFB, 0x98, 0xC0]) + bytes(572)
+
+
+def silence(audio_format, sample_rate, channels, seconds):
+    if audio_format == "mp3":
+        return MP3_SILENT_FRAME * max(1, int(seconds * 32000 / 1152))
+    return bytes(int(seconds * sample_rate) * 2 * channels)
+
+
+def create_handler(profile):
+    def delay(seconds):
+        return seconds * (1 + random.random() * profile["jitter"])
+
+    async def handler(ws):
+        await asyncio.sleep(delay(profile["connect_latency"]))
+        await ws.send(json.dumps({"event": "connected_success"}))
+        setting = {"format": "mp3", "sample_rate": 32000, "channel": 1}
+        try:
+            async for raw in ws:
+                message = json.loads(raw)
+                event = message.get("event")
+                if event == "task_start":
+                    setting.update(message.get("audio_setting") or {})
+                    await ws.send(json.dumps({"event": "task_started"}))
+                elif event == "task_continue":
+                    # about 60 ms of audio per character, like real speech
+                    audio = silence(setting["format"], setting["sample_rate"], setting["channel"],
+                                    0.06 * len(message.get("text", "")))
+                    chunks = profile["chunks_per_segment"]
+                    size = -(-len(audio) // chunks)
+                    await asyncio.sleep(delay(profile["first_audio"]))
+                    for i in range(0, len(audio), size):
+                        if i:
+                            await asyncio.sleep(delay(profile["audio_chunk_latency"]))
+                        await ws.send(json.dumps({"data": {"audio": audio[i:i + size].hex()}, "is_final": False}))
+                    await ws.send(json.dumps({"data": {"audio": ""}, "is_final": True}))
+                elif event == "task_finish":
+                    await ws.send(json.dumps({"event": "task_finished"}))
+                    await ws.close()
+                    return
+        except websockets.ConnectionClosed:
+            pass
+
+    return handler
+
+
+async def serve(host, port, profile):
+    async with websockets.serve(create_handler(profile), host, port, max_size=None):
+        await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11501)
+    parser.add_argument("--profile", default="realistic", choices=list(PROFILES))
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, get_profile(args.profile)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Offline stand-in for Ollama's /api/chat, streaming canned NDJSON replies.
+
+    python -m bench.mock_ollama --port 11500 --profile realistic
+"""
+
+import json
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+import uvicorn
+from .profiles import PROFILES, get_profile
+
+REPLY = (
+    "Man, what can I say? Every morning I was in the gym at four. "
+    "Nobody outworks you if you love the grind. Keep your head down, trust the process. "
+    "That is the mamba mentality, and it works for anything you do."
+)
+
+
+def create_app(profile):
+    app = FastAPI()
+    words = REPLY.split(" ")
+
+    def delay(seconds):
+        return seconds * (1 + random.random() * profile["jitter"])
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        model = body.get("model", "mock")
+        if body.get("stream") is False:
+            await asyncio.sleep(delay(profile["first_token"]))
+            return {"model": model, "message": {"role": "assistant", "content": "ok"}, "done": True,
+                    "prompt_eval_count": 10, "prompt_eval_duration": 0, "eval_count": 1}
+
+        async def generate():
+            await asyncio.sleep(delay(profile["first_token"]))
+            for i in range(profile["tokens"]):
+                if i:
+                    await asyncio.sleep(delay(profile["token_latency"]))
+                content = words[i % len(words)] + " "
+                yield json.dumps({"model": model, "message": {"role": "assistant", "content": content}, "done": False}) + "\n"
+            yield json.dumps({"model": model, "message": {"role": "assistant", "content": ""}, "done": True,
+                              "prompt_eval_count": 64, "prompt_eval_duration": 0, "eval_count": profile["tokens"]}) + "\n"
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--profile", default="realistic", choices=list(PROFILES))
+    args = parser.parse_args()
+    uvicorn.run(create_app(get_profile(args.profile)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
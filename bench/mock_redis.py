@@ -0,0 +1,81 @@
+"""Offline stand-in for a Redis server: the RESP commands the session store uses, kept in memory.
+
+    python -m bench.mock_redis --port 6379
+
+Enough to run several ws_server workers against `[session] store = redis`
+without a real Redis; nothing is persisted.
+"""
+
+import time
+import asyncio
+import argparse
+
+
+class RESPServer:
+    def __init__(self):
+        self.data: dict[bytes, tuple[bytes, float | None]] = {}
+
+    def _get(self, key):
+        entry = self.data.get(key)
+        if entry and entry[1] is not None and entry[1] < time.monotonic():
+            del self.data[key]
+            return None
+        return entry[0] if entry else None
+
+    def execute(self, args):
+        command = args[0].upper()
+        if command == b"PING":
+            return b"+PONG\r\n"
+        if command in (b"AUTH", b"SELECT"):
+            return b"+OK\r\n"
+        if command == b"GET":
+            value = self._get(args[1])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+        if command == b"SET":
+            expires = None
+            if len(args) >= 5 and args[3].upper() == b"EX":
+                expires = time.monotonic() + int(args[4])
+            self.data[args[1]] = (args[2], expires)
+            return b"+OK\r\n"
+        if command == b"DEL":
+            removed = sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+            return b":%d\r\n" % removed
+        return b"-ERR unknown command '%s'\r\n" % command
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+                if not header.startswith(b"*"):
+                    writer.write(b"-ERR inline commands are not supported\r\n")
+                    continue
+                args = []
+                for _ in range(int(header[1:])):
+                    length = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                writer.write(self.execute(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port):
+    server = await asyncio.start_server(RESPServer().handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Latency profiles for the stand-in backends used by the load test.
+
+Times are in seconds. `first_*` is the delay before the first token or
+audio chunk of a reply/segment, `*_latency` the delay between the ones
+that follow. `jitter` is a fraction of each delay added at random.
+"""
+
+PROFILES = {
+    # as fast as the mocks go: measures ws_server's own overhead
+    "instant": {
+        "first_token": 0.0, "token_latency": 0.0, "tokens": 40,
+        "connect_latency": 0.0, "first_audio": 0.0, "audio_chunk_latency": 0.0,
+        "chunks_per_segment": 8, "jitter": 0.0,
+    },
+    # roughly a hosted LLM and Minimax on a good link
+    "realistic": {
+        "first_token": 0.35, "token_latency": 0.03, "tokens": 40,
+        "connect_latency": 0.15, "first_audio": 0.25, "audio_chunk_latency": 0.04,
+        "chunks_per_segment": 12, "jitter": 0.3,
+    },
+    # overloaded providers
+    "slow": {
+        "first_token": 1.5, "token_latency": 0.08, "tokens": 40,
+        "connect_latency": 0.6, "first_audio": 0.8, "audio_chunk_latency": 0.1,
+        "chunks_per_segment": 12, "jitter": 0.5,
+    },
+}
+
+
+def get_profile(name, **overrides):
+    if name not in PROFILES:
+        raise ValueError(f"Unknown profile: {name} (choose from {', '.join(PROFILES)})")
+    profile = dict(PROFILES[name])
+    profile.update({key: value for key, value in overrides.items() if value is not None})
+    return profile
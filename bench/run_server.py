@@ -0,0 +1,20 @@
+"""Run ws_server with an explicit config file (the load test points it at the stand-in backends).
+
+    python -m bench.run_server /tmp/bench_config.ini
+"""
+
+import sys
+import uvicorn
+import globals
+
+
+def main():
+    globals.config.read(sys.argv[1])
+    import ws_server
+
+    uvicorn.run(ws_server.app, host=globals.config.get("host", "ip"), port=globals.config.getint("host", "port"),
+                log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import socket
+import asyncio
+import threading
+from contextlib import contextmanager
+from bench.mock_redis import RESPServer
+from session_store import RedisSessionStore
+
+
+@contextmanager
+def mock_redis():
+    """A bench.mock_redis server on a free port, in its own thread; yields (url, drop) where drop() cuts every client."""
+    loop = asyncio.new_event_loop()
+    writers = set()
+    resp = RESPServer()
+
+    async def handle(reader, writer):
+        writers.add(writer)
+        try:
+            await resp.handle(reader, writer)
+        finally:
+            writers.discard(writer)
+
+    server = loop.run_until_complete(asyncio.start_server(handle, "127.0.0.1", 0))
+    port = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def drop():
+        async def close_all():
+            for writer in list(writers):
+                writer.transport.abort()
+        asyncio.run_coroutine_threadsafe(close_all(), loop).result()
+
+    try:
+        yield f"redis://127.0.0.1:{port}/0", drop
+    finally:
+        async def shut_down():
+            server.close()
+            for writer in list(writers):
+                writer.transport.abort()
+            await server.wait_closed()
+        asyncio.run_coroutine_threadsafe(shut_down(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def test_round_trip():
+    with mock_redis() as (url, _):
+        store = RedisSessionStore(url, ttl=60)
+        store.save("a", {"messages": ["hi"]})
+        assert store.load("a") == {"messages": ["hi"]}
+        store.delete("a")
+        assert store.load("a") is None
+        store.close()
+
+
+def test_reconnects_after_the_connection_drops():
+    with mock_redis() as (url, drop):
+        store = RedisSessionStore(url)
+        store.save("a", {"n": 1})
+        drop()
+        assert store.load("a") == {"n": 1}
+        drop()
+        store.save("a", {"n": 2})
+        assert store.load("a") == {"n": 2}
+        store.close()
+
+
+def test_raises_when_the_server_is_gone():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    store = RedisSessionStore(f"redis://127.0.0.1:{port}/0")
+    try:
+        store.load("a")
+    except ConnectionError:
+        pass
+    else:
+        raise AssertionError("load should fail without a server")
+
+
+def test_reconnects_after_a_reply_is_cut_off():
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+
+    def serve():
+        # the first connection dies halfway through a bulk reply, the second answers in full
+        for reply in (b'$7\r\n{"n"', b'$7\r\n{"n":1}\r\n'):
+            conn, _ = listener.accept()
+            with conn:
+                conn.recv(1024)
+                conn.sendall(reply)
+                if reply.endswith(b"\r\n"):
+                    conn.recv(1024)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    store = RedisSessionStore(f"redis://127.0.0.1:{port}/0")
+    assert store.load("a") == {"n": 1}
+    store.close()
+    thread.join()
+    listener.close()
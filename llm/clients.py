@@ -0,0 +1,59 @@
+import asyncio
+import httpx
+import globals
+
+# One HTTP connection pool and one concurrency limit per backend, shared by
+# every session in the process, so hundreds of conversations multiplex over a
+# bounded number of sockets instead of one blocked thread each.
+_ollama_client = None
+_openai_client = None
+_limits: dict[str, asyncio.Semaphore] = {}
+
+
+def _max_concurrency():
+    return globals.config.getint("llm", "max_concurrency", fallback=64)
+
+
+def _http_limits():
+    n = _max_concurrency()
+    return httpx.Limits(max_connections=n, max_keepalive_connections=n)
+
+
+def get_ollama_client():
+    global _ollama_client
+    if _ollama_client is None:
+        import ollama
+        _ollama_client = ollama.AsyncClient(
+            host=globals.config.get("llm", "host", fallback=None),
+            limits=_http_limits(),
+            timeout=httpx.Timeout(120.0, connect=10.0),
+        )
+    return _ollama_client
+
+
+def get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = httpx.AsyncClient(
+            limits=_http_limits(),
+            timeout=httpx.Timeout(120.0, connect=10.0),
+        )
+    return _openai_client
+
+
+def backend_limit(backend) -> asyncio.Semaphore:
+    """Cap in-flight requests per backend; callers queue here instead of piling onto the server."""
+    if backend not in _limits:
+        _limits[backend] = asyncio.Semaphore(_max_concurrency())
+    return _limits[backend]
+
+
+async def close_llm_clients():
+    global _ollama_client, _openai_client
+    if _ollama_client is not None:
+        await _ollama_client.close()
+        _ollama_client = None
+    if _openai_client is not None:
+        await _openai_client.aclose()
+        _openai_client = None
+    _limits.clear()
@@ -1,15 +1,121 @@
+import time
+import asyncio
+import globals
+from .memory import ConversationMemory
+
+
 class LLMSession:
     def __init__(self, model_name, system_prompt=""):
+        # stable id the conversation is saved under in the SessionStore, set by the server
+        self.session_id = None
         self.model_name = model_name
         self.system_prompt = system_prompt
+        self.summarize_history = globals.config.get("llm", "history_mode", fallback="evict").lower() == "summarize"
+        self.memory = ConversationMemory(
+            system_prompt,
+            max_tokens=globals.config.getint("llm", "history_max_tokens", fallback=6000),
+            keep_recent=globals.config.getint("llm", "history_keep_recent", fallback=4),
+            trim_ratio=globals.config.getfloat("llm", "history_trim_ratio", fallback=0.6),
+            keep_evicted=self.summarize_history,
+        )
+        self.last_prompt_tokens = 0
+        # backend-reported timings for the last turn, e.g. prompt_eval_count / prompt_eval_duration_ms
+        self.last_stats = {}
+        # turns whose user message has been put in memory, so a caller can tell whether its turn got that far
+        self.turns_begun = 0
+        self._summary_task = None
+
+    @property
+    def messages(self):
+        return self.memory.messages()
 
     def chat(self, user_message):
         pass
 
-def create_llm_session(llm_backend, model_name, system_prompt=""):
+    def to_dict(self):
+        """Serializable conversation state, for a SessionStore."""
+        return {"model": self.model_name, "memory": self.memory.to_dict(), "updated_at": time.time()}
+
+    def load_state(self, state):
+        """Continue a conversation saved with `to_dict`."""
+        self.memory.load_dict(state.get("memory", {}))
+
+    async def complete(self, messages):
+        """One-shot reply to `messages` without touching the session history."""
+        raise NotImplementedError
+
+    @classmethod
+    async def warm_up(cls, model_name, system_prompt=""):
+        """Load the model (and, where supported, prefill the system prompt) before the first session."""
+        pass
+
+    def _begin_turn(self, user_message):
+        """Record the user message, trim history to budget and return the prompt to send."""
+        self.memory.append("user", user_message)
+        self.turns_begun += 1
+        self.memory.trim()
+        self.last_prompt_tokens = self.memory.prompt_tokens
+        return self.memory.messages()
+
+    def _end_turn(self, assistant_reply):
+        self.memory.append("assistant", assistant_reply)
+        if not self.memory.evicted:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if self.summarize_history and loop and not (self._summary_task and not self._summary_task.done()):
+            # summarize off the turn's critical path; the next turn picks up whatever is ready
+            self._summary_task = loop.create_task(self.memory.summarize(self.complete))
+        elif not self.summarize_history:
+            self.memory.drop_evicted()
+
+    def truncate_last_reply(self, spoken_text):
+        """Cut the last assistant reply back to what the user actually heard."""
+        if self.memory.last_role() != "assistant":
+            return
+        if spoken_text:
+            self.memory.replace_last(spoken_text)
+        else:
+            self.memory.pop_last()
+
+    def discard_last_turn(self):
+        """Forget the last exchange, user message included, e.g. a reply started on a transcript that changed."""
+        if self.memory.last_role() == "assistant":
+            self.memory.pop_last()
+        if self.memory.last_role() == "user":
+            self.memory.pop_last()
+
+    async def chat_stream(self, user_message):
+        """Yield the assistant reply as text deltas.
+
+        Backends without native streaming fall back to running `chat` in the
+        default executor and yielding the whole reply at once.
+        """
+        loop = asyncio.get_running_loop()
+        reply = await loop.run_in_executor(None, self.chat, user_message)
+        if reply:
+            yield reply
+
+    async def achat(self, user_message):
+        """Async counterpart of `chat`: the whole reply, without blocking a thread."""
+        reply = ""
+        async for delta in self.chat_stream(user_message):
+            reply += delta
+        return reply
+
+def get_llm_session_class(llm_backend):
     if llm_backend == "ollama":
-        print(f"Create Ollama session with model '{model_name}'")
         from .ollama_session import OllamaSession
-        return OllamaSession(model_name, system_prompt)
+        return OllamaSession
+    elif llm_backend == "openai":
+        from .openai_session import OpenAISession
+        return OpenAISession
     else:
-        raise ValueError(f"Unsupported LLM backend: {llm_backend}")
\ No newline at end of file
+        raise ValueError(f"Unsupported LLM backend: {llm_backend}")
+
+def create_llm_session(llm_backend, model_name, system_prompt=""):
+    session_class = get_llm_session_class(llm_backend)
+    print(f"Create {session_class.__name__} with model '{model_name}'")
+    return session_class(model_name, system_prompt)
@@ -0,0 +1,146 @@
+import logging
+
+logger = logging.getLogger("ws_server.memory")
+
+# per-message framing overhead (role tags, separators) in the chat template
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below in a few sentences so it can replace the original "
+    "messages as context. Keep names, facts and anything the user asked to remember.\n\n"
+)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate: ~4 ASCII chars per token, one token per CJK/other character."""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationMemory:
+    """Bounded chat history for an LLMSession.
+
+    The system prompt is pinned. Every other message carries an incrementally
+    maintained token estimate; once the total goes over `max_tokens`, the
+    oldest turns are evicted (never the last `keep_recent` messages). Evicted
+    turns can be folded into a rolling summary that is sent right after the
+    system prompt, so per-turn prompt size stays flat however long the
+    session runs.
+
+    The prompt is kept prefix-stable so the backend's KV cache can be reused:
+    messages are append-only between trims, a trim goes all the way down to
+    `trim_ratio * max_tokens` so it happens once every few turns rather than
+    every turn, and turns waiting to be summarized stay in the prompt until
+    the summary replaces them in a single step.
+    """
+
+    def __init__(self, system_prompt="", max_tokens=6000, keep_recent=4, trim_ratio=0.6, keep_evicted=False):
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.trim_ratio = trim_ratio
+        self.keep_evicted = keep_evicted
+        self.history: list[dict] = []
+        self.history_tokens: list[int] = []
+        self.summary = ""
+        self.evicted: list[dict] = []
+        self._system_tokens = estimate_tokens(system_prompt) if system_prompt else 0
+        self._summary_tokens = 0
+        self._evicted_tokens = 0
+        self._total = self._system_tokens
+
+    def append(self, role, content):
+        tokens = estimate_tokens(content)
+        self.history.append({"role": role, "content": content})
+        self.history_tokens.append(tokens)
+        self._total += tokens
+
+    def replace_last(self, content):
+        tokens = estimate_tokens(content)
+        self._total += tokens - self.history_tokens[-1]
+        self.history[-1] = {"role": self.history[-1]["role"], "content": content}
+        self.history_tokens[-1] = tokens
+
+    def pop_last(self):
+        self._total -= self.history_tokens.pop()
+        return self.history.pop()
+
+    def last_role(self):
+        return self.history[-1]["role"] if self.history else None
+
+    def set_summary(self, summary):
+        self.summary = summary
+        self._total -= self._summary_tokens
+        self._summary_tokens = estimate_tokens(summary) if summary else 0
+        self._total += self._summary_tokens
+
+    @property
+    def prompt_tokens(self):
+        return self._total + (self._evicted_tokens if self.keep_evicted else 0)
+
+    def messages(self):
+        messages = []
+        if self.system_prompt:
+            messages.append({"role": "system", "content": self.system_prompt})
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        if self.keep_evicted:
+            messages.extend(self.evicted)
+        messages.extend(self.history)
+        return messages
+
+    def trim(self):
+        """Once over `max_tokens`, evict the oldest turns down to the trim target."""
+        if self._total <= self.max_tokens:
+            return
+        target = int(self.max_tokens * self.trim_ratio)
+        while self._total > target and len(self.history) > self.keep_recent:
+            # evict whole user/assistant pairs so the history never starts with an assistant reply
+            self._evict_one()
+            while self.history and self.history[0]["role"] != "user" and len(self.history) > self.keep_recent:
+                self._evict_one()
+
+    def _evict_one(self):
+        tokens = self.history_tokens.pop(0)
+        self._total -= tokens
+        self._evicted_tokens += tokens
+        self.evicted.append(self.history.pop(0))
+
+    def to_dict(self):
+        """History, summary and not-yet-summarized turns; the system prompt comes from config on load."""
+        return {"history": list(self.history), "summary": self.summary, "evicted": list(self.evicted)}
+
+    def load_dict(self, state):
+        """Replace the conversation with one saved by `to_dict`, recomputing token estimates."""
+        self.history, self.history_tokens = [], []
+        self._total = self._system_tokens
+        self._summary_tokens = 0
+        self.summary = ""
+        for message in state.get("history", []):
+            self.append(message["role"], message["content"])
+        self.set_summary(state.get("summary", ""))
+        self.evicted = list(state.get("evicted", [])) if self.keep_evicted else []
+        self._evicted_tokens = sum(estimate_tokens(m["content"]) for m in self.evicted)
+
+    def drop_evicted(self):
+        self.evicted = []
+        self._evicted_tokens = 0
+
+    async def summarize(self, complete):
+        """Fold evicted turns into the rolling summary using `complete(messages) -> str`."""
+        if not self.evicted:
+            return
+        evicted = list(self.evicted)
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in evicted)
+        if self.summary:
+            transcript = f"Earlier summary: {self.summary}\n{transcript}"
+        try:
+            summary = await complete([{"role": "user", "content": SUMMARY_PROMPT + transcript}])
+        except Exception:
+            logger.exception("History summarization failed, evicted turns are dropped")
+            summary = ""
+        # swap the summarized turns for the new summary in one step, so the prompt prefix changes once
+        del self.evicted[:len(evicted)]
+        self._evicted_tokens = sum(estimate_tokens(m["content"]) for m in self.evicted)
+        if summary:
+            self.set_summary(summary.strip())
@@ -1,30 +1,109 @@
 from .llm_session import LLMSession
+from .clients import backend_limit, get_ollama_client
+import asyncio
+import logging
 import ollama
+import globals
 
-class OllamaSession(LLMSession):
-    def __init__(self, model_name, system_prompt=""):
-        super().__init__(model_name, system_prompt)
-        self.messages = []
-        if system_prompt:
-            self.messages.append({"role": "system", "content": system_prompt})
+logger = logging.getLogger("ws_server.ollama")
+
+# kept constant for the life of the process: changing num_ctx forces a model reload
+OLLAMA_OPTIONS = {
+    "num_ctx": 8192,
+    "temperature": 0.7,
+}
+
+
+def get_keep_alive():
+    """How long Ollama keeps the model (and its KV cache) loaded after a request."""
+    return globals.config.get("llm", "keep_alive", fallback="30m")
+
+
+def response_stats(response):
+    """Prompt-eval figures from the final chunk; a small prompt_eval_count after turn one means a KV cache hit."""
+    return {
+        "prompt_eval_count": response.get("prompt_eval_count"),
+        "prompt_eval_duration_ms": (response.get("prompt_eval_duration") or 0) / 1e6,
+        "eval_count": response.get("eval_count"),
+        "eval_duration_ms": (response.get("eval_duration") or 0) / 1e6,
+        "load_duration_ms": (response.get("load_duration") or 0) / 1e6,
+    }
 
+class OllamaSession(LLMSession):
     def chat(self, user_message):
-        self.messages.append({"role": "user", "content": user_message})
+        messages = self._begin_turn(user_message)
 
         stream = ollama.chat(
             model=self.model_name,
-            messages=self.messages,
+            messages=messages,
             stream=True,
-            options={
-                "num_ctx": 8192,
-                "temperature": 0.7,
-            }
+            options=OLLAMA_OPTIONS,
+            keep_alive=get_keep_alive(),
         )
 
         assistant_reply = ""
         for chunk in stream:
             content = chunk["message"]["content"]
             assistant_reply += content
+            if chunk.get("done"):
+                self.last_stats = response_stats(chunk)
+
+        self._end_turn(assistant_reply)
+        return assistant_reply
+
+    async def complete(self, messages):
+        async with backend_limit("ollama"):
+            response = await get_ollama_client().chat(
+                model=self.model_name,
+                messages=messages,
+                options=OLLAMA_OPTIONS,
+                keep_alive=get_keep_alive(),
+            )
+        return response["message"]["content"]
 
-        self.messages.append({"role": "assistant", "content": assistant_reply})
-        return assistant_reply
\ No newline at end of file
+    @classmethod
+    async def warm_up(cls, model_name, system_prompt=""):
+        """Load the model and prefill the system prompt, so the first real turn only evaluates its own tokens."""
+        messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        async with backend_limit("ollama"):
+            response = await get_ollama_client().chat(
+                model=model_name,
+                messages=messages,
+                options={**OLLAMA_OPTIONS, "num_predict": 1},
+                keep_alive=get_keep_alive(),
+            )
+        stats = response_stats(response)
+        logger.info("Ollama model warmed up: model=%s stats=%s", model_name, stats)
+        return stats
+
+    async def chat_stream(self, user_message):
+        """Yield token deltas from the shared ollama.AsyncClient."""
+        messages = self._begin_turn(user_message)
+
+        # record the reply even if the consumer stops early, so a cancelled turn can be truncated
+        assistant_reply = ""
+        try:
+            async with backend_limit("ollama"):
+                stream = await get_ollama_client().chat(
+                    model=self.model_name,
+                    messages=messages,
+                    stream=True,
+                    options=OLLAMA_OPTIONS,
+                    keep_alive=get_keep_alive(),
+                )
+                async for chunk in stream:
+                    content = chunk["message"]["content"]
+                    if content:
+                        assistant_reply += content
+                        yield content
+                    if chunk.get("done"):
+                        self.last_stats = response_stats(chunk)
+        except (GeneratorExit, asyncio.CancelledError):
+            # the consumer stopped early: keep what was said, so the turn can be truncated to what was heard
+            self._end_turn(assistant_reply)
+            raise
+        except BaseException:
+            # a failed turn leaves nothing behind for later prompts to carry
+            self.discard_last_turn()
+            raise
+        self._end_turn(assistant_reply)
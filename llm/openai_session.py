@@ -0,0 +1,81 @@
+import os
+import json
+import asyncio
+import httpx
+import globals
+from .llm_session import LLMSession
+from .clients import backend_limit, get_openai_client
+
+
+class OpenAISession(LLMSession):
+    """Chat session against any OpenAI-compatible /chat/completions endpoint (vLLM, llama.cpp, LM Studio, ...)."""
+
+    def __init__(self, model_name, system_prompt=""):
+        super().__init__(model_name, system_prompt)
+        self.api_base = globals.config.get("llm", "api_base", fallback="http://127.0.0.1:8000/v1").rstrip("/")
+        self.api_key = os.getenv("OPENAI_API_KEY", "")
+
+    def _headers(self):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def _payload(self, messages, stream):
+        return {
+            "model": self.model_name,
+            "messages": messages,
+            "temperature": 0.7,
+            "stream": stream,
+        }
+
+    def chat(self, user_message):
+        messages = self._begin_turn(user_message)
+        response = httpx.post(f"{self.api_base}/chat/completions", headers=self._headers(),
+                              json=self._payload(messages, False), timeout=120.0)
+        response.raise_for_status()
+        assistant_reply = response.json()["choices"][0]["message"]["content"] or ""
+        self._end_turn(assistant_reply)
+        return assistant_reply
+
+    async def complete(self, messages):
+        async with backend_limit("openai"):
+            response = await get_openai_client().post(
+                f"{self.api_base}/chat/completions", headers=self._headers(),
+                json=self._payload(messages, False),
+            )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"] or ""
+
+    async def chat_stream(self, user_message):
+        """Yield token deltas from the server-sent event stream."""
+        messages = self._begin_turn(user_message)
+
+        assistant_reply = ""
+        try:
+            async with backend_limit("openai"):
+                async with get_openai_client().stream(
+                    "POST", f"{self.api_base}/chat/completions",
+                    headers=self._headers(), json=self._payload(messages, True),
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        choices = json.loads(data).get("choices") or [{}]
+                        content = choices[0].get("delta", {}).get("content")
+                        if content:
+                            assistant_reply += content
+                            yield content
+        except (GeneratorExit, asyncio.CancelledError):
+            # the consumer stopped early: keep what was said, so the turn can be truncated to what was heard
+            self._end_turn(assistant_reply)
+            raise
+        except BaseException:
+            # a failed turn leaves nothing behind for later prompts to carry
+            self.discard_last_turn()
+            raise
+        self._end_turn(assistant_reply)
@@ -0,0 +1,63 @@
+SENTENCE_ENDINGS = "。！？!?;；\n"
+ASCII_SENTENCE_ENDINGS = ".!?;"
+CLAUSE_BREAKS = ",，、:："
+CLOSING_CHARS = "\"'”’)）]」』"
+
+
+class SentenceSegmenter:
+    """Cut a stream of LLM token deltas into speakable segments.
+
+    Segments end at sentence punctuation. Clause punctuation (commas, colons)
+    also ends a segment once it is at least `min_clause_chars` long, so the
+    first audio can start before a long sentence is finished. ASCII sentence
+    punctuation only counts when followed by whitespace (after any closing
+    quotes or brackets), so "3.5" or "U.S." mid-word is not split.
+    """
+
+    def __init__(self, min_clause_chars=12, max_chars=200):
+        self.min_clause_chars = min_clause_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+
+    def feed(self, delta):
+        self.buffer += delta
+        segments = []
+        start = 0
+        i = 0
+        while i < len(self.buffer):
+            ch = self.buffer[i]
+            cut = False
+            if ch in SENTENCE_ENDINGS and ch not in ASCII_SENTENCE_ENDINGS:
+                cut = True
+            elif ch in ASCII_SENTENCE_ENDINGS:
+                # a closing quote or bracket still belongs to the sentence; the char after it tells whether it ends
+                after = i + 1
+                while after < len(self.buffer) and self.buffer[after] in CLOSING_CHARS:
+                    after += 1
+                if after >= len(self.buffer):
+                    break
+                cut = self.buffer[after].isspace()
+            elif ch in CLAUSE_BREAKS:
+                cut = i + 1 - start >= self.min_clause_chars
+            elif i + 1 - start >= self.max_chars and ch.isspace():
+                cut = True
+
+            if cut:
+                end = i + 1
+                while end < len(self.buffer) and self.buffer[end] in CLOSING_CHARS:
+                    end += 1
+                segment = self.buffer[start:end].strip()
+                if segment:
+                    segments.append(segment)
+                start = end
+                i = end
+            else:
+                i += 1
+
+        self.buffer = self.buffer[start:]
+        return segments
+
+    def flush(self):
+        segment = self.buffer.strip()
+        self.buffer = ""
+        return [segment] if segment else []
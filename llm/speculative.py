@@ -0,0 +1,68 @@
+import re
+import asyncio
+from contextlib import aclosing
+from .llm_session import LLMSession
+
+
+def normalize_transcript(text):
+    """Lowercased words only, so punctuation and spacing differences between transcripts do not count."""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+class SpeculativeReply:
+    """A reply started on a transcript taken at a pause, before the user is known to be done.
+
+    Deltas are buffered until the turn is committed with the final
+    transcript (`stream` then yields them, then the rest as it arrives). If
+    the final transcript says something else the reply is discarded and the
+    exchange removed from the session history, as if it had never been asked.
+    """
+
+    def __init__(self, session: LLMSession, user_message):
+        self.session = session
+        self.user_message = user_message
+        self._deltas: asyncio.Queue = asyncio.Queue()
+        self._turns_before = session.turns_begun
+        # a failed chat_stream has already taken its turn back out of the history
+        self._undone = False
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            async with aclosing(self.session.chat_stream(self.user_message)) as stream:
+                async for delta in stream:
+                    self._deltas.put_nowait(delta)
+        except Exception as e:
+            self._undone = True
+            self._deltas.put_nowait(e)
+        finally:
+            self._deltas.put_nowait(None)
+
+    def matches(self, transcript):
+        return normalize_transcript(transcript) == normalize_transcript(self.user_message)
+
+    async def stream(self):
+        """Yield the reply as text deltas, like `LLMSession.chat_stream`; closing it early stops the LLM."""
+        try:
+            while True:
+                delta = await self._deltas.get()
+                if delta is None:
+                    return
+                if isinstance(delta, Exception):
+                    raise delta
+                yield delta
+        finally:
+            if not self._task.done():
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+
+    def _began(self):
+        """Whether the reply got as far as putting its user message in the session history."""
+        return self.session.turns_begun != self._turns_before and not self._undone
+
+    async def discard(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        # cancelled before the turn began: the last exchange in memory is an earlier, real one
+        if self._began():
+            self.session.discard_last_turn()
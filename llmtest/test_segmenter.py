@@ -0,0 +1,33 @@
+from llm.segmenter import SentenceSegmenter
+
+
+def feed_all(deltas):
+    segmenter = SentenceSegmenter()
+    segments = []
+    for delta in deltas:
+        segments += segmenter.feed(delta)
+    return segments, segmenter.flush()
+
+
+def test_cuts_after_closing_quote():
+    segments, rest = feed_all(['He said "Mamba out."', ' What', ' can I say?'])
+    assert segments == ['He said "Mamba out."']
+    assert rest == ["What can I say?"]
+
+
+def test_cuts_after_closing_bracket():
+    segments, rest = feed_all(["Who won (the 2010 final?)", " Lakers."])
+    assert segments == ["Who won (the 2010 final?)"]
+    assert rest == ["Lakers."]
+
+
+def test_waits_for_the_char_after_closing_chars():
+    segmenter = SentenceSegmenter()
+    assert segmenter.feed('"Mamba out."') == []
+    assert segmenter.feed(" Next") == ['"Mamba out."']
+
+
+def test_does_not_cut_inside_numbers():
+    segments, rest = feed_all(["Version 3", ".5 is out.", " Go"])
+    assert segments == ["Version 3.5 is out."]
+    assert rest == ["Go"]
@@ -0,0 +1,228 @@
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+import globals
+
+LOG_BODY_MODES = ("full", "truncate", "redact")
+LOG_FORMATS = ("text", "json")
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+# standard LogRecord attributes; anything else on a record came from `extra`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class LogBody:
+    """User or model text in a log call, shown per [log] bodies when the record is formatted.
+
+    Formatting happens on the listener thread, so truncating or redacting a
+    long reply costs the event loop nothing.
+    """
+
+    __slots__ = ("text",)
+    mode = "full"
+    max_chars = 200
+
+    def __init__(self, text):
+        self.text = text
+
+    def __str__(self):
+        text = "" if self.text is None else str(self.text)
+        if self.mode == "redact":
+            return f"<{len(text)} chars>"
+        if self.mode == "truncate" and len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}... <{len(text)} chars>"
+        return text
+
+    def __repr__(self):
+        return repr(str(self))
+
+
+def _json_default(value):
+    return str(value)
+
+
+class TextFormatter(logging.Formatter):
+    """The usual one-line format, with structured `fields` appended as JSON."""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line = f"{line} {json.dumps(fields, ensure_ascii=False, default=_json_default)}"
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, `extra` values and any traceback."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=_json_default)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fixed fraction of records per level, e.g. 1 in 100 per-chunk DEBUG events.
+
+    Sampling is by count rather than at random, so a steady event stream
+    keeps an even spread.
+    """
+
+    def __init__(self, rates: dict[int, float]):
+        super().__init__()
+        self.rates = rates
+        self._counts: dict[int, int] = {}
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        if rate is None or rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        count = self._counts.get(record.levelno, 0) + 1
+        self._counts[record.levelno] = count
+        # true once every 1/rate records
+        return int(count * rate) != int((count - 1) * rate)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hand records to the listener thread without formatting them on the caller's thread.
+
+    The stock QueueHandler copies each record and merges args into the
+    message before enqueueing; here the record is queued as it is, with
+    only tracebacks rendered up front (they reference live frames), so
+    callers must not mutate what they pass as args afterwards. It must be
+    the logger's only handler. A full queue drops the record and counts it
+    rather than blocking the loop.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._exc_formatter = logging.Formatter()
+
+    def handle(self, record):
+        # the queue does its own locking; skip the handler lock
+        if self.filter(record):
+            self.emit(record)
+            return True
+        return False
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # the handler drops records on a full queue, but the stop marker has to get in
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    def __init__(self, handler: NonBlockingQueueHandler, listener: logging.handlers.QueueListener):
+        self.handler = handler
+        self.listener = listener
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def get_stats(self):
+        return {"queued": self.handler.queue.qsize(), "dropped": self.handler.dropped}
+
+    def stop(self):
+        """Flush what is queued and stop the listener thread."""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+
+def log_file_path():
+    path = globals.config.get("log", "file", fallback="log/ws_server.log")
+    # several workers rotating one file would clobber each other's output
+    if globals.config.getint("host", "workers", fallback=1) > 1:
+        root, ext = os.path.splitext(path)
+        path = f"{root}.{os.getpid()}{ext}"
+    return path
+
+
+def setup_logging(logger: logging.Logger) -> LogPipeline:
+    """Route `logger` (and its children) through a queue to file and console handlers on a listener thread.
+
+    Settings come from the [log] config section.
+    """
+    level = globals.config.get("log", "level", fallback="INFO").upper()
+    LogBody.mode = globals.config.get("log", "bodies", fallback="full").lower()
+    if LogBody.mode not in LOG_BODY_MODES:
+        raise ValueError(f"Unsupported [log] bodies: {LogBody.mode} (choose from {', '.join(LOG_BODY_MODES)})")
+    LogBody.max_chars = globals.config.getint("log", "body_max_chars", fallback=200)
+
+    log_format = globals.config.get("log", "format", fallback="text").lower()
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unsupported [log] format: {log_format} (choose from {', '.join(LOG_FORMATS)})")
+    formatter = JsonFormatter() if log_format == "json" else TextFormatter(TEXT_FORMAT)
+
+    path = log_file_path()
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, encoding="utf-8",
+        maxBytes=globals.config.getint("log", "max_mb", fallback=50) * 1024 * 1024,
+        backupCount=globals.config.getint("log", "backup_count", fallback=5),
+    )
+    handlers = [file_handler]
+    if globals.config.getboolean("log", "console", fallback=True):
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(globals.config.getint("log", "queue_size", fallback=10000)))
+    rates = {}
+    for name in ("debug", "info"):
+        if globals.config.has_option("log", f"sample_{name}"):
+            rates[logging.getLevelName(name.upper())] = globals.config.getfloat("log", f"sample_{name}")
+    if rates:
+        queue_handler.addFilter(SamplingFilter(rates))
+
+    # none of our formats show caller, thread or process, so skip collecting them per record
+    # (see "Optimization" in the logging HOWTO)
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    logger.setLevel(level)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    listener = DrainingQueueListener(queue_handler.queue, *handlers)
+    listener.start()
+    pipeline = LogPipeline(queue_handler, listener)
+    atexit.register(pipeline.stop)
+    return pipeline
@@ -0,0 +1,172 @@
+import time
+import threading
+
+# seconds; spans of a voice turn range from a few ms (pooled TTS checkout) to several seconds (full reply)
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0)
+
+# points in a chat turn, in the order they normally happen
+TURN_SPANS = (
+    "receive",
+    "llm_first_token",
+    "tts_connect",
+    "tts_task_started",
+    "provider_first_byte",
+    "client_first_chunk",
+    "llm_complete",
+    "client_last_chunk",
+)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    # flags such as "loaded" are bools; Prometheus only takes numbers
+    return int(value) if isinstance(value, bool) else value
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """A value read at scrape time from `collect() -> {labels tuple: value}`."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, collect, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.collect = collect
+
+    def _samples(self):
+        samples = []
+        for label_values, value in self.collect().items():
+            labels = tuple(zip(self.labelnames, label_values))
+            samples.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return samples
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # per-bucket counts, then +Inf count and sum
+                series = self._series[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def _samples(self):
+        samples = []
+        for key, series in self._series.items():
+            for bound, count in zip(self.buckets, series):
+                samples.append(f"{self.name}_bucket{_format_labels(key + (('le', repr(float(bound))),))} {count}")
+            samples.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {series[-2]}")
+            samples.append(f"{self.name}_count{_format_labels(key)} {series[-2]}")
+            samples.append(f"{self.name}_sum{_format_labels(key)} {series[-1]}")
+        return samples
+
+
+class MetricsRegistry:
+    """Process-wide metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def _register(self, metric):
+        self.metrics.setdefault(metric.name, metric)
+        return self.metrics[metric.name]
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, collect, labelnames=()):
+        return self._register(Gauge(name, help_text, collect, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+turn_span_seconds = metrics.histogram(
+    "kobe_turn_span_seconds", "Time from receiving a chat message to each point of the turn", ("span",))
+turns_total = metrics.counter("kobe_turns_total", "Chat turns by outcome", ("outcome",))
+speculative_replies_total = metrics.counter(
+    "kobe_speculative_replies_total", "LLM replies started on the transcript taken at a pause in speech, by outcome", ("outcome",))
+
+
+class TurnTimer:
+    """Timestamps of one chat turn's spans, relative to when the message was received."""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.marks = {"receive": self.start}
+
+    def mark(self, span, at=None):
+        """Record `span` the first time it happens; later calls are ignored."""
+        if span not in self.marks:
+            self.marks[span] = at if at is not None else time.monotonic()
+
+    def update(self, span):
+        """Record `span`, overwriting an earlier mark (for "last ..." spans)."""
+        self.marks[span] = time.monotonic()
+
+    def to_dict(self):
+        return {span: round((self.marks[span] - self.start) * 1000, 1) for span in TURN_SPANS if span in self.marks}
+
+    def observe(self):
+        for span in TURN_SPANS:
+            if span in self.marks and span != "receive":
+                turn_span_seconds.observe(self.marks[span] - self.start, span=span)
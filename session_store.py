@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from urllib.parse import urlparse
+import globals
+
+logger = logging.getLogger("ws_server.sessions")
+
+SESSION_STORES = ("memory", "sqlite", "redis")
+
+
+class SessionStore:
+    """Serialized conversation state keyed by a stable session id.
+
+    Values are the JSON-able dicts from `LLMSession.to_dict`. Calls block
+    (SQLite, sockets), so async code runs them with `asyncio.to_thread`;
+    implementations are thread-safe. Sessions not saved for `ttl` seconds
+    are forgotten (0 keeps them forever).
+    """
+
+    name = ""
+    # whether every server process sees the same sessions
+    shared = True
+
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+
+    def load(self, session_id) -> dict | None:
+        raise NotImplementedError
+
+    def save(self, session_id, state: dict):
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local dict: sessions survive reconnects but not a restart, and are not shared between workers."""
+
+    name = "memory"
+    shared = False
+
+    def __init__(self, ttl=0):
+        super().__init__(ttl)
+        self._sessions: dict[str, tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry and self.ttl and time.time() - entry[0] > self.ttl:
+                del self._sessions[session_id]
+                entry = None
+        return json.loads(entry[1]) if entry else None
+
+    def save(self, session_id, state):
+        data = json.dumps(state, ensure_ascii=False)
+        with self._lock:
+            self._sessions[session_id] = (time.time(), data)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """One SQLite file shared by every worker on the host.
+
+    WAL mode lets workers read while another one writes; writes from this
+    process are serialized on a single connection.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, ttl=0):
+        super().__init__(ttl)
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)")
+        self.purge_expired()
+
+    def purge_expired(self):
+        if self.ttl:
+            with self._lock:
+                self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl,))
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._db.execute("SELECT data, updated_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if not row or (self.ttl and time.time() - row[1] > self.ttl):
+            return None
+        return json.loads(row[0])
+
+    def save(self, session_id, state):
+        data = json.dumps(state, ensure_ascii=False)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO sessions (id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (session_id, data, time.time()),
+            )
+
+    def delete(self, session_id):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class RESPError(Exception):
+    pass
+
+
+class RESPConnection:
+    """Minimal blocking RESP2 client: enough of the Redis protocol for GET / SET / DEL.
+
+    Speaks to Redis, Valkey, KeyDB or the offline stand-in in bench.mock_redis.
+    """
+
+    def __init__(self, url, timeout=5.0):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported session store url: {url}")
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", self.db)
+
+    def close(self):
+        if self._sock:
+            self._file.close()
+            self._sock.close()
+        self._sock = self._file = None
+
+    @staticmethod
+    def _encode(args):
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    def _read_reply(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Session store closed the connection")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RESPError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            if len(data) < length + 2:
+                # cut off mid-reply; the next command must not read the rest of this one
+                raise ConnectionError("Session store closed the connection")
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise RESPError(f"Unexpected reply: {line!r}")
+
+    def _call(self, *args):
+        self._sock.sendall(self._encode(args))
+        return self._read_reply()
+
+    def call(self, *args):
+        """Send one command and return its reply, reconnecting once if the connection went away.
+
+        The commands used here (GET / SET / DEL) are idempotent, so one that
+        may or may not have reached the server is simply sent again.
+        """
+        for attempt in range(2):
+            try:
+                if self._sock is None:
+                    self._connect()
+                return self._call(*args)
+            except (ConnectionError, OSError):
+                self.close()
+                if attempt:
+                    raise
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions in a Redis-protocol server, shared by every worker and host pointed at it.
+
+    Expiry is left to the server (SET ... EX ttl).
+    """
+
+    name = "redis"
+
+    def __init__(self, url, ttl=0, prefix="kobe:session:"):
+        super().__init__(ttl)
+        self.url = url
+        self.prefix = prefix
+        self._conn = RESPConnection(url)
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            data = self._conn.call("GET", self.prefix + session_id)
+        return json.loads(data) if data is not None else None
+
+    def save(self, session_id, state):
+        args = ["SET", self.prefix + session_id, json.dumps(state, ensure_ascii=False).encode()]
+        if self.ttl:
+            args += ["EX", self.ttl]
+        with self._lock:
+            self._conn.call(*args)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.call("DEL", self.prefix + session_id)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_session_store() -> SessionStore:
+    """Build the store selected by [session] store."""
+    store = globals.config.get("session", "store", fallback="memory").lower()
+    ttl = globals.config.getint("session", "ttl", fallback=0)
+    if store == "memory":
+        return MemorySessionStore(ttl)
+    if store == "sqlite":
+        return SQLiteSessionStore(globals.config.get("session", "sqlite_path", fallback="cache/sessions.sqlite3"), ttl)
+    if store == "redis":
+        return RedisSessionStore(globals.config.get("session", "redis_url", fallback="redis://127.0.0.1:6379/0"), ttl)
+    raise ValueError(f"Unsupported session store: {store} (choose from {', '.join(SESSION_STORES)})")
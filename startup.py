@@ -0,0 +1,101 @@
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger("ws_server.startup")
+
+PENDING = "pending"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+# a required component that fails is retried after this many seconds, doubling up to the cap
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+
+class WarmupComponent:
+    def __init__(self, name, warm_up, required=True):
+        self.name = name
+        self.warm_up = warm_up
+        self.required = required
+        self.state = PENDING
+        self.attempts = 0
+        self.error = None
+        self.started_at = None
+        self.duration = None
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "required": self.required,
+            "attempts": self.attempts,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "error": self.error,
+        }
+
+
+class WarmupRegistry:
+    """Background warm-up of the server's backends, run concurrently at startup.
+
+    Each component registers an async callable; `start` launches them all
+    at once without blocking the server from accepting connections. The
+    server counts as ready once every required component has warmed up,
+    so an orchestrator routing on /readyz only sends traffic when the
+    first turn no longer pays for model loads or handshakes. A required
+    component that fails (a model still loading, a dropped handshake) is
+    retried with capped backoff until it succeeds, so one transient error
+    at boot does not keep the server unready for good.
+    """
+
+    def __init__(self):
+        self.components: dict[str, WarmupComponent] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.started_at = None
+
+    def register(self, name, warm_up, required=True):
+        self.components[name] = WarmupComponent(name, warm_up, required)
+
+    async def _attempt(self, component: WarmupComponent):
+        component.state = WARMING
+        component.attempts += 1
+        try:
+            await component.warm_up()
+            component.state = READY
+            component.error = None
+        except Exception as e:
+            component.state = FAILED
+            component.error = str(e) or type(e).__name__
+            logger.exception("Warm-up failed: %s (attempt %d)", component.name, component.attempts)
+        component.duration = time.monotonic() - component.started_at
+        logger.info("Warm-up %s: %s in %.0f ms", component.name, component.state, component.duration * 1000)
+
+    async def _run(self, component: WarmupComponent):
+        component.started_at = time.monotonic()
+        delay = RETRY_DELAY
+        await self._attempt(component)
+        while component.state == FAILED and component.required:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+            await self._attempt(component)
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for component in self.components.values():
+            task = asyncio.create_task(self._run(component))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def is_ready(self):
+        return all(c.state == READY for c in self.components.values() if c.required)
+
+    def to_dict(self):
+        return {
+            "ready": self.is_ready(),
+            "uptime_s": round(time.monotonic() - self.started_at, 1) if self.started_at else None,
+            "components": {name: c.to_dict() for name, c in self.components.items()},
+        }
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
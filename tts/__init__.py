@@ -1,15 +1,24 @@
-
-def get_tts_module(name):
-    if name == "qwen3":
-        from .qwen3_tts_module import Qwen3TTS
-        return Qwen3TTS()
+def get_streaming_tts(name):
+    """Async streaming backend for ws_server, or None when TTS is disabled or has no credentials."""
+    if name == "minimax":
+        from .minimax_ws import MinimaxStreamingTTS
+        backend_class = MinimaxStreamingTTS
+    elif name == "minimax_http":
+        from .mninimax_tts_module import MinimaxHTTPStreamingTTS
+        backend_class = MinimaxHTTPStreamingTTS
     elif name == "glm":
-        from .glm_tts_module import GlmTTS
-        return GlmTTS()
-    elif name == "minimax":
-        from .mninimax_tts_module import MinimaxTTS
-        return MinimaxTTS()
+        from .glm_tts_module import GlmStreamingTTS
+        backend_class = GlmStreamingTTS
+    elif name == "qwen3":
+        from .qwen3_tts_module import Qwen3StreamingTTS
+        backend_class = Qwen3StreamingTTS
     elif name == "none":
         return None
     else:
         raise ValueError(f"Unsupported TTS module: {name}")
+    backend = backend_class.from_config()
+    if backend is None:
+        print(f"{backend_class.__name__} disabled: API key not set")
+    else:
+        print(f"Create {backend_class.__name__} with model {backend.model}")
+    return backend
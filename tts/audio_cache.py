@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import globals
+
+logger = logging.getLogger("ws_server.audio_cache")
+
+# cached audio is replayed to the client in chunks of this size, like live provider chunks
+REPLAY_CHUNK_SIZE = 8192
+
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(text, voice_id, model, audio_setting):
+    payload = json.dumps([normalize_text(text), voice_id, model, audio_setting], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Content-addressed store of synthesized audio.
+
+    Entries are the provider's raw bytes for one segment, keyed by
+    `cache_key`. A small in-memory LRU sits in front of an on-disk tier; each
+    tier evicts least recently used entries once over its byte budget.
+    """
+
+    def __init__(self, directory, memory_max_bytes=32 * 1024 * 1024, disk_max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_lock = threading.Lock()
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_bytes = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._load_disk_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".bin"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["memory_bytes"] = self._memory_bytes
+        stats["disk_bytes"] = self._disk_bytes
+        stats["entries"] = len(self._disk)
+        return stats
+
+    def _remember(self, key, data):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _read_disk(self, key):
+        with self._disk_lock:
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+            return data
+        except OSError:
+            with self._disk_lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+
+    def _write_disk(self, key, data):
+        tmp_path = self._path(key) + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            logger.exception("Audio cache write failed")
+            return
+        with self._disk_lock:
+            self._disk_bytes += len(data) - self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            while self._disk_bytes > self.disk_max_bytes and self._disk:
+                evicted_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self.stats["evictions"] += 1
+                try:
+                    os.remove(self._path(evicted_key))
+                except OSError:
+                    pass
+
+    def get(self, key):
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return data
+        data = self._read_disk(key)
+        if data is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["disk_hits"] += 1
+        self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        if not data:
+            return
+        self.stats["stores"] += 1
+        self._remember(key, data)
+        self._write_disk(key, data)
+
+    async def aget(self, key):
+        """Like `get`, but a disk read runs in a worker thread instead of on the event loop."""
+        if key in self._memory:
+            return self.get(key)
+        data = await asyncio.to_thread(self._read_disk, key)
+        if data is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["disk_hits"] += 1
+        self._remember(key, data)
+        return data
+
+    def put_nowait(self, key, data):
+        """Like `put`, but the disk write is handed to a worker thread and not awaited."""
+        if not data:
+            return
+        self.stats["stores"] += 1
+        self._remember(key, data)
+        asyncio.get_running_loop().run_in_executor(None, self._write_disk, key, data)
+
+
+audio_cache: AudioCache | None = None
+
+
+def get_audio_cache():
+    """Process-wide cache configured from [tts], or None when caching is disabled."""
+    global audio_cache
+    if audio_cache is None and globals.config.getboolean("tts", "cache_enabled", fallback=False):
+        audio_cache = AudioCache(
+            globals.config.get("tts", "cache_dir", fallback="cache/tts"),
+            memory_max_bytes=globals.config.getint("tts", "cache_memory_mb", fallback=32) * 1024 * 1024,
+            disk_max_bytes=globals.config.getint("tts", "cache_disk_mb", fallback=512) * 1024 * 1024,
+        )
+    return audio_cache
+
+
+def is_cacheable(text):
+    # long sentences rarely repeat; only short lines (greetings, catchphrases, apologies) are worth storing
+    return 0 < len(normalize_text(text)) <= globals.config.getint("tts", "cache_max_chars", fallback=120)
+
+
+def load_cache_phrases():
+    path = globals.config.get("tts", "cache_phrases", fallback="")
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
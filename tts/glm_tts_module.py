@@ -1,21 +1,57 @@
 # https://docs.bigmodel.cn/cn/guide/models/sound-and-video/glm-tts#python
 
-from zai import ZhipuAiClient
 import os
+import base64
+import globals
+from .streaming import AudioChunk, HTTPStreamingTTS, iter_sse_json
 
-class GlmTTS:
-    def __init__(self):
-        api_key = os.getenv("ZHIPUAI_API_KEY", "")
-        self.client = ZhipuAiClient(api_key=api_key)
-
-    def generate_voice_clone(self, text, output_path):
-        response = self.client.audio.speech(
-            model="glm-tts",
-            input=text,
-            voice="female",
-            response_format="wav",
-            speed=1.0,
-            volume=1.0
-        )
-        response.stream_to_file(output_path)
-        print(f"generate_voice_clone file save to {output_path}")
+GLM_TTS_URL = "https://open.bigmodel.cn/api/paas/v4/audio/speech"
+GLM_TTS_MODEL = "glm-tts"
+# streamed GLM audio is always 24 kHz mono s16le
+GLM_SAMPLE_RATE = 24000
+
+class GlmStreamingTTS(HTTPStreamingTTS):
+    """GLM-TTS with `stream: true`: base64 PCM arrives as server-sent events per segment."""
+
+    name = "glm"
+    model = GLM_TTS_MODEL
+    provider_formats = ("pcm",)
+    provider_sample_rates = (GLM_SAMPLE_RATE,)
+    provider_channels = (1,)
+    transcode_format = "pcm"
+
+    def __init__(self, api_key, url=GLM_TTS_URL):
+        super().__init__()
+        self.api_key = api_key
+        self.url = url
+
+    @classmethod
+    def from_config(cls):
+        api_key = os.getenv("ZHIPUAI_API_KEY")
+        if not api_key:
+            return None
+        return cls(api_key)
+
+    def default_voice(self):
+        return globals.config.get("tts", "glm_voice", fallback="female")
+
+    async def stream_segment(self, voice_id, plan, text):
+        payload = {
+            "model": self.model,
+            "input": text,
+            "voice": voice_id,
+            "response_format": "pcm",
+            "encode_format": "base64",
+            "stream": True,
+            "speed": 1.0,
+            "volume": 1.0,
+        }
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        async with self.post_stream(self.url, headers, payload) as response:
+            async for event in iter_sse_json(response):
+                if event.get("error"):
+                    raise RuntimeError(f"GLM TTS failed: {event['error']}")
+                for choice in event.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        yield AudioChunk(base64.b64decode(content), "pcm", GLM_SAMPLE_RATE, 1)
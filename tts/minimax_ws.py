@@ -0,0 +1,456 @@
+# https://platform.minimax.io/docs/api-reference/speech-t2a-websocket
+
+import os
+import re
+import ssl
+import json
+import time
+import binascii
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+import websockets
+from websockets.protocol import State
+import globals
+from audio.formats import MINIMAX_CHANNELS, MINIMAX_FORMATS, MINIMAX_SAMPLE_RATES
+from .streaming import AudioChunk, StreamingTTS, TTSStream
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+MINIMAX_WS_URL = "wss://api.minimax.io/ws/v1/t2a_v2"
+TTS_MODEL = "speech-2.8-hd"
+MINIMAX_TTS_FILE_FORMAT = "mp3"
+
+logger = logging.getLogger("ws_server.tts_pool")
+
+# start of the hex audio in a response, found in the raw frame without parsing it
+AUDIO_FIELD = re.compile(rb'"audio"\s*:\s*"')
+
+
+def default_audio_setting():
+    return {
+        "sample_rate": 32000,
+        "bitrate": 128000,
+        "format": MINIMAX_TTS_FILE_FORMAT,
+        "channel": 1
+    }
+
+
+async def establish_minimax_connection(api_key, url=MINIMAX_WS_URL):
+    """Establish WebSocket connection to Minimax TTS API"""
+    headers = {"Authorization": f"Bearer {api_key}"}
+
+    ssl_context = None
+    if url.startswith("wss://"):
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+
+    ws = await websockets.connect(url, additional_headers=headers, ssl=ssl_context)
+    connected = json.loads(await ws.recv())
+    if connected.get("event") == "connected_success":
+        logger.info("Minimax TTS connected")
+        return ws
+    await ws.close()
+    return None
+
+
+async def start_tts_task(tts_ws, voice_id, audio_setting=None):
+    """Send task_start to Minimax TTS"""
+    start_msg = {
+        "event": "task_start",
+        "model": TTS_MODEL,
+        "voice_setting": {
+            "voice_id": voice_id,
+            "speed": 1,
+            "vol": 1,
+            "pitch": 0,
+            "english_normalization": False
+        },
+        "audio_setting": audio_setting or default_audio_setting()
+    }
+    await tts_ws.send(json.dumps(start_msg))
+    response = json.loads(await tts_ws.recv())
+    return response.get("event") == "task_started"
+
+
+def parse_audio_message(message):
+    """Split a Minimax response into (the response without its audio, the decoded audio bytes).
+
+    The hex audio is nearly all of a response, so it is decoded straight out
+    of the received frame instead of going through a JSON string first;
+    only the small remainder is parsed (with orjson when installed).
+    """
+    if isinstance(message, str):
+        message = message.encode()
+    match = AUDIO_FIELD.search(message)
+    if match is None:
+        return json_loads(message), b""
+    start = match.end()
+    end = message.index(b'"', start)
+    view = memoryview(message)
+    audio = binascii.unhexlify(view[start:end])
+    rest = bytearray(view[:start])
+    rest += view[end:]
+    return json_loads(rest), audio
+
+
+async def synthesize_segment(tts_ws, text):
+    """Send one task_continue and yield the decoded audio chunks until Minimax marks it final."""
+    await tts_ws.send(json.dumps({
+        "event": "task_continue",
+        "text": text
+    }))
+    while True:
+        response, audio = parse_audio_message(await tts_ws.recv())
+        if response.get("event") == "task_failed":
+            raise RuntimeError(f"Minimax task failed: {response.get('base_resp')}")
+
+        if audio:
+            yield audio
+
+        if response.get("is_final"):
+            break
+
+
+async def close_minimax_connection(tts_ws):
+    if tts_ws:
+        try:
+            await tts_ws.send(json.dumps({"event": "task_finish"}))
+            await tts_ws.close()
+        except Exception:
+            pass
+
+
+class PooledTTSConnection(TTSStream):
+    """A Minimax connection with a task already started for one voice/audio setting."""
+
+    def __init__(self, ws, key, audio_setting):
+        self.ws = ws
+        self.key = key
+        self.audio_setting = audio_setting
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.broken = False
+
+    def is_open(self):
+        return self.ws.state is State.OPEN
+
+    async def send(self, message):
+        await self.ws.send(message)
+
+    async def recv(self):
+        # raw frames: the audio is decoded from them without a str copy
+        return await self.ws.recv(decode=False)
+
+    async def synthesize(self, text):
+        setting = self.audio_setting
+        async for audio in synthesize_segment(self, text):
+            yield AudioChunk(audio, setting["format"], setting["sample_rate"], setting["channel"])
+
+
+class TTSConnectionPool:
+    """Keep authenticated Minimax connections warm, each with a started task.
+
+    A connection is handed out for one turn and, if the turn ended cleanly
+    (every task_continue was read through is_final), returned to the idle
+    list with its task still open so the next turn skips the TLS handshake,
+    connected_success and task_start round trips.
+
+    Up to `size` connections are kept per voice/audio setting, checked out
+    ones included. A background task replaces idle connections before they
+    reach `max_idle` seconds, so the first turn after a lull still gets a
+    warm one, and forgets voices nobody used for `keep_warm` seconds.
+    Open sockets, idle or not, never exceed `max_concurrency`: background
+    top-ups stop there, and a turn that needs a new connection closes the
+    longest-idle one of another voice to make room.
+    """
+
+    def __init__(self, api_key, size=2, max_concurrency=16, max_idle=60.0, keep_warm=1800.0,
+                 max_retries=3, backoff=0.5, url=MINIMAX_WS_URL):
+        self.api_key = api_key
+        self.size = size
+        self.max_concurrency = max_concurrency
+        self.max_idle = max_idle
+        self.keep_warm = keep_warm
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.url = url
+        self._idle: dict[tuple, deque] = {}
+        # checked-out connections and last checkout time per key
+        self._in_use: dict[tuple, int] = {}
+        self._last_checkout: dict[tuple, float] = {}
+        # sockets open or being opened, idle and checked out
+        self.open_connections = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._background: set[asyncio.Task] = set()
+        self._filling: set[tuple] = set()
+        self._refresher: asyncio.Task | None = None
+        self._closed = False
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "reconnects": 0,
+            "failures": 0,
+            "discarded": 0,
+            "refreshed": 0,
+            "evicted": 0,
+            "in_use": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    @staticmethod
+    def make_key(voice_id, audio_setting):
+        return (voice_id, json.dumps(audio_setting, sort_keys=True))
+
+    def idle_count(self, voice_id, audio_setting=None):
+        return len(self._idle.get(self.make_key(voice_id, audio_setting or default_audio_setting()), ()))
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["idle"] = sum(len(conns) for conns in self._idle.values())
+        stats["open"] = self.open_connections
+        stats["max_concurrency"] = self.max_concurrency
+        return stats
+
+    async def _open(self, voice_id, audio_setting, evict=False):
+        """Connect and start a task, retrying with exponential backoff.
+
+        Returns None at the open-connection cap, unless `evict` lets it
+        close an idle connection of another voice to make room.
+        """
+        key = self.make_key(voice_id, audio_setting)
+        if self.open_connections >= self.max_concurrency and not (evict and self._evict_idle(key)):
+            return None
+        self.open_connections += 1
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["reconnects"] += 1
+                await asyncio.sleep(self.backoff * (2 ** (attempt - 1)))
+            ws = None
+            try:
+                ws = await establish_minimax_connection(self.api_key, self.url)
+                connected_at = time.monotonic()
+                if ws and await start_tts_task(ws, voice_id, audio_setting):
+                    conn = PooledTTSConnection(ws, key, audio_setting)
+                    conn.connected_at = connected_at
+                    conn.task_started_at = conn.created_at
+                    return conn
+                logger.warning("TTS task start failed (attempt %s)", attempt + 1)
+            except Exception:
+                logger.warning("TTS connect failed (attempt %s)", attempt + 1, exc_info=True)
+            await close_minimax_connection(ws)
+        self.open_connections -= 1
+        self.stats["failures"] += 1
+        return None
+
+    def _close(self, conn):
+        self.open_connections -= 1
+        self._spawn(close_minimax_connection(conn.ws))
+
+    def _evict_idle(self, key):
+        """Close the longest-idle connection of another key; False if there is none."""
+        candidates = [conns[0] for other, conns in self._idle.items() if other != key and conns]
+        if not candidates:
+            return False
+        conn = min(candidates, key=lambda candidate: candidate.last_used)
+        self._idle[conn.key].popleft()
+        self.stats["evicted"] += 1
+        self._close(conn)
+        return True
+
+    def _take_idle(self, key):
+        conns = self._idle.get(key)
+        now = time.monotonic()
+        while conns:
+            conn = conns.popleft()
+            if conn.is_open() and now - conn.last_used < self.max_idle:
+                return conn
+            self.stats["discarded"] += 1
+            self._close(conn)
+        return None
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _ensure_refresher(self):
+        if self._refresher is None and not self._closed:
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        """Every quarter of `max_idle`, replace idle connections that have been idle for half of it."""
+        interval = max(1.0, self.max_idle / 4)
+        while not self._closed:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for key in list(self._idle):
+                conns = self._idle[key]
+                if now - self._last_checkout.get(key, 0) > self.keep_warm:
+                    # nobody has asked for this voice in a long time; stop keeping it warm
+                    while conns:
+                        self._close(conns.popleft())
+                    if not self._in_use.get(key):
+                        del self._idle[key]
+                        self._in_use.pop(key, None)
+                        self._last_checkout.pop(key, None)
+                    continue
+                stale = [conn for conn in conns if not conn.is_open() or now - conn.last_used >= self.max_idle / 2]
+                if stale:
+                    self._spawn(self._replace(key, stale))
+
+    async def _replace(self, key, stale):
+        """Open a fresh connection for each stale idle one, then close the stale one if it is still idle."""
+        voice_id, audio_setting = key[0], json.loads(key[1])
+        for old in stale:
+            conns = self._idle.get(key)
+            if conns is None or old not in conns:
+                continue
+            if not old.is_open():
+                conns.remove(old)
+                self._close(old)
+                self.stats["discarded"] += 1
+            conn = await self._open(voice_id, audio_setting)
+            if conn is None:
+                break
+            conns = self._idle.setdefault(key, deque())
+            if old in conns:
+                conns.remove(old)
+                self._close(old)
+            conns.append(conn)
+            self.stats["refreshed"] += 1
+
+    async def fill(self, voice_id, audio_setting=None):
+        """Open connections until `size` exist for this voice/audio setting, checked-out ones included."""
+        audio_setting = audio_setting or default_audio_setting()
+        key = self.make_key(voice_id, audio_setting)
+        self._ensure_refresher()
+        self._last_checkout.setdefault(key, time.monotonic())
+        if key in self._filling:
+            return
+        self._filling.add(key)
+        try:
+            conns = self._idle.setdefault(key, deque())
+            while not self._closed and len(conns) + self._in_use.get(key, 0) < self.size:
+                conn = await self._open(voice_id, audio_setting)
+                if not conn:
+                    break
+                conns.append(conn)
+        finally:
+            self._filling.discard(key)
+
+    @asynccontextmanager
+    async def connection(self, voice_id, audio_setting=None):
+        """Check out a connection with a started task, or None if Minimax is unreachable."""
+        audio_setting = audio_setting or default_audio_setting()
+        key = self.make_key(voice_id, audio_setting)
+        self._ensure_refresher()
+
+        wait_start = time.monotonic()
+        await self._semaphore.acquire()
+        waited = time.monotonic() - wait_start
+        self.stats["wait_time_total"] += waited
+        self.stats["wait_time_max"] = max(self.stats["wait_time_max"], waited)
+        self.stats["in_use"] += 1
+        self._last_checkout[key] = time.monotonic()
+
+        conn = None
+        try:
+            conn = self._take_idle(key)
+            if conn:
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+                conn = await self._open(voice_id, audio_setting, evict=True)
+            if conn:
+                self._in_use[key] = self._in_use.get(key, 0) + 1
+            if len(self._idle.get(key, ())) + self._in_use.get(key, 0) < self.size:
+                # top the idle list back up for the next turn
+                self._spawn(self.fill(voice_id, audio_setting))
+            try:
+                yield conn
+            except BaseException:
+                if conn:
+                    conn.broken = True
+                raise
+        finally:
+            self.stats["in_use"] -= 1
+            self._semaphore.release()
+            if conn:
+                self._in_use[key] -= 1
+                self._release(conn)
+
+    def _release(self, conn):
+        conn.last_used = time.monotonic()
+        conns = self._idle.setdefault(conn.key, deque())
+        if conn.broken or self._closed or not conn.is_open() or len(conns) >= self.size:
+            self._close(conn)
+        else:
+            conns.append(conn)
+
+    async def close(self):
+        self._closed = True
+        if self._refresher:
+            self._refresher.cancel()
+        for conns in self._idle.values():
+            while conns:
+                self.open_connections -= 1
+                await close_minimax_connection(conns.popleft().ws)
+        for task in list(self._background):
+            task.cancel()
+
+
+class MinimaxStreamingTTS(StreamingTTS):
+    """Minimax over WebSocket: one pooled, already-started task per turn."""
+
+    name = "minimax"
+    model = TTS_MODEL
+    provider_formats = MINIMAX_FORMATS
+    provider_sample_rates = MINIMAX_SAMPLE_RATES
+    provider_channels = MINIMAX_CHANNELS
+    transcode_format = "mp3"
+
+    def __init__(self, api_key, url=MINIMAX_WS_URL):
+        self.pool = TTSConnectionPool(
+            api_key,
+            size=globals.config.getint("tts", "pool_size", fallback=2),
+            max_concurrency=globals.config.getint("tts", "pool_max_concurrency", fallback=16),
+            max_idle=globals.config.getfloat("tts", "pool_max_idle", fallback=60.0),
+            keep_warm=globals.config.getfloat("tts", "pool_keep_warm", fallback=1800.0),
+            url=url,
+        )
+
+    @classmethod
+    def from_config(cls):
+        api_key = os.getenv("MINIMAX_API_KEY")
+        if not api_key:
+            return None
+        return cls(api_key, globals.config.get("tts", "minimax_url", fallback=MINIMAX_WS_URL))
+
+    def default_voice(self):
+        return globals.config.get("tts", "voice_id", fallback="")
+
+    @asynccontextmanager
+    async def session(self, voice_id, plan):
+        async with self.pool.connection(voice_id, plan.provider_audio_setting()) as conn:
+            yield conn
+
+    async def warm_up(self, voice_id, plan):
+        audio_setting = plan.provider_audio_setting()
+        await self.pool.fill(voice_id, audio_setting)
+        if not self.pool.idle_count(voice_id, audio_setting):
+            raise RuntimeError("no Minimax connection could be opened")
+
+    def get_stats(self):
+        return self.pool.get_stats()
+
+    async def close(self):
+        await self.pool.close()
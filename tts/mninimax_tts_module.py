@@ -1,37 +1,57 @@
 # https://platform.minimax.io/docs/api-reference/speech-t2a-http
 
-import requests
 import os
 import globals
+from audio.formats import MINIMAX_CHANNELS, MINIMAX_FORMATS, MINIMAX_SAMPLE_RATES
+from .streaming import AudioChunk, HTTPStreamingTTS, iter_sse_json
 
-class MinimaxTTS:
-    def __init__(self):
-        self.api_key = os.getenv("MINIMAX_API_KEY")
-        self.url = "https://api.minimax.io/v1/t2a_v2"
-        self.voice_id = globals.config.get("tts", "voice_id")
+MINIMAX_HTTP_URL = "https://api.minimax.io/v1/t2a_v2"
+MINIMAX_HTTP_MODEL = "speech-2.8-turbo"
 
-    def generate_voice_clone(self, text, output_path):
+class MinimaxHTTPStreamingTTS(HTTPStreamingTTS):
+    """Minimax t2a_v2 with `stream: true`: hex audio arrives as server-sent events per segment."""
+
+    name = "minimax_http"
+    model = MINIMAX_HTTP_MODEL
+    provider_formats = MINIMAX_FORMATS
+    provider_sample_rates = MINIMAX_SAMPLE_RATES
+    provider_channels = MINIMAX_CHANNELS
+    transcode_format = "mp3"
+
+    def __init__(self, api_key, url=MINIMAX_HTTP_URL):
+        super().__init__()
+        self.api_key = api_key
+        self.url = url
+
+    @classmethod
+    def from_config(cls):
+        api_key = os.getenv("MINIMAX_API_KEY")
+        if not api_key:
+            return None
+        return cls(api_key)
+
+    def default_voice(self):
+        return globals.config.get("tts", "voice_id", fallback="")
+
+    async def stream_segment(self, voice_id, plan, text):
+        setting = plan.provider_audio_setting()
         payload = {
             "text": text,
-            "model": "speech-2.8-turbo",
-            "voice_setting": {
-                "voice_id": self.voice_id
-            },
-            "audio_setting": {
-                "sample_rate": 32000,
-                "bitrate": 128000,
-                "format": "wav",
-                "channel": 1
-            }
-        }
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
+            "model": self.model,
+            "stream": True,
+            "stream_options": {"exclude_aggregated_audio": True},
+            "voice_setting": {"voice_id": voice_id},
+            "audio_setting": setting,
         }
-        response = requests.post(self.url, headers=headers, json=payload)
-
-        if response.status_code == 200:
-            with open(f"{output_path}", "wb") as f:
-                audio_bytes = bytes.fromhex(response.json()['data']['audio'])
-                f.write(audio_bytes)
-            print(f"Audio saved as {output_path}")
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        async with self.post_stream(self.url, headers, payload) as response:
+            async for event in iter_sse_json(response):
+                base_resp = event.get("base_resp") or {}
+                if base_resp.get("status_code"):
+                    raise RuntimeError(f"Minimax TTS failed: {base_resp}")
+                data = event.get("data") or {}
+                # status 2 closes the stream and may repeat the whole utterance
+                if data.get("status") == 2:
+                    break
+                if data.get("audio"):
+                    yield AudioChunk(bytes.fromhex(data["audio"]), setting["format"], setting["sample_rate"], setting["channel"])
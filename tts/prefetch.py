@@ -0,0 +1,178 @@
+import asyncio
+import logging
+from collections import deque
+from contextlib import AsyncExitStack
+import globals
+from audio.formats import AudioPlan
+from tts.streaming import StreamingTTS, TTSStream
+
+logger = logging.getLogger("ws_server.tts_prefetch")
+
+
+class PrefetchLimiter:
+    """Process-wide cap on the extra TTS streams turns open to synthesize ahead.
+
+    Each turn's first stream is covered by the backend's own limits
+    (pool_max_concurrency); only the additional ones count here. When the
+    cap is reached turns do not wait, they just synthesize one segment at a
+    time.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.stats = {"in_use": 0, "opened": 0, "refused": 0}
+
+    def try_acquire(self):
+        if self.stats["in_use"] >= self.limit:
+            self.stats["refused"] += 1
+            return False
+        self.stats["in_use"] += 1
+        self.stats["opened"] += 1
+        return True
+
+    def release(self):
+        self.stats["in_use"] -= 1
+
+    def get_stats(self):
+        return {**self.stats, "limit": self.limit}
+
+
+prefetch_limiter: PrefetchLimiter | None = None
+
+
+def get_prefetch_limiter():
+    """Process-wide limiter sized by [tts] prefetch_max_streams."""
+    global prefetch_limiter
+    if prefetch_limiter is None:
+        prefetch_limiter = PrefetchLimiter(globals.config.getint("tts", "prefetch_max_streams", fallback=16))
+    return prefetch_limiter
+
+
+class PendingSegment:
+    """One text segment of a turn and the audio synthesized for it so far, tagged with its place in the reply."""
+
+    def __init__(self, seq, text):
+        self.seq = seq
+        self.text = text
+        # bytes, then None at the end, or the exception that ended synthesis
+        self._chunks: asyncio.Queue = asyncio.Queue()
+
+    async def _read(self):
+        while True:
+            item = await self._chunks.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class SegmentPrefetcher:
+    """Synthesize a turn's segments up to `depth` at a time and hand their audio back in order.
+
+    Segment N+1 goes to a second stream (another pooled connection, HTTP
+    request or batch slot) as soon as it is submitted, while segment N's
+    audio is still being read, so multi-sentence replies have no gap
+    between sentences. Audio of segments ahead of the one being played is
+    buffered in its PendingSegment; callers read segments with `audio`, in
+    `seq` order. A segment is only started once it is fewer than `depth`
+    ahead of the one being read, so a paused client also pauses synthesis.
+    `depth` 1 is plain one-at-a-time synthesis on `first_stream`.
+    """
+
+    def __init__(self, backend: StreamingTTS, voice_id, plan: AudioPlan, first_stream: TTSStream, depth=2,
+                 limiter: PrefetchLimiter | None = None):
+        self.backend = backend
+        self.voice_id = voice_id
+        self.plan = plan
+        self.depth = max(1, depth)
+        self.limiter = limiter
+        self.first_stream = first_stream
+        self._idle: list[TTSStream] = [first_stream]
+        self._waiting: deque[PendingSegment] = deque()
+        self._streams = 1
+        self._opening = 0
+        self._next_seq = 0
+        self._reading = 0
+        self._tasks: set[asyncio.Task] = set()
+        self._exit_stack = AsyncExitStack()
+
+    def submit(self, text) -> PendingSegment:
+        segment = PendingSegment(self._next_seq, text)
+        self._next_seq += 1
+        self._waiting.append(segment)
+        self._dispatch()
+        return segment
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def audio(self, segment: PendingSegment):
+        """Yield `segment`'s audio as it is produced, raising if its synthesis failed."""
+        self._reading = segment.seq
+        self._dispatch()
+        async for data in segment._read():
+            yield data
+
+    def _startable(self):
+        return sum(1 for segment in self._waiting if segment.seq < self._reading + self.depth)
+
+    def _dispatch(self):
+        while self._idle and self._startable():
+            self._spawn(self._synthesize(self._idle.pop(), self._waiting.popleft()))
+        # still more segments than free streams: open another one if this turn and the process may
+        if self._startable() > self._opening and self._streams + self._opening < self.depth:
+            if self.limiter is None or self.limiter.try_acquire():
+                self._opening += 1
+                self._spawn(self._open_stream())
+
+    async def _open_stream(self):
+        try:
+            stream = await self._exit_stack.enter_async_context(self.backend.session(self.voice_id, self.plan))
+        except BaseException as e:
+            self._opening -= 1
+            if not isinstance(e, Exception):
+                if self.limiter:
+                    self.limiter.release()
+                raise
+            logger.warning("Prefetch stream failed to open", exc_info=True)
+            stream = None
+        else:
+            self._opening -= 1
+        if stream is None:
+            # the provider is struggling; the rest of the turn carries on with the streams it has
+            self.depth = self._streams
+            if self.limiter:
+                self.limiter.release()
+            return
+        self._streams += 1
+        self._idle.append(stream)
+        self._dispatch()
+
+    async def _synthesize(self, stream: TTSStream, segment: PendingSegment):
+        try:
+            async for chunk in stream.synthesize(segment.text):
+                segment._chunks.put_nowait(chunk.data)
+        except BaseException as e:
+            # left mid-segment, so the backend must not reuse it
+            stream.broken = True
+            segment._chunks.put_nowait(e if isinstance(e, Exception) else asyncio.CancelledError())
+            if not isinstance(e, Exception):
+                raise
+            return
+        segment._chunks.put_nowait(None)
+        self._idle.append(stream)
+        self._dispatch()
+
+    async def close(self):
+        """Stop synthesis still running and return the extra streams to the backend."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        extra = self._streams - 1
+        await self._exit_stack.aclose()
+        if self.limiter:
+            for _ in range(extra):
+                self.limiter.release()
@@ -1,9 +1,20 @@
 from typing import Any, Dict, List, Optional, Tuple, Union
 from qwen_tts import Qwen3TTSModel, VoiceClonePromptItem
-import soundfile as sf
 import torch
 import numpy as np
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 import globals
+from .streaming import AudioChunk, StreamingTTS, TTSStream
+from .voice_registry import DEFAULT_VOICE, VoiceRegistry, load_voice_config
+
+QWEN3_MODEL_ID = "Qwen/Qwen3-TTS-12Hz-1.7B-Base"
+QWEN3_SAMPLE_RATE = 24000
+# generated audio is handed out in slices of this many samples (~0.1 s at 24 kHz)
+QWEN3_CHUNK_SAMPLES = 2400
+# upper bounds of the queue depth histogram buckets
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32)
 
 AudioLike = Union[
     str,                     # wav path, URL, base64
@@ -13,23 +24,213 @@ AudioLike = Union[
 
 class Qwen3TTS:
     def __init__(self):
+        # CPU by default so it runs on boxes without a GPU; flash-attention is CUDA only, sdpa works everywhere
+        device = globals.config.get("tts", "qwen_device", fallback="cpu")
         self.tts_model = Qwen3TTSModel.from_pretrained(
-            "Qwen/Qwen3-TTS-12Hz-1.7B-Base",
-            device_map="cuda:0",
-            dtype=torch.bfloat16,
-            attn_implementation="flash_attention_2",
+            QWEN3_MODEL_ID,
+            device_map=device,
+            dtype=torch.float32 if device == "cpu" else torch.bfloat16,
+            attn_implementation="sdpa",
+        )
+        # clone prompts are computed (or read back from disk) the first time each voice is used
+        self.voices = VoiceRegistry(
+            self.tts_model, QWEN3_MODEL_ID,
+            globals.config.get("tts", "voice_dir", fallback="cache/voices"),
         )
-        ref_audio = globals.config.get("tts", "ref_audio")
-        ref_text = globals.config.get("tts", "ref_text")
-        self.tts_prompt = self.tts_model.create_voice_clone_prompt(ref_audio, ref_text)
-    
-    def generate_voice_clone(
-        self,
-        text: str,
-        output_path: str,
-    ):
-        if not voice_clone_prompt:
-            voice_clone_prompt = self.tts_prompt
-        wavs, sr = self.tts_model.generate_voice_clone(text, voice_clone_prompt=self.tts_prompt)
-        sf.write(output_path, wavs[0], sr)
-        print(f"generate_voice_clone file save to {output_path}")
+
+    def generate_batch(self, texts: List[str], voices: List[str]):
+        """Synthesize several texts, each in its own voice, in one forward pass."""
+        prompts: List[VoiceClonePromptItem] = []
+        for voice in voices:
+            prompts.extend(self.voices.get(voice))
+        wavs, sr = self.tts_model.generate_voice_clone(texts, voice_clone_prompt=prompts)
+        return wavs, sr
+
+
+class Qwen3BatchWorker:
+    """Dynamic batching in front of one Qwen3TTS model.
+
+    Callers `submit` a text and voice and await its waveform. The worker takes the
+    oldest pending request, then keeps collecting until it has
+    `max_batch_size` texts or `max_wait` seconds have passed, and runs the
+    whole batch as one `generate_batch` call on its own executor thread.
+    Requests whose caller has gone away (barge-in) are dropped before the
+    batch starts.
+    """
+
+    def __init__(self, tts: Qwen3TTS, max_batch_size=4, max_wait=0.02):
+        self.tts = tts
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="qwen3-tts")
+        self._task: asyncio.Task | None = None
+        self.batch_size_histogram = {size: 0 for size in range(1, max_batch_size + 1)}
+        self.queue_depth_histogram = {bucket: 0 for bucket in (*QUEUE_DEPTH_BUCKETS, "+Inf")}
+        self.stats = {"requests": 0, "batches": 0, "dropped": 0, "failures": 0, "generate_time_total": 0.0}
+
+    async def submit(self, text, voice=DEFAULT_VOICE):
+        """Queue `text` and return `(waveform, sample_rate)` once its batch is done."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self.stats["requests"] += 1
+        self.queue.put_nowait((text, voice, future))
+        return await future
+
+    async def run_exclusive(self, fn, *args):
+        """Run `fn` on the model thread, between batches."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _observe_queue_depth(self, depth):
+        for bucket in QUEUE_DEPTH_BUCKETS:
+            if depth <= bucket:
+                self.queue_depth_histogram[bucket] += 1
+                return
+        self.queue_depth_histogram["+Inf"] += 1
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        self._observe_queue_depth(self.queue.qsize() + 1)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        live = [item for item in batch if not item[2].done()]
+        self.stats["dropped"] += len(batch) - len(live)
+        return live
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            self.stats["batches"] += 1
+            self.batch_size_histogram[len(batch)] += 1
+            start = loop.time()
+            try:
+                wavs, sr = await loop.run_in_executor(
+                    self._executor, self.tts.generate_batch,
+                    [text for text, _, _ in batch], [voice for _, voice, _ in batch],
+                )
+            except Exception as e:
+                self.stats["failures"] += 1
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.stats["generate_time_total"] += loop.time() - start
+            for (_, _, future), wav in zip(batch, wavs):
+                if not future.done():
+                    future.set_result((wav, sr))
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["queue_depth"] = self.queue.qsize()
+        stats["batch_size_histogram"] = dict(self.batch_size_histogram)
+        stats["queue_depth_histogram"] = {str(bucket): count for bucket, count in self.queue_depth_histogram.items()}
+        return stats
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def to_s16le(wav):
+    return (np.clip(wav, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+class Qwen3TTSStream(TTSStream):
+    """Audio of one Qwen3 segment, sliced into chunks once the whole segment has been generated.
+
+    qwen_tts only returns finished waveforms, so this is not incremental
+    generation: a segment's first byte costs its full synthesis time.
+    """
+
+    def __init__(self, backend, voice):
+        self.backend = backend
+        self.voice = voice
+
+    async def synthesize(self, text):
+        wav, sr = await self.backend.generate(text, self.voice)
+        pcm = to_s16le(wav)
+        step = QWEN3_CHUNK_SAMPLES * 2
+        for i in range(0, len(pcm), step):
+            yield AudioChunk(pcm[i:i + step], "pcm", sr, 1)
+
+
+class Qwen3StreamingTTS(StreamingTTS):
+    """Local Qwen3-TTS, generated one text segment at a time.
+
+    ws_server already cuts the reply into sentences, so audio for the first
+    sentence goes out while later ones are still being generated. Within a
+    segment there is no streaming (see Qwen3TTSStream): time to first byte
+    is the synthesis time of the first sentence or clause. The model
+    is loaded on first use (or at warm-up) in a worker thread; segments from
+    all sessions go through one Qwen3BatchWorker, so concurrent sessions
+    share forward passes instead of queueing one utterance at a time.
+    """
+
+    name = "qwen3"
+    model = QWEN3_MODEL_ID
+    provider_formats = ("pcm",)
+    provider_sample_rates = (QWEN3_SAMPLE_RATE,)
+    provider_channels = (1,)
+    transcode_format = "pcm"
+
+    def __init__(self):
+        self.worker: Qwen3BatchWorker | None = None
+        self._load_lock = asyncio.Lock()
+
+    def default_voice(self):
+        return DEFAULT_VOICE
+
+    def voices(self):
+        return list(load_voice_config())
+
+    def accepts_voice(self, voice):
+        return voice in load_voice_config()
+
+    async def _ensure_loaded(self):
+        async with self._load_lock:
+            if self.worker is None:
+                tts = await asyncio.to_thread(Qwen3TTS)
+                self.worker = Qwen3BatchWorker(
+                    tts,
+                    max_batch_size=globals.config.getint("tts", "qwen_max_batch_size", fallback=4),
+                    max_wait=globals.config.getfloat("tts", "qwen_max_wait_ms", fallback=20) / 1000,
+                )
+        return self.worker
+
+    async def generate(self, text, voice=DEFAULT_VOICE):
+        worker = await self._ensure_loaded()
+        return await worker.submit(text, voice)
+
+    @asynccontextmanager
+    async def session(self, voice_id, plan):
+        yield Qwen3TTSStream(self, voice_id)
+
+    async def warm_up(self, voice_id, plan):
+        worker = await self._ensure_loaded()
+        await worker.run_exclusive(worker.tts.voices.get, voice_id)
+
+    def get_stats(self):
+        if self.worker is None:
+            return {"loaded": False}
+        return {"loaded": True, **self.worker.get_stats()}
+
+    async def close(self):
+        if self.worker:
+            await self.worker.close()
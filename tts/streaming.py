@@ -0,0 +1,163 @@
+import json
+import asyncio
+from contextlib import asynccontextmanager
+import httpx
+import globals
+from audio.formats import AudioPlan, negotiate_audio_format
+
+
+class AudioChunk:
+    """A piece of provider audio plus the format it is encoded in."""
+
+    __slots__ = ("data", "format", "sample_rate", "channels")
+
+    def __init__(self, data: bytes, audio_format, sample_rate, channels=1):
+        self.data = data
+        self.format = audio_format
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+
+class TTSStream:
+    """One turn's synthesis channel, opened by `StreamingTTS.session`.
+
+    `synthesize` is called once per text segment, in order, and yields that
+    segment's audio as it is produced. A stream left mid-segment (error or
+    cancellation) is marked `broken` so the backend does not reuse it.
+    Backends with a connection handshake set `connected_at` and
+    `task_started_at` (time.monotonic()) for the turn's latency spans.
+    """
+
+    broken = False
+    connected_at = None
+    task_started_at = None
+
+    async def synthesize(self, text):
+        raise NotImplementedError
+        yield
+
+
+class StreamingTTS:
+    """Async TTS backend used by ws_server.
+
+    Subclasses declare what the provider can produce (`provider_formats`,
+    `provider_sample_rates`, `provider_channels`) and the format to request
+    when the client wants something else (`transcode_format`); `negotiate`
+    turns a client request into an AudioPlan from those.
+    """
+
+    name = ""
+    model = ""
+    provider_formats = ("pcm",)
+    provider_sample_rates = (24000,)
+    provider_channels = (1,)
+    transcode_format = "pcm"
+
+    @classmethod
+    def from_config(cls):
+        """Build the backend from config/environment, or return None if it cannot run here."""
+        return cls()
+
+    def default_voice(self):
+        return ""
+
+    def voices(self):
+        """Voices to advertise to clients; providers with large catalogues only list the default."""
+        return [self.default_voice()]
+
+    def accepts_voice(self, voice):
+        return bool(voice)
+
+    def negotiate(self, output_format, sample_rate=32000, channels=1) -> AudioPlan:
+        return negotiate_audio_format(
+            output_format, sample_rate, channels,
+            provider_formats=self.provider_formats,
+            provider_sample_rates=self.provider_sample_rates,
+            provider_channels=self.provider_channels,
+            transcode_format=self.transcode_format,
+        )
+
+    @asynccontextmanager
+    async def session(self, voice_id, plan: AudioPlan):
+        """Yield a TTSStream for one turn, or None if the provider is unavailable."""
+        raise NotImplementedError
+        yield
+
+    async def warm_up(self, voice_id, plan: AudioPlan):
+        """Called once at startup so the first turn does not pay connection or model load costs."""
+
+    def get_stats(self):
+        return {}
+
+    async def close(self):
+        pass
+
+
+async def iter_sse_json(response: httpx.Response):
+    """Yield the JSON payload of each `data:` line of a server-sent event stream."""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if not data or data == "[DONE]":
+            continue
+        yield json.loads(data)
+
+
+class HTTPTTSStream(TTSStream):
+    def __init__(self, backend, voice_id, plan):
+        self.backend = backend
+        self.voice_id = voice_id
+        self.plan = plan
+
+    async def synthesize(self, text):
+        async for chunk in self.backend.stream_segment(self.voice_id, self.plan, text):
+            yield chunk
+
+
+class HTTPStreamingTTS(StreamingTTS):
+    """Base for providers that stream each segment back as one chunked HTTP response.
+
+    All sessions share one keep-alive connection pool, and in-flight
+    requests are capped at `[tts] pool_max_concurrency`.
+    """
+
+    def __init__(self):
+        max_concurrency = globals.config.getint("tts", "pool_max_concurrency", fallback=16)
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.stats = {"requests": 0, "failures": 0, "in_use": 0}
+
+    async def stream_segment(self, voice_id, plan: AudioPlan, text):
+        """Yield AudioChunks for `text` as the response body arrives."""
+        raise NotImplementedError
+        yield
+
+    @asynccontextmanager
+    async def post_stream(self, url, headers, payload):
+        """POST `payload` and yield the response once its status line is in, body still unread."""
+        async with self._semaphore:
+            self.stats["requests"] += 1
+            self.stats["in_use"] += 1
+            try:
+                async with self.client.stream("POST", url, headers=headers, json=payload) as response:
+                    if response.is_error:
+                        await response.aread()
+                        self.stats["failures"] += 1
+                        raise RuntimeError(f"{self.name} TTS request failed: {response.status_code} {response.text[:200]}")
+                    yield response
+            finally:
+                self.stats["in_use"] -= 1
+
+    @asynccontextmanager
+    async def session(self, voice_id, plan):
+        yield HTTPTTSStream(self, voice_id, plan)
+
+    def get_stats(self):
+        return dict(self.stats)
+
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,128 @@
+import os
+import json
+import hashlib
+import dataclasses
+import logging
+import threading
+import globals
+
+logger = logging.getLogger("ws_server.voice_registry")
+
+DEFAULT_VOICE = "default"
+VOICE_SECTION_PREFIX = "voice."
+
+
+def load_voice_config():
+    """Map voice name -> (ref_audio, ref_text).
+
+    `default` comes from [tts] ref_audio / ref_text; more voices are
+    declared as [voice.<name>] sections with the same two keys.
+    """
+    voices = {}
+    if globals.config.has_option("tts", "ref_audio"):
+        voices[DEFAULT_VOICE] = (globals.config.get("tts", "ref_audio"), globals.config.get("tts", "ref_text", fallback=""))
+    for section in globals.config.sections():
+        if section.startswith(VOICE_SECTION_PREFIX):
+            name = section[len(VOICE_SECTION_PREFIX):]
+            voices[name] = (globals.config.get(section, "ref_audio"), globals.config.get(section, "ref_text", fallback=""))
+    return voices
+
+
+def prompt_key(ref_audio, ref_text, model_id):
+    digest = hashlib.sha256()
+    with open(ref_audio, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    digest.update(b"\0" + ref_text.encode("utf-8") + b"\0" + model_id.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class VoiceRegistry:
+    """Voice-clone prompts for a Qwen3 model, computed once per reference and kept on disk.
+
+    A prompt is looked up by voice name on first use: from memory, else
+    from `<directory>/<key>.pt` and `<key>.json`, else computed with
+    `create_voice_clone_prompt` and saved. Its tensors and its other fields
+    are stored apart, so loading one never unpickles code from the
+    directory: the tensors with `weights_only=True`, the rest as JSON.
+    The key hashes the reference
+    audio bytes, its transcript and the model id, so editing a voice's
+    reference or switching models never serves a stale prompt.
+    """
+
+    def __init__(self, tts_model, model_id, directory, voices=None):
+        self.tts_model = tts_model
+        self.model_id = model_id
+        self.directory = directory
+        self.voices = voices if voices is not None else load_voice_config()
+        self._prompts = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def names(self):
+        return list(self.voices)
+
+    def get(self, name):
+        prompt = self._prompts.get(name)
+        if prompt is not None:
+            return prompt
+        if name not in self.voices:
+            raise KeyError(f"Unknown voice: {name}")
+        with self._lock:
+            if name not in self._prompts:
+                self._prompts[name] = self._load_or_create(name)
+        return self._prompts[name]
+
+    def _load(self, base):
+        import torch
+        from qwen_tts import VoiceClonePromptItem
+
+        with open(base + ".json", encoding="utf-8") as f:
+            items = json.load(f)
+        tensors = torch.load(base + ".pt", weights_only=True)
+        prompt = []
+        for index, fields in enumerate(items):
+            for field in fields.pop("_tensors"):
+                fields[field] = tensors[f"{index}.{field}"]
+            prompt.append(VoiceClonePromptItem(**fields))
+        return prompt
+
+    def _save(self, base, prompt):
+        import torch
+
+        items, tensors = [], {}
+        for index, item in enumerate(prompt):
+            fields = {"_tensors": []}
+            for field in dataclasses.fields(item):
+                value = getattr(item, field.name)
+                if isinstance(value, torch.Tensor):
+                    tensors[f"{index}.{field.name}"] = value.detach().cpu()
+                    fields["_tensors"].append(field.name)
+                else:
+                    fields[field.name] = value
+            items.append(fields)
+        # the JSON goes last: a prompt counts as saved once it exists
+        torch.save(tensors, base + ".pt.tmp")
+        os.replace(base + ".pt.tmp", base + ".pt")
+        with open(base + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(base + ".json.tmp", base + ".json")
+
+    def _load_or_create(self, name):
+        ref_audio, ref_text = self.voices[name]
+        base = os.path.join(self.directory, prompt_key(ref_audio, ref_text, self.model_id))
+        if os.path.exists(base + ".json"):
+            try:
+                prompt = self._load(base)
+                logger.info("Voice prompt loaded: %s", name)
+                return prompt
+            except Exception:
+                logger.warning("Voice prompt %s unreadable, recomputing", base, exc_info=True)
+        prompt = self.tts_model.create_voice_clone_prompt(ref_audio, ref_text)
+        logger.info("Voice prompt computed: %s", name)
+        try:
+            self._save(base, prompt)
+        except Exception:
+            # still usable for this process, just computed again next time
+            logger.warning("Voice prompt %s not saved", base, exc_info=True)
+        return prompt
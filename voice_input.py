@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from collections import deque
+import globals
+from asr.streaming import RecognizerStream, StreamingRecognizer
+from audio.vad import (VAD_FRAME_MS, SPEECH_END, SPEECH_PAUSE, SPEECH_RESUME, SPEECH_START, Endpointer,
+                       EnergyVAD)
+
+logger = logging.getLogger("ws_server.voice_input")
+
+# audio kept from before the VAD fires, so the first syllable is not cut off
+PREROLL_MS = 200
+
+
+def create_endpointer():
+    """Endpointer configured from [asr]."""
+    vad = EnergyVAD(
+        threshold_db=globals.config.getfloat("asr", "vad_threshold_db", fallback=-45.0),
+        margin_db=globals.config.getfloat("asr", "vad_margin_db", fallback=12.0),
+    )
+    return Endpointer(
+        vad,
+        min_speech_ms=globals.config.getint("asr", "min_speech_ms", fallback=100),
+        pause_ms=globals.config.getint("asr", "pause_ms", fallback=300),
+        endpoint_ms=globals.config.getint("asr", "endpoint_ms", fallback=700),
+        max_utterance_ms=globals.config.getint("asr", "max_utterance_s", fallback=30) * 1000,
+    )
+
+
+class VoiceInput:
+    """One connection's microphone stream: VAD endpointing and streaming recognition.
+
+    `feed` takes 16-bit mono PCM as the client sends it; frames are
+    processed by a task of their own, so the receive loop never waits on
+    the recognizer. `on_event(event, text)` is awaited for each stage of an
+    utterance, in order:
+    - "start": speech began
+    - "partial": transcript so far, every `partial_interval_ms` of speech
+    - "pause": transcript at a pause that may be the endpoint
+    - "resume": the user went on speaking after the pause
+    - "final": the utterance ended; `text` is its transcript
+
+    Audio after a pause is held back from the recognizer until speech
+    resumes, so the final transcript of an utterance that ends at the pause
+    is the one already taken there and costs no second decode.
+    """
+
+    def __init__(self, recognizer: StreamingRecognizer, on_event, endpointer: Endpointer | None = None,
+                 partial_interval_ms=None):
+        self.recognizer = recognizer
+        self.on_event = on_event
+        self.endpointer = endpointer or create_endpointer()
+        if partial_interval_ms is None:
+            partial_interval_ms = globals.config.getint("asr", "partial_interval_ms", fallback=500)
+        self.partial_interval_ms = partial_interval_ms
+        self.frame_bytes = recognizer.sample_rate * VAD_FRAME_MS // 1000 * 2
+        self._remainder = b""
+        self._frames: asyncio.Queue = asyncio.Queue()
+        self._preroll: deque[bytes] = deque(maxlen=max(1, PREROLL_MS // VAD_FRAME_MS))
+        self._held: list[bytes] = []
+        self._stream: RecognizerStream | None = None
+        self._utterance = 0
+        self._since_partial_ms = 0
+        self._partial_task: asyncio.Task | None = None
+        # events are delivered by one task at a time, in the order they happened
+        self._last_delivery: asyncio.Task | None = None
+        self._deliveries: set[asyncio.Task] = set()
+        self._task = asyncio.create_task(self._run())
+
+    def feed(self, pcm: bytes):
+        data = self._remainder + pcm
+        end = len(data) - len(data) % self.frame_bytes
+        for i in range(0, end, self.frame_bytes):
+            self._frames.put_nowait(data[i:i + self.frame_bytes])
+        self._remainder = data[end:]
+
+    def end(self):
+        """The client stopped sending; an utterance still open is finalized."""
+        self._frames.put_nowait(None)
+
+    def _deliver(self, event, text_source=None):
+        """Queue `on_event(event, text)` behind earlier events; `text_source` is awaited for the text."""
+        previous = self._last_delivery
+        utterance = self._utterance
+
+        async def deliver():
+            text = ""
+            if text_source is not None:
+                try:
+                    text = await text_source
+                except Exception:
+                    logger.exception("Recognition failed")
+            if previous:
+                await asyncio.gather(previous, return_exceptions=True)
+            # partials of an utterance that has already ended are stale
+            if event == "partial" and utterance != self._utterance:
+                return
+            try:
+                await self.on_event(event, text)
+            except Exception:
+                logger.exception("Voice input event failed: %s", event)
+
+        self._last_delivery = asyncio.create_task(deliver())
+        self._deliveries.add(self._last_delivery)
+        self._last_delivery.add_done_callback(self._deliveries.discard)
+        return self._last_delivery
+
+    def _start_partial(self, event):
+        stream = self._stream
+        if event == "partial" and self._partial_task and not self._partial_task.done():
+            # the recognizer is behind; skip this partial rather than queue decodes
+            return
+        self._partial_task = self._deliver(event, stream.partial())
+
+    async def _finish(self):
+        stream, self._stream = self._stream, None
+        self._held.clear()
+        self._deliver("final", stream.finish())
+
+    async def _process(self, frame):
+        event = self.endpointer.process(frame)
+        if event == SPEECH_START:
+            self._utterance += 1
+            self._stream = self.recognizer.stream()
+            self._since_partial_ms = 0
+            for earlier in self._preroll:
+                await self._stream.feed(earlier)
+            self._preroll.clear()
+            await self._stream.feed(frame)
+            self._deliver("start")
+            return
+        if self._stream is None:
+            self._preroll.append(frame)
+            return
+        if event == SPEECH_END:
+            await self._finish()
+            return
+        if event == SPEECH_RESUME:
+            for held in self._held:
+                await self._stream.feed(held)
+            self._held.clear()
+            self._deliver("resume")
+        if self.endpointer.paused:
+            self._held.append(frame)
+            if event == SPEECH_PAUSE:
+                self._start_partial("pause")
+            return
+        await self._stream.feed(frame)
+        self._since_partial_ms += VAD_FRAME_MS
+        if self.partial_interval_ms and self._since_partial_ms >= self.partial_interval_ms:
+            self._since_partial_ms = 0
+            self._start_partial("partial")
+
+    async def _run(self):
+        try:
+            while True:
+                frame = await self._frames.get()
+                if frame is None:
+                    break
+                await self._process(frame)
+            if self._stream is not None:
+                self.endpointer.reset()
+                await self._finish()
+            if self._last_delivery:
+                await self._last_delivery
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Voice input failed")
+
+    def done(self):
+        return self._task.done()
+
+    async def close(self):
+        """Stop processing; an open utterance is dropped."""
+        self._task.cancel()
+        for task in list(self._deliveries):
+            task.cancel()
+        await asyncio.gather(self._task, *self._deliveries, return_exceptions=True)
+        if self._stream:
+            self._stream.close()
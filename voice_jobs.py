@@ -0,0 +1,318 @@
+import os
+import time
+import uuid
+import struct
+import asyncio
+import logging
+import globals
+from audio.formats import OUTPUT_FORMAT_ALIASES, PATH_DIRECT, AudioPlan
+from audio.transcoder import create_transcoder_for_plan
+from llm.segmenter import SentenceSegmenter
+from tts.prefetch import SegmentPrefetcher, get_prefetch_limiter
+from tts.streaming import StreamingTTS
+
+logger = logging.getLogger("ws_server.voice_jobs")
+
+AUDIO_OUTPUT_DIR = "audio_output"
+READ_CHUNK_SIZE = 64 * 1024
+PARTIAL_SUFFIX = ".part"
+RESPONSE_PREFIX = "response_"
+# file extension per audio format, where it is not the format's own name
+FILE_EXTENSIONS = {"s16le": "pcm"}
+# how often a worker that does not own a job checks its partial file for new bytes
+PARTIAL_POLL_INTERVAL = 0.05
+
+
+def parse_byte_range(header):
+    """(start, end) for a single `bytes=` range; end is inclusive or None, start is negative for a suffix range.
+
+    Returns None for anything else (no header, other units, several ranges),
+    which is served as the whole file.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            return (-int(last), None) if last else None
+        start = int(first)
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if end is not None and end < start:
+        return None
+    return start, end
+
+
+def file_extension(audio_format):
+    audio_format = OUTPUT_FORMAT_ALIASES.get(audio_format, audio_format)
+    return FILE_EXTENSIONS.get(audio_format, audio_format)
+
+
+class VoiceJob:
+    """One turn's speech, synthesized in the background into its own file.
+
+    Audio is kept in memory while the job runs, so downloads on this worker
+    read it as it arrives; `wait_for` returns once a given number of bytes
+    exist or the job is over. The same bytes are appended, in order and off
+    the loop, to `<file>.part` once `open_file` has created it; it is renamed
+    to the final name when the job finishes, so other workers can follow the
+    job from disk.
+    """
+
+    def __init__(self, filename, path, audio_format="wav"):
+        self.filename = filename
+        self.path = path
+        self.audio_format = audio_format
+        self.data = bytearray()
+        self.finished = False
+        self.error = None
+        self._changed = asyncio.Event()
+        self._pending: list[bytes] = []
+        self._writer: asyncio.Task | None = None
+        self._file = None
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _open_file(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        return open(self.path + PARTIAL_SUFFIX, "wb")
+
+    async def open_file(self):
+        """Create `<file>.part` off the loop; audio appended before then is written once it exists."""
+        self._file = await asyncio.to_thread(self._open_file)
+        self._start_writer()
+
+    def _start_writer(self):
+        if self._file and self._pending and (self._writer is None or self._writer.done()):
+            self._writer = asyncio.create_task(self._write_pending())
+
+    def append(self, data: bytes):
+        self.data += data
+        self._pending.append(data)
+        self._start_writer()
+        self._notify()
+
+    async def _write_pending(self):
+        # one writer at a time keeps the partial file in order
+        while self._pending:
+            chunks, self._pending = self._pending, []
+            await asyncio.to_thread(self._file.writelines, chunks)
+
+    def _complete_file(self, error):
+        if self._file is None:
+            # the partial file could not be created; there is nothing to rename
+            return
+        self._file.flush()
+        if self.audio_format == "wav" and self.size > 44 and error is None:
+            # the streaming header carries placeholder sizes; fill in the real ones now they are known
+            self._file.seek(4)
+            self._file.write(struct.pack("<I", self.size - 8))
+            self._file.seek(40)
+            self._file.write(struct.pack("<I", self.size - 44))
+        self._file.close()
+        os.replace(self.path + PARTIAL_SUFFIX, self.path)
+
+    async def finish(self, error=None):
+        if self.audio_format == "wav" and self.size > 44 and error is None:
+            struct.pack_into("<I", self.data, 4, self.size - 8)
+            struct.pack_into("<I", self.data, 40, self.size - 44)
+        self.finished = True
+        self.error = error
+        self._notify()
+        try:
+            if self._writer:
+                await self._writer
+            if self._file:
+                await self._write_pending()
+            await asyncio.to_thread(self._complete_file, error)
+        except OSError:
+            logger.exception("Voice file write failed: %s", self.filename)
+
+    async def wait_for(self, size, timeout=None):
+        """Wait until `size` bytes exist or the job has finished; return the bytes available so far."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self.size < size and not self.finished:
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), deadline - time.monotonic() if deadline else None)
+            except asyncio.TimeoutError:
+                break
+        return self.size
+
+    async def read(self, start=0, end=None, stall_timeout=60.0):
+        """Yield bytes `start`..`end` (inclusive, None = to the end) as they are produced."""
+        position = start
+        while end is None or position <= end:
+            available = await self.wait_for(position + 1, stall_timeout)
+            if available <= position:
+                if not self.finished:
+                    logger.warning("Voice job stalled: %s", self.filename)
+                return
+            limit = available if end is None else min(available, end + 1)
+            while position < limit:
+                chunk_end = min(limit, position + READ_CHUNK_SIZE)
+                yield bytes(self.data[position:chunk_end])
+                position = chunk_end
+
+
+async def follow_partial_file(path, stall_timeout=60.0):
+    """Yield a voice file another worker is still writing, until it is renamed to `path`."""
+    partial = path + PARTIAL_SUFFIX
+    try:
+        f = await asyncio.to_thread(open, partial, "rb")
+    except FileNotFoundError:
+        # finished in the meantime
+        f = await asyncio.to_thread(open, path, "rb")
+    with f:
+        idle_since = time.monotonic()
+        while True:
+            data = await asyncio.to_thread(f.read, READ_CHUNK_SIZE)
+            if data:
+                idle_since = time.monotonic()
+                yield data
+                continue
+            # the rename keeps our open file; once the final name exists everything has been written
+            if os.path.exists(path):
+                data = await asyncio.to_thread(f.read)
+                if data:
+                    yield data
+                return
+            if time.monotonic() - idle_since > stall_timeout:
+                logger.warning("Partial voice file stalled: %s", path)
+                return
+            await asyncio.sleep(PARTIAL_POLL_INTERVAL)
+
+
+class VoiceJobManager:
+    """Voice jobs running on this worker, by output filename."""
+
+    def __init__(self, directory=AUDIO_OUTPUT_DIR):
+        self.directory = directory
+        self.jobs: dict[str, VoiceJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._pruning = False
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def get(self, filename) -> VoiceJob | None:
+        return self.jobs.get(filename)
+
+    def start(self, session_id, text, backend: StreamingTTS, voice_id, plan: AudioPlan, transcoder_backend) -> VoiceJob:
+        """Start synthesizing `text` in the background and return its job right away.
+
+        Without a transcoder the provider's audio is stored as it arrives, so
+        the file takes the provider format's extension instead of the plan's.
+        """
+        transcoder = create_transcoder_for_plan(transcoder_backend, plan)
+        audio_format = plan.output_format if transcoder or plan.path == PATH_DIRECT else plan.provider_format
+        # one file per turn, so overlapping turns of a session never share a file
+        filename = f"{RESPONSE_PREFIX}{session_id}_{uuid.uuid4().hex[:12]}.{file_extension(audio_format)}"
+        job = VoiceJob(filename, self.path(filename), audio_format)
+        self.jobs[filename] = job
+        task = asyncio.create_task(self._run(job, text, backend, voice_id, plan, transcoder))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: VoiceJob, text, backend: StreamingTTS, voice_id, plan: AudioPlan, transcoder):
+        """Synthesize `text` sentence by sentence into `job`, converting per `plan` through `transcoder` (None = as is)."""
+        forward_task = None
+        error = None
+
+        async def forward_audio():
+            async for data in transcoder.chunks():
+                job.append(data)
+
+        try:
+            await job.open_file()
+            if transcoder:
+                forward_task = asyncio.create_task(forward_audio())
+            segmenter = SentenceSegmenter()
+            async with backend.session(voice_id, plan) as tts_stream:
+                if not tts_stream:
+                    raise RuntimeError("TTS unavailable")
+                prefetcher = SegmentPrefetcher(backend, voice_id, plan, tts_stream,
+                                               globals.config.getint("tts", "prefetch_segments", fallback=2), get_prefetch_limiter())
+                try:
+                    segments = [prefetcher.submit(segment) for segment in segmenter.feed(text) + segmenter.flush()]
+                    for segment in segments:
+                        async for data in prefetcher.audio(segment):
+                            if transcoder:
+                                await transcoder.feed(data)
+                            else:
+                                job.append(data)
+                finally:
+                    await prefetcher.close()
+            if transcoder:
+                await transcoder.close()
+                await forward_task
+        except Exception as e:
+            logger.exception("Voice job failed: %s", job.filename)
+            error = str(e) or type(e).__name__
+            if forward_task and not forward_task.done():
+                await transcoder.abort()
+                await forward_task
+        finally:
+            await job.finish(error)
+            # only now is the final file on disk for requests that miss the in-memory job
+            self.jobs.pop(job.filename, None)
+            await self.prune()
+
+    def _prune_files(self, max_age, max_count, running):
+        """Delete finished voice files older than `max_age` seconds, then the oldest beyond `max_count`."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+        files = []
+        for name in names:
+            # partial files belong to jobs still running on some worker
+            if not name.startswith(RESPONSE_PREFIX) or name.endswith(PARTIAL_SUFFIX) or name in running:
+                continue
+            try:
+                files.append((os.stat(self.path(name)).st_mtime, name))
+            except FileNotFoundError:
+                continue
+        files.sort(reverse=True)
+        cutoff = time.time() - max_age if max_age > 0 else None
+        removed = 0
+        for index, (mtime, name) in enumerate(files):
+            if (cutoff is not None and mtime < cutoff) or (max_count > 0 and index >= max_count):
+                try:
+                    os.remove(self.path(name))
+                    removed += 1
+                except FileNotFoundError:
+                    # another worker pruned it first
+                    pass
+        return removed
+
+    async def prune(self):
+        """Apply the [tts] voice file retention to the output directory, off the loop."""
+        max_age = globals.config.getfloat("tts", "voice_file_max_age", fallback=86400.0)
+        max_count = globals.config.getint("tts", "voice_file_max_count", fallback=1000)
+        if self._pruning or (max_age <= 0 and max_count <= 0):
+            return
+        # jobs finishing together share one pass
+        self._pruning = True
+        try:
+            removed = await asyncio.to_thread(self._prune_files, max_age, max_count, set(self.jobs))
+        except OSError:
+            logger.exception("Voice file cleanup failed: %s", self.directory)
+        else:
+            if removed:
+                logger.info("Removed %d old voice files from %s", removed, self.directory)
+        finally:
+            self._pruning = False
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
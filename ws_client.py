@@ -1,9 +1,13 @@
 import asyncio
+import argparse
 import json
 import subprocess
 import websockets
+from audio.framing import unpack_audio_frame
 
 WS_URL = "ws://127.0.0.1:8024"
+VOICE_SAMPLE_RATE = 16000
+VOICE_CHUNK_MS = 20
 
 
 class StreamAudioPlayer:
@@ -23,10 +27,10 @@ class StreamAudioPlayer:
             print("[Error] mpv not found, please install mpv")
             return False
 
-    def feed(self, hex_audio: str):
+    def feed(self, audio: bytes):
         if self.mpv_process and self.mpv_process.stdin:
             try:
-                self.mpv_process.stdin.write(bytes.fromhex(hex_audio))
+                self.mpv_process.stdin.write(audio)
                 self.mpv_process.stdin.flush()
             except Exception as e:
                 print(f"[Audio feed error] {e}")
@@ -53,20 +57,125 @@ class StreamAudioPlayer:
             self.mpv_process = None
 
 
-async def main():
-    print(f"Connecting to {WS_URL} ...")
+def load_voice(path):
+    """Decode an audio file to 16 kHz mono s16le, the server's voice input format."""
+    import av
+
+    pcm = bytearray()
+    with av.open(path) as container:
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=VOICE_SAMPLE_RATE)
+        for frame in container.decode(audio=0):
+            for out in resampler.resample(frame):
+                pcm += bytes(out.planes[0])[:out.samples * 2]
+        for out in resampler.resample(None):
+            pcm += bytes(out.planes[0])[:out.samples * 2]
+    return bytes(pcm)
+
+
+async def send_voice(ws, path):
+    """Stream a recording at real-time pace as if spoken into a microphone, then a second of silence."""
+    await ws.send(json.dumps({"action": "audio_in", "format": "s16le", "sample_rate": VOICE_SAMPLE_RATE}))
+    pcm = load_voice(path) + bytes(VOICE_SAMPLE_RATE * 2)
+    step = VOICE_SAMPLE_RATE * 2 * VOICE_CHUNK_MS // 1000
+    for i in range(0, len(pcm), step):
+        await ws.send(pcm[i:i + step])
+        await asyncio.sleep(VOICE_CHUNK_MS / 1000)
+    await ws.send(json.dumps({"action": "audio_in_end"}))
+
+
+async def receive_reply(ws, loop):
+    """Print and play one turn's events until its audio is done or cancelled."""
+    player = StreamAudioPlayer()
+    player_started = False
+
+    while True:
+        frame = await ws.recv()
+        if isinstance(frame, bytes):
+            _, _, _, audio = unpack_audio_frame(frame)
+            print(f"[Received audio frame: {len(audio)} bytes]")
+            if not player_started:
+                player_started = player.start()
+            if player_started:
+                player.feed(audio)
+            continue
+
+        msg = json.loads(frame)
+        event = msg.get("event")
+
+        if event == "transcript_partial":
+            print(f"[Heard so far: {msg['text']}]")
+
+        elif event == "transcript_final":
+            print(f"User (voice): {msg['text']}")
+
+        elif event == "text_response":
+            print(f"Assistant: {msg['content']}\n")
+
+        elif event == "audio_chunk":
+            print(f"[Received audio chunk: {len(msg.get('data', '')) // 2} bytes]")
+            audio_hex = msg.get("data", "")
+            if audio_hex:
+                if not player_started:
+                    player_started = player.start()
+                if player_started:
+                    player.feed(bytes.fromhex(audio_hex))
+
+        elif event == "audio_done":
+            if player_started:
+                # finish() blocks until mpv is done playing
+                await loop.run_in_executor(None, player.finish)
+            break
+
+        elif event == "audio_cancelled":
+            player.stop()
+            break
+
+        elif event == "error":
+            print(f"[Error] {msg.get('message')}")
+            player.stop()
+            break
+
+
+async def main(args):
+    url = f"{args.url.rstrip('/')}/?session_id={args.session}" if args.session else args.url
+    print(f"Connecting to {args.url} ...")
     try:
-        async with websockets.connect(WS_URL) as ws:
+        async with websockets.connect(url) as ws:
             response = json.loads(await ws.recv())
 
             if response.get("event") != "session_created":
                 print(f"Failed to create session: {response}")
                 return
 
-            print(f"Session created. Type your message (Ctrl+C to quit).\n")
+            # ask for binary audio frames; older servers don't advertise them and keep sending hex
+            configure = {"action": "configure"}
+            if "binary" in response.get("audio_transports", []):
+                configure["audio_transport"] = "binary"
+            if args.format:
+                # mpv detects mp3 / wav / Ogg/Opus from the stream itself
+                configure["format"] = args.format
+                if args.bitrate:
+                    configure["bitrate"] = args.bitrate
+                if args.frame_duration:
+                    configure["frame_duration"] = args.frame_duration
+            if len(configure) > 1:
+                await ws.send(json.dumps(configure))
+                configured = json.loads(await ws.recv())
+                if configured.get("event") == "error":
+                    print(f"[Error] {configured.get('message')}")
+                    return
+
+            state = "resumed" if response.get("resumed") else "created"
+            print(f"Session {response.get('session_id')} {state}. Type your message (Ctrl+C to quit).\n")
 
             loop = asyncio.get_event_loop()
 
+            if args.voice:
+                voice_task = asyncio.create_task(send_voice(ws, args.voice))
+                await receive_reply(ws, loop)
+                await voice_task
+                return
+
             while True:
                 try:
                     user_input = await loop.run_in_executor(None, input, "User: ")
@@ -81,40 +190,18 @@ async def main():
                     "action": "chat",
                     "message": user_input
                 }))
-
-                player = StreamAudioPlayer()
-                player_started = False
-
-                while True:
-                    msg = json.loads(await ws.recv())
-                    event = msg.get("event")
-
-                    if event == "text_response":
-                        print(f"Assistant: {msg['content']}\n")
-
-                    elif event == "audio_chunk":
-                        print(f"[Received audio chunk: {len(msg.get('data', '')) // 2} bytes]")
-                        audio_hex = msg.get("data", "")
-                        if audio_hex:
-                            if not player_started:
-                                player_started = player.start()
-                            if player_started:
-                                player.feed(audio_hex)
-
-                    elif event == "audio_done":
-                        if player_started:
-                            # finish() blocks until mpv is done playing
-                            await loop.run_in_executor(None, player.finish)
-                        break
-
-                    elif event == "error":
-                        print(f"[Error] {msg.get('message')}")
-                        player.stop()
-                        break
+                await receive_reply(ws, loop)
 
     except (websockets.exceptions.ConnectionClosedError, OSError):
-        print(f"Cannot connect to server at {WS_URL}")
+        print(f"Cannot connect to server at {args.url}")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=WS_URL)
+    parser.add_argument("--session", help="session id from an earlier run, to continue that conversation")
+    parser.add_argument("--format", help="audio format to ask for (mp3 / wav / s16le / opus), default is the server's")
+    parser.add_argument("--bitrate", type=int, help="opus bitrate in bit/s")
+    parser.add_argument("--frame-duration", type=int, help="opus frame duration in ms (10 / 20 / 40 / 60)")
+    parser.add_argument("--voice", help="speak this audio file (e.g. audio_input/Mamba.wav) instead of typing; needs [asr] on the server")
+    asyncio.run(main(parser.parse_args()))
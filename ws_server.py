@@ -1,204 +1,699 @@
 import os
 import json
-import ssl
 import uuid
+import mimetypes
 import asyncio
-import subprocess
-import threading
+import time
 import logging
-import websockets
-from fastapi import FastAPI, WebSocket
+import threading
+from contextlib import aclosing, asynccontextmanager
+from fastapi import FastAPI, Request, Response, WebSocket
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.websockets import WebSocketDisconnect
-import uvicorn
 from dotenv import load_dotenv
 import globals
-from llm.llm_session import LLMSession, create_llm_session
+from llm.llm_session import LLMSession, create_llm_session, get_llm_session_class
+from llm.clients import close_llm_clients
+from llm.segmenter import SentenceSegmenter
+from llm.speculative import SpeculativeReply
+from tts import get_streaming_tts
+from asr import get_recognizer
+from asr.streaming import ASR_FORMAT, StreamingRecognizer
+from tts.streaming import StreamingTTS, TTSStream
+from tts.prefetch import SegmentPrefetcher, get_prefetch_limiter
+from tts.audio_cache import REPLAY_CHUNK_SIZE, cache_key, get_audio_cache, is_cacheable, load_cache_phrases
+from audio.formats import OPUS_DEFAULT_BITRATE, OPUS_DEFAULT_FRAME_MS, PATH_DIRECT, AudioPlan, negotiate_audio_format
+from audio.sender import AUDIO_TRANSPORTS, ClientAudioSender, active_senders
+from audio.transcoder import close_ffmpeg_pools, create_transcoder_for_plan, warm_up_transcoder
+from session_store import SessionStore, create_session_store
+from startup import WarmupRegistry
+from logging_setup import LogBody, setup_logging
+from metrics import TurnTimer, metrics, speculative_replies_total, turns_total
+from voice_input import VoiceInput
+from voice_jobs import PARTIAL_SUFFIX, VoiceJob, VoiceJobManager, follow_partial_file, parse_byte_range
 
 load_dotenv()
 
-TTS_MODEL = "speech-2.8-hd"
-MINIMAX_TTS_FILE_FORMAT = "mp3"
-LOG_DIR = "log"
-LOG_FILE = os.path.join(LOG_DIR, "ws_server.log")
-
-os.makedirs(LOG_DIR, exist_ok=True)
+# uvicorn workers import this module on their own; the parent tells them which config to read
+if not globals.config.sections():
+    globals.config.read(os.getenv("KOBE_CONFIG", "config/config.ini"))
 
 logger = logging.getLogger("ws_server")
-if not logger.handlers:
-    logger.setLevel(logging.INFO)
-    formatter = logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+# records are queued on the loop thread and written to file/console by a listener thread
+log_pipeline = None if logger.handlers else setup_logging(logger)
 
-    file_handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
-    file_handler.setFormatter(formatter)
-
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
+class SessionManager:
+    """Live LLM sessions of this process's connections, backed by a SessionStore.
 
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    logger.propagate = False
+    Conversations are saved under a stable session id after every turn, so
+    a client that reconnects (to this or any other worker sharing the store)
+    with that id picks up where it left off.
+    """
 
-class SessionManager:
     def __init__(self):
         self.sessions: dict[int, LLMSession] = {}
+        self._store: SessionStore | None = None
+        self._store_lock = threading.Lock()
+
+    @property
+    def store(self) -> SessionStore:
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    self._store = create_session_store()
+                    logger.info("Session store: %s", self._store.name)
+        return self._store
 
     def get_session(self, websocket_id: int) -> LLMSession:
         return self.sessions.get(websocket_id)
 
-    def create_session(self, websocket_id, model_name, system_prompt) -> str:
-        self.sessions[websocket_id] = create_llm_session(globals.config.get("llm", "type"), model_name, system_prompt)
-
-
-session_manager = SessionManager()
-
+    def new_session(self, model_name, system_prompt) -> LLMSession:
+        session = create_llm_session(globals.config.get("llm", "type"), model_name, system_prompt)
+        session.session_id = uuid.uuid4().hex
+        return session
 
-async def establish_minimax_connection(api_key):
-    """Establish WebSocket connection to Minimax TTS API"""
-    url = "wss://api.minimax.io/ws/v1/t2a_v2"
-    headers = {"Authorization": f"Bearer {api_key}"}
-
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-
-    ws = await websockets.connect(url, additional_headers=headers, ssl=ssl_context)
-    connected = json.loads(await ws.recv())
-    if connected.get("event") == "connected_success":
-        logger.info("Minimax TTS connected")
-        return ws
-    return None
-
-
-async def start_tts_task(tts_ws, voice_id):
-    """Send task_start to Minimax TTS"""
-    start_msg = {
-        "event": "task_start",
-        "model": TTS_MODEL,
-        "voice_setting": {
-            "voice_id": voice_id,
-            "speed": 1,
-            "vol": 1,
-            "pitch": 0,
-            "english_normalization": False
-        },
-        "audio_setting": {
-            "sample_rate": 32000,
-            "bitrate": 128000,
-            "format": MINIMAX_TTS_FILE_FORMAT,
-            "channel": 1
-        }
-    }
-    await tts_ws.send(json.dumps(start_msg))
-    response = json.loads(await tts_ws.recv())
-    return response.get("event") == "task_started"
-
-
-async def stream_tts_to_client(tts_ws, text, client_ws: WebSocket):
-    """Send text to Minimax, convert MP3→WAV via ffmpeg, forward WAV chunks to client"""
-    await tts_ws.send(json.dumps({
-        "event": "task_continue",
-        "text": text
-    }))
-
-    # Start ffmpeg: stdin=mp3 stream, stdout=wav stream
-    ffmpeg_proc = None
-    target_file_format = globals.config.get("tts", "file_format", fallback=MINIMAX_TTS_FILE_FORMAT).lower()
-    if target_file_format != MINIMAX_TTS_FILE_FORMAT:
+    async def load_session(self, session_id, model_name, system_prompt) -> LLMSession | None:
+        """The stored conversation `session_id`, or None if the store does not have it."""
+        if not session_id:
+            return None
+        session_id = str(session_id)
         try:
-            ffmpeg_proc = subprocess.Popen(
-                ["ffmpeg", "-f", MINIMAX_TTS_FILE_FORMAT, "-i", "pipe:0",
-                "-f", target_file_format, "-ar", "32000", "-ac", "1", "pipe:1"],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL,
-            )
-        except FileNotFoundError:
-            logger.warning("ffmpeg not found, falling back to raw mp3")
+            state = await asyncio.to_thread(self.store.load, session_id)
         except Exception:
-            logger.exception("ffmpeg error, falling back to raw mp3")
+            logger.exception("Session load failed: session_id=%s", session_id)
+            return None
+        if state is None:
+            return None
+        session = create_llm_session(globals.config.get("llm", "type"), model_name, system_prompt)
+        session.load_state(state)
+        session.session_id = session_id
+        return session
+
+    async def create_session(self, websocket_id, model_name, system_prompt, session_id=None):
+        """Open the connection's session, resuming `session_id` if the store has it; returns (session, resumed)."""
+        session = await self.load_session(session_id, model_name, system_prompt)
+        resumed = session is not None
+        if not resumed:
+            # unknown ids are not adopted, so a client cannot pick (or guess) someone else's id
+            session = self.new_session(model_name, system_prompt)
+        self.sessions[websocket_id] = session
+        return session, resumed
+
+    async def save_session(self, session: LLMSession):
+        try:
+            await asyncio.to_thread(self.store.save, session.session_id, session.to_dict())
+        except Exception:
+            logger.exception("Session save failed: session_id=%s", session.session_id)
 
-    loop = asyncio.get_event_loop()
-    wav_queue: asyncio.Queue = asyncio.Queue()
+    def remove_session(self, websocket_id):
+        self.sessions.pop(websocket_id, None)
 
-    def read_wav_chunks():
-        """Read WAV output from ffmpeg stdout in a background thread."""
-        while True:
-            chunk = ffmpeg_proc.stdout.read(4096)
-            if not chunk:
-                break
-            loop.call_soon_threadsafe(wav_queue.put_nowait, chunk)
-        loop.call_soon_threadsafe(wav_queue.put_nowait, None)  # sentinel
+    async def close(self):
+        if self._store is not None:
+            await asyncio.to_thread(self._store.close)
 
-    if ffmpeg_proc:
-        reader_thread = threading.Thread(target=read_wav_chunks, daemon=True)
-        reader_thread.start()
 
-    async def forward_wav():
-        """Forward WAV chunks from queue to client WebSocket."""
-        while True:
-            chunk = await wav_queue.get()
-            if chunk is None:
-                break
-            await client_ws.send_json({
-                "event": "audio_chunk",
-                "data": chunk.hex(),
-            })
-        await client_ws.send_json({"event": "audio_done"})
+session_manager = SessionManager()
+voice_jobs = VoiceJobManager()
+warmup = WarmupRegistry()
+tts_backend: StreamingTTS | None = None
+tts_backend_loaded = False
+tts_backend_lock = threading.Lock()
+asr_recognizer: StreamingRecognizer | None = None
+asr_recognizer_loaded = False
+asr_recognizer_lock = threading.Lock()
+
+# lowest mp3 / opus bitrates a slow client is downgraded to
+MIN_DOWNGRADE_BITRATE = 32000
+MIN_DOWNGRADE_OPUS_BITRATE = 12000
+# seconds a /download_voice request waits for audio that has not been synthesized yet
+VOICE_JOB_WAIT = 60.0
+
+
+def get_tts_backend():
+    """Create the process-wide streaming TTS backend selected by [tts] type on first use.
+
+    Provider modules (websockets, torch, ...) are only imported here, so the
+    first call may be slow; startup makes it from a worker thread.
+    """
+    global tts_backend, tts_backend_loaded
+    if not tts_backend_loaded:
+        with tts_backend_lock:
+            if not tts_backend_loaded:
+                tts_backend = get_streaming_tts(globals.config.get("tts", "type", fallback="none").lower())
+                tts_backend_loaded = True
+    return tts_backend
+
+
+def get_asr_recognizer():
+    """Create the process-wide speech recognizer selected by [asr] type on first use (None: no voice input)."""
+    global asr_recognizer, asr_recognizer_loaded
+    if not asr_recognizer_loaded:
+        with asr_recognizer_lock:
+            if not asr_recognizer_loaded:
+                asr_recognizer = get_recognizer(globals.config.get("asr", "type", fallback="none").lower())
+                asr_recognizer_loaded = True
+    return asr_recognizer
+
+
+def get_tts_voice_id():
+    backend = get_tts_backend()
+    return backend.default_voice() if backend else ""
+
+
+def get_transcoder_backend():
+    return globals.config.get("tts", "transcoder", fallback="pyav").lower()
+
+
+def negotiate_plan(output_format, sample_rate=32000, channels=1, bitrate=None, frame_duration=None) -> AudioPlan:
+    """AudioPlan for a client request; `bitrate` / `frame_duration` (ms) only apply to opus and default to [tts] opus_*."""
+    backend = get_tts_backend()
+    if backend:
+        plan = backend.negotiate(output_format, sample_rate, channels)
+    else:
+        plan = negotiate_audio_format(output_format, sample_rate, channels)
+    if plan.output_format == "opus":
+        plan.set_opus_encoding(
+            bitrate if bitrate is not None else globals.config.getint("tts", "opus_bitrate", fallback=OPUS_DEFAULT_BITRATE),
+            frame_duration if frame_duration is not None else globals.config.getint("tts", "opus_frame_ms", fallback=OPUS_DEFAULT_FRAME_MS),
+        )
+    return plan
+
+
+def get_default_audio_plan() -> AudioPlan:
+    return negotiate_plan(globals.config.get("tts", "file_format", fallback="mp3"))
+
+
+def downgrade_plan(plan: AudioPlan) -> AudioPlan:
+    """A cheaper plan for a client that cannot keep up: mp3 instead of PCM, then halve the mp3 bitrate.
+
+    Opus is already the cheapest format, so only its bitrate is halved.
+    """
+    if plan.output_format == "opus":
+        return negotiate_plan("opus", plan.sample_rate, plan.channels,
+                              max(MIN_DOWNGRADE_OPUS_BITRATE, plan.opus_bitrate // 2), plan.opus_frame_duration)
+    cheaper = negotiate_plan("mp3", plan.sample_rate, plan.channels)
+    if plan.output_format == "mp3":
+        cheaper.bitrate = max(MIN_DOWNGRADE_BITRATE, plan.bitrate // 2)
+    return cheaper
+
+
+def create_audio_sender(websocket: WebSocket, websocket_id) -> ClientAudioSender:
+    return ClientAudioSender(
+        websocket,
+        max_buffered=globals.config.getint("tts", "client_buffer_kb", fallback=256) * 1024,
+        low_water=globals.config.getint("tts", "client_buffer_low_kb", fallback=64) * 1024,
+        policy=globals.config.get("tts", "slow_client_policy", fallback="pause").lower(),
+        connection_id=websocket_id,
+        frame_ms=globals.config.getint("tts", "client_frame_ms", fallback=20),
+    )
 
-    await client_ws.send_json({"event": "audio_start", "format": target_file_format, "sample_rate": 32000, "channel": 1, "bitrate": 128000})
-    
-    if ffmpeg_proc:
-        forward_task = asyncio.create_task(forward_wav())
 
+async def stream_tts_to_client(tts_stream: TTSStream, backend: StreamingTTS, voice_id, segment_queue: asyncio.Queue,
+                               audio_sender: ClientAudioSender, plan: AudioPlan, turn):
+    """Send text segments to the TTS backend as they arrive, convert per the audio plan, forward chunks to client.
+
+    `segment_queue` yields text segments and is terminated by None. Each
+    segment is synthesized as soon as it is queued, so synthesis of the first
+    sentence overlaps with LLM generation of the rest, and up to [tts]
+    prefetch_segments are synthesized at once, so the next sentence is ready
+    when the current one ends. Audio goes out in segment order.
+    Short segments found in the audio cache are replayed instead of synthesized.
+    """
+    transcoder = create_transcoder_for_plan(get_transcoder_backend(), plan)
+
+    # segments fed to the transcoder whose converted audio may not all be queued yet
+    converting: list[str] = []
+
+    async def forward_audio():
+        """Forward converted chunks from the transcoder to the client."""
+        async for chunk in transcoder.chunks():
+            await audio_sender.send_chunk(chunk)
+        audio_sender.flush()
+        for text in converting:
+            turn.segment_queued(text, audio_sender.stream_id, audio_sender.seq)
+        converting.clear()
+        await audio_sender.done()
+
+    if transcoder or plan.path == PATH_DIRECT:
+        await audio_sender.start(plan.output_format, plan.sample_rate, plan.channels, plan.output_bitrate, plan.path)
+    else:
+        # no transcoder available, send what the provider produced
+        await audio_sender.start(plan.provider_format, plan.provider_sample_rate, plan.provider_channels, plan.bitrate, "fallback")
+
+    if transcoder:
+        forward_task = asyncio.create_task(forward_audio())
+
+    cache = get_audio_cache()
+    audio_setting = plan.provider_audio_setting()
+
+    async def emit(audio: bytes):
+        if transcoder:
+            await transcoder.feed(audio)
+        else:
+            await audio_sender.send_chunk(audio)
+
+    def end_segment(text):
+        if not transcoder:
+            # the last bit of a sentence goes out now rather than waiting to fill a frame with the next one
+            audio_sender.flush()
+            turn.segment_queued(text, audio_sender.stream_id, audio_sender.seq)
+            return
+        # the transcoder lags its input, so the audio queued by now only covers the segments before this one,
+        # the end of the last of them possibly still in the frame being filled
+        for done in converting:
+            turn.segment_queued(done, audio_sender.stream_id, audio_sender.seq + 1)
+        converting[:] = [text]
+
+    prefetcher = SegmentPrefetcher(backend, voice_id, plan, tts_stream,
+                                   globals.config.getint("tts", "prefetch_segments", fallback=2), get_prefetch_limiter())
+    # (text, cache key, cached audio or PendingSegment) in reply order, terminated by None
+    ordered: asyncio.Queue = asyncio.Queue()
+
+    async def schedule_segments():
+        """Take segments as the LLM produces them; replay them from the cache or start synthesizing them."""
+        try:
+            while True:
+                text = await segment_queue.get()
+                if text is None:
+                    break
+                key = None
+                if cache and is_cacheable(text):
+                    key = cache_key(text, voice_id, backend.model, audio_setting)
+                    cached = await cache.aget(key)
+                    if cached is not None:
+                        ordered.put_nowait((text, key, cached))
+                        continue
+                ordered.put_nowait((text, key, prefetcher.submit(text)))
+        except Exception as e:
+            ordered.put_nowait(e)
+        ordered.put_nowait(None)
+
+    schedule_task = asyncio.create_task(schedule_segments())
+    ok = True
+    cancelled = False
     chunk_counter = 1
     try:
         while True:
-            response = json.loads(await tts_ws.recv())
-
-            if "data" in response and "audio" in response["data"]:
-                audio_hex = response["data"]["audio"]
-                if audio_hex:
-                    print("Converting audio chunk #%s", chunk_counter)
-                    if ffmpeg_proc:
-                        ffmpeg_proc.stdin.write(bytes.fromhex(audio_hex))
-                        ffmpeg_proc.stdin.flush()
-                    else:
-                        await client_ws.send_json({
-                            "event": "audio_chunk",
-                            "data": audio_hex,
-                            "format": MINIMAX_TTS_FILE_FORMAT
-                        })
-                    chunk_counter += 1
-
-            if response.get("is_final"):
-                logger.info("TTS done: %s chunks received", chunk_counter - 1)
+            item = await ordered.get()
+            if item is None:
                 break
-
+            if isinstance(item, Exception):
+                raise item
+            text, key, source = item
+
+            if isinstance(source, bytes):
+                # cached audio stands in for the provider's first byte
+                turn.timer.mark("provider_first_byte")
+                replay = memoryview(source)
+                for i in range(0, len(source), REPLAY_CHUNK_SIZE):
+                    await emit(replay[i:i + REPLAY_CHUNK_SIZE])
+                end_segment(text)
+                continue
+
+            segment_audio = bytearray() if key else None
+            async for data in prefetcher.audio(source):
+                turn.timer.mark("provider_first_byte")
+                if segment_audio is not None:
+                    segment_audio += data
+                await emit(data)
+                logger.debug("TTS chunk: stream_id=%s segment=%s n=%s bytes=%s", audio_sender.stream_id, source.seq, chunk_counter, len(data))
+                chunk_counter += 1
+
+            end_segment(text)
+            if segment_audio:
+                cache.put_nowait(key, bytes(segment_audio))
+
+        logger.debug("TTS done: %s chunks received", chunk_counter - 1)
+
+    except asyncio.CancelledError:
+        cancelled = True
+        raise
     except Exception:
+        ok = False
         logger.exception("TTS streaming error")
     finally:
-        if ffmpeg_proc:
-            try:
-                ffmpeg_proc.stdin.close()
-            except Exception:
-                pass
+        schedule_task.cancel()
+        await prefetcher.close()
+        if transcoder:
+            if cancelled:
+                forward_task.cancel()
+                await transcoder.abort()
+            else:
+                await transcoder.close()
 
-    if ffmpeg_proc:
+    if transcoder:
         await forward_task
     else:
-        await client_ws.send_json({"event": "audio_done"})
+        await audio_sender.done()
+    return ok
+
+
+async def run_tts_pipeline(backend: StreamingTTS, voice_id, segment_queue: asyncio.Queue, audio_sender: ClientAudioSender, plan: AudioPlan, turn):
+    """Open the turn's TTS stream (a warm pooled task for Minimax) while the LLM is still generating, then stream segments through it."""
+    requested = time.monotonic()
+    try:
+        async with backend.session(voice_id, plan) as tts_stream:
+            if tts_stream:
+                # a pooled connection was opened before the turn; its spans count as the checkout time
+                turn.timer.mark("tts_connect", max(tts_stream.connected_at or time.monotonic(), requested))
+                turn.timer.mark("tts_task_started", max(tts_stream.task_started_at or time.monotonic(), requested))
+                if not await stream_tts_to_client(tts_stream, backend, voice_id, segment_queue, audio_sender, plan, turn):
+                    tts_stream.broken = True
+            else:
+                logger.warning("TTS task start failed")
+                await audio_sender.done()
+    except Exception:
+        logger.exception("TTS error")
+        await audio_sender.done()
+
+
+def record_turn(websocket_id, timer: TurnTimer, outcome):
+    """Log the turn's spans as one JSON record; completed turns also feed the latency histograms."""
+    turns_total.inc(outcome=outcome)
+    if outcome == "completed":
+        timer.observe()
+    logger.info("Turn timing:", extra={"fields": {"websocket_id": websocket_id, "outcome": outcome, "timing": timer.to_dict()}})
+
+
+class TurnState:
+    """What one chat turn has produced so far, so an interrupted turn can be rolled back."""
+
+    def __init__(self, timer: TurnTimer):
+        self.timer = timer
+        # (text, stream_id, seq of the message carrying its last audio) per segment, in reply order
+        self.queued_segments: list[tuple[str, int, int]] = []
+
+    def segment_queued(self, text, stream_id, seq):
+        self.queued_segments.append((text, stream_id, seq))
+
+    def spoken_prefix(self, response, sent):
+        """The part of `response` up to the end of the last segment whose audio reached the client.
+
+        `sent` is the sender's last (stream_id, seq) actually sent; audio
+        still queued behind it is dropped on barge-in, never heard.
+        """
+        end = 0
+        for segment, stream_id, seq in self.queued_segments:
+            if sent < (stream_id, seq):
+                break
+            index = response.find(segment, end)
+            if index < 0:
+                break
+            end = index + len(segment)
+        return response[:end]
 
 
-async def close_minimax_connection(tts_ws):
-    if tts_ws:
+async def stop_tts(tts_task: asyncio.Task | None, audio_sender: ClientAudioSender):
+    """Tear down a turn's TTS pipeline and drop the audio it queued that has not been sent yet."""
+    if tts_task and not tts_task.done():
+        tts_task.cancel()
         try:
-            await tts_ws.send(json.dumps({"event": "task_finish"}))
-            await tts_ws.close()
-        except Exception:
+            await tts_task
+        except asyncio.CancelledError:
             pass
+    audio_sender.discard_pending()
+
+
+async def run_chat_turn(websocket_id, session: LLMSession, user_message, websocket: WebSocket,
+                        audio_sender: ClientAudioSender, audio_plan: AudioPlan,
+                        backend: StreamingTTS | None, voice_id, timer: TurnTimer, reply: SpeculativeReply | None = None):
+    """Stream one LLM reply to the client and, if TTS is enabled, into speech.
+
+    `reply` is a reply already started on this message while the user was
+    still speaking; its buffered text goes out first. Runs as its own task so the receive loop can cancel it on barge-in. On
+    cancellation the LLM stream is closed, the TTS task is torn down, unsent
+    audio is dropped and the assistant message in the session is cut back to
+    the segments whose audio was fully sent to the client. The session is saved to the store when the turn ends.
+    """
+    turn = TurnState(timer)
+    audio_sender.timer = timer
+    segment_queue: asyncio.Queue = asyncio.Queue()
+    tts_task = None
+    if backend:
+        tts_task = asyncio.create_task(run_tts_pipeline(backend, voice_id, segment_queue, audio_sender, audio_plan, turn))
+
+    segmenter = SentenceSegmenter()
+    response = ""
+    try:
+        try:
+            async with aclosing(reply.stream() if reply else session.chat_stream(user_message)) as stream:
+                async for delta in stream:
+                    timer.mark("llm_first_token")
+                    response += delta
+                    await websocket.send_json({
+                        "event": "text_delta",
+                        "content": delta
+                    })
+                    for segment in segmenter.feed(delta):
+                        segment_queue.put_nowait(segment)
+            for segment in segmenter.flush():
+                segment_queue.put_nowait(segment)
+        finally:
+            segment_queue.put_nowait(None)
+        timer.mark("llm_complete")
+        logger.info("LLM reply: websocket_id=%s response=%s", websocket_id, LogBody(response))
+        logger.info("LLM stats: websocket_id=%s prompt_tokens=%s stats=%s", websocket_id, session.last_prompt_tokens, session.last_stats)
+
+        await websocket.send_json({
+            "event": "text_response",
+            "content": response,
+            "prompt_tokens": session.last_prompt_tokens,
+            "llm_stats": session.last_stats
+        })
+
+        if tts_task:
+            await tts_task
+        else:
+            await audio_sender.done()
+        record_turn(websocket_id, timer, "completed")
+
+    except asyncio.CancelledError:
+        await stop_tts(tts_task, audio_sender)
+        if tts_task:
+            session.truncate_last_reply(turn.spoken_prefix(response, audio_sender.sent))
+        record_turn(websocket_id, timer, "interrupted")
+        raise
+    except Exception:
+        logger.exception("Chat turn error: websocket_id=%s", websocket_id)
+        # no audio of a failed turn may follow its error into the next one
+        await stop_tts(tts_task, audio_sender)
+        record_turn(websocket_id, timer, "failed")
+        await websocket.send_json({"event": "error", "message": "Chat failed"})
+    finally:
+        # saved after every outcome, so a resumed session continues from what the client last heard
+        await session_manager.save_session(session)
+
+
+async def warm_up_llm():
+    # importing the client library is the slow part of the first session; keep it off the loop
+    session_class = await asyncio.to_thread(get_llm_session_class, globals.config.get("llm", "type"))
+    await session_class.warm_up(globals.config.get("llm", "model"), globals.config.get("llm", "system_prompt"))
+
+
+async def warm_up_tts():
+    backend = await asyncio.to_thread(get_tts_backend)
+    voice_id = get_tts_voice_id()
+    if backend and voice_id:
+        await backend.warm_up(voice_id, get_default_audio_plan())
 
 
-app = FastAPI()
+async def warm_up_asr():
+    recognizer = await asyncio.to_thread(get_asr_recognizer)
+    if recognizer:
+        await recognizer.warm_up()
+
+
+async def warm_up_audio_path():
+    await asyncio.to_thread(get_tts_backend)
+    plan = get_default_audio_plan()
+    logger.info("Default audio path: %s", plan.to_dict())
+    await warm_up_transcoder(get_transcoder_backend(), plan)
+
+
+async def warm_up_audio_cache():
+    backend = await asyncio.to_thread(get_tts_backend)
+    voice_id = get_tts_voice_id()
+    if backend and voice_id:
+        await prefill_audio_cache(backend, voice_id, get_default_audio_plan())
+
+
+async def prefill_audio_cache(backend: StreamingTTS, voice_id, plan: AudioPlan):
+    """Synthesize the configured phrase list into the audio cache, skipping phrases already stored."""
+    cache = get_audio_cache()
+    phrases = load_cache_phrases()
+    if not cache or not phrases:
+        return
+    audio_setting = plan.provider_audio_setting()
+    stored = 0
+    try:
+        for phrase in phrases:
+            key = cache_key(phrase, voice_id, backend.model, audio_setting)
+            if await cache.aget(key) is not None:
+                continue
+            async with backend.session(voice_id, plan) as tts_stream:
+                if not tts_stream:
+                    logger.warning("Audio cache prefill stopped: TTS unavailable")
+                    return
+                audio = bytearray()
+                async for chunk in tts_stream.synthesize(phrase):
+                    audio += chunk.data
+                cache.put_nowait(key, bytes(audio))
+                stored += 1
+    except Exception:
+        logger.exception("Audio cache prefill failed")
+    logger.info("Audio cache prefilled: %s new of %s phrases", stored, len(phrases))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # all warm-ups run concurrently in the background; connections are accepted right away
+    warmup.register("llm", warm_up_llm)
+    warmup.register("tts", warm_up_tts)
+    warmup.register("transcoder", warm_up_audio_path)
+    warmup.register("audio_cache", warm_up_audio_cache, required=False)
+    # text chat works without it
+    warmup.register("asr", warm_up_asr, required=False)
+    warmup.start()
+    yield
+    await warmup.close()
+    await voice_jobs.close()
+    await close_llm_clients()
+    if tts_backend:
+        await tts_backend.close()
+    if asr_recognizer:
+        await asr_recognizer.close()
+    await close_ffmpeg_pools()
+    await session_manager.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def numeric_stats(stats):
+    return {(name,): value for name, value in (stats or {}).items() if isinstance(value, (int, float))}
+
+
+metrics.gauge("kobe_tts_backend", "TTS backend counters and gauges, as in /stats", lambda: numeric_stats(tts_backend.get_stats() if tts_backend else None), ("stat",))
+metrics.gauge("kobe_client_buffered_bytes", "Audio queued for each connection but not yet sent",
+              lambda: {(str(sender.connection_id),): sender.buffered_bytes for sender in active_senders}, ("connection",))
+metrics.gauge("kobe_log_records", "Log records waiting for the listener thread, and dropped because the queue was full",
+              lambda: numeric_stats(log_pipeline.get_stats() if log_pipeline else None), ("stat",))
+metrics.gauge("kobe_tts_prefetch", "Extra TTS streams opened to synthesize ahead, as in /stats", lambda: numeric_stats(get_prefetch_limiter().get_stats()), ("stat",))
+metrics.gauge("kobe_audio_cache", "Audio cache counters and sizes, as in /stats", lambda: numeric_stats(get_audio_cache().get_stats() if get_audio_cache() else None), ("stat",))
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok", **warmup.to_dict()}
+
+
+@app.get("/readyz")
+async def readyz():
+    state = warmup.to_dict()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
+@app.get("/stats")
+async def stats():
+    backend = get_tts_backend()
+    cache = get_audio_cache()
+    return {
+        "tts": {"backend": backend.name, **backend.get_stats()} if backend else None,
+        "audio_cache": cache.get_stats() if cache else None,
+        "asr": {"backend": asr_recognizer.name, **asr_recognizer.get_stats()} if asr_recognizer else None,
+        "tts_prefetch": get_prefetch_limiter().get_stats(),
+        "clients": {
+            "connections": len(active_senders),
+            "buffered_bytes_total": sum(sender.buffered_bytes for sender in active_senders),
+            "buffered_bytes_max": max((sender.buffered_bytes for sender in active_senders), default=0),
+            "high_water_hits": sum(sender.stats["high_water_hits"] for sender in active_senders),
+        },
+        "logging": log_pipeline.get_stats() if log_pipeline else None,
+    }
+
+
+@app.post("/api/create_session")
+async def api_create_session():
+    session = session_manager.new_session(globals.config.get("llm", "model"), globals.config.get("llm", "system_prompt"))
+    await session_manager.save_session(session)
+    logger.info("Session created: session_id=%s (http)", session.session_id)
+    return {"session_id": session.session_id}
+
+
+@app.post("/api/chat")
+async def api_chat(request: Request):
+    """Reply with the text as soon as the LLM is done; the voice is synthesized by a background job.
+
+    `voice_file` can be downloaded right away: /download_voice streams it while it is written.
+    """
+    data = await request.json()
+    session = await session_manager.load_session(data.get("session_id"), globals.config.get("llm", "model"),
+                                                 globals.config.get("llm", "system_prompt"))
+    if session is None:
+        return JSONResponse({"error": "Session not found"}, status_code=404)
+    user_message = data.get("message")
+    logger.info("User input: session_id=%s message=%s (http)", session.session_id, LogBody(user_message))
+    response = await session.achat(user_message)
+    await session_manager.save_session(session)
+    logger.info("LLM reply: session_id=%s response=%s (http)", session.session_id, LogBody(response))
+
+    backend = get_tts_backend()
+    voice_id = get_tts_voice_id()
+    if not (backend and voice_id):
+        return {"response": response}
+    job = voice_jobs.start(session.session_id, response, backend, voice_id, negotiate_plan("wav"), get_transcoder_backend())
+    return {"response": response, "voice_file": job.filename}
+
+
+async def stream_voice_job(job: VoiceJob, range_header):
+    """Serve a file that is still being written: chunked while it grows, ranges clipped to what exists so far."""
+    media_type = mimetypes.guess_type(job.filename)[0] or "application/octet-stream"
+    byte_range = parse_byte_range(range_header)
+    if byte_range is None:
+        # no Content-Length, so it goes out with chunked transfer encoding
+        return StreamingResponse(job.read(), media_type=media_type, headers={"Accept-Ranges": "bytes"})
+
+    start, stop = byte_range
+    if start < 0:
+        # a suffix range needs the final length
+        await job.wait_for(float("inf"), VOICE_JOB_WAIT)
+        if not job.finished:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{job.size}"})
+        start = max(0, job.size + start)
+        stop = None
+    available = await job.wait_for(start + 1, VOICE_JOB_WAIT)
+    if available <= start:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{available}"})
+    end = available - 1 if stop is None else min(stop, available - 1)
+    total = job.size if job.finished else "*"
+    return StreamingResponse(job.read(start, end), status_code=206, media_type=media_type, headers={
+        "Accept-Ranges": "bytes",
+        "Content-Range": f"bytes {start}-{end}/{total}",
+        "Content-Length": str(end - start + 1),
+    })
+
+
+@app.get("/download_voice/{filename}")
+async def download_voice(filename: str, request: Request):
+    if os.path.basename(filename) != filename or filename.endswith(PARTIAL_SUFFIX):
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    job = voice_jobs.get(filename)
+    if job is not None:
+        return await stream_voice_job(job, request.headers.get("range"))
+    path = voice_jobs.path(filename)
+    if os.path.exists(path + PARTIAL_SUFFIX):
+        # another worker is still synthesizing it; follow its partial file (ranges need the owning worker)
+        return StreamingResponse(follow_partial_file(path, VOICE_JOB_WAIT), media_type=mimetypes.guess_type(filename)[0])
+    if os.path.isfile(path):
+        # finished jobs are plain files; FileResponse answers Range requests
+        return FileResponse(path)
+    return JSONResponse({"error": "Not found"}, status_code=404)
 
 
 @app.websocket("/")
@@ -210,65 +705,187 @@ async def websocket_endpoint(websocket: WebSocket):
     client_port = websocket.client.port if websocket.client else "unknown"
     logger.info("Client connected: websocket_id=%s client=%s:%s", websocket_id, client_host, client_port)
 
-    # create session immediately
-    session_manager.create_session(
+    # create session immediately; ws://host:port/?session_id=... resumes an earlier conversation
+    session, resumed = await session_manager.create_session(
         websocket_id,
         globals.config.get("llm", "model"),
-        globals.config.get("llm", "system_prompt")
+        globals.config.get("llm", "system_prompt"),
+        websocket.query_params.get("session_id"),
     )
+    logger.info("Session %s: websocket_id=%s session_id=%s", "resumed" if resumed else "created", websocket_id, session.session_id)
+    backend = get_tts_backend()
+    voice_id = get_tts_voice_id()
+    tts_enabled = bool(backend and voice_id)
+
     await websocket.send_json({
-        "event": "session_created"
+        "event": "session_created",
+        "session_id": session.session_id,
+        "resumed": resumed,
+        "audio_transports": list(AUDIO_TRANSPORTS),
+        "voices": backend.voices() if backend else [],
+        "voice": voice_id
     })
-
-    tts_enabled = False
-    if globals.config.get("tts", "type", fallback="none").lower() != "none":
-        api_key = os.getenv("MINIMAX_API_KEY")
+    # hex-in-JSON and the configured file_format until the client negotiates otherwise with a configure action
+    audio_sender = create_audio_sender(websocket, websocket_id)
+    audio_plan = get_default_audio_plan()
+
+    turn_task: asyncio.Task | None = None
+
+    async def cancel_turn():
+        """Cancel the in-flight turn, if any, and tell the client where its audio stopped."""
+        nonlocal turn_task
+        if not turn_task or turn_task.done():
+            return False
+        turn_task.cancel()
         try:
-            voice_id = globals.config.get("tts", "voice_id")
-        except Exception:
-            voice_id = ""
-        tts_enabled = bool(api_key and voice_id)
+            await turn_task
+        except asyncio.CancelledError:
+            pass
+        turn_task = None
+        logger.info("Turn interrupted: websocket_id=%s stream_id=%s last_seq=%s", websocket_id, audio_sender.stream_id, audio_sender.seq)
+        await audio_sender.cancelled()
+        return True
+
+    async def start_turn(user_message, timer: TurnTimer, reply: SpeculativeReply | None = None):
+        nonlocal turn_task, audio_plan
+        # a new message while the avatar is still talking interrupts the old turn
+        await cancel_turn()
+        if audio_sender.downgrade_requested:
+            audio_sender.downgrade_requested = False
+            audio_plan = downgrade_plan(audio_plan)
+            logger.info("Audio downgraded: websocket_id=%s plan=%s", websocket_id, audio_plan.to_dict())
+            await audio_sender.send_event({"event": "configured", "audio_transport": audio_sender.transport, "voice": voice_id,
+                                           "audio": audio_plan.to_dict(), "reason": "slow_client"})
+        turn_task = asyncio.create_task(run_chat_turn(
+            websocket_id, session, user_message, websocket, audio_sender,
+            audio_plan, backend if tts_enabled else None, voice_id, timer, reply,
+        ))
+
+    recognizer = get_asr_recognizer()
+    voice_input: VoiceInput | None = None
+    # inputs the client has ended whose last utterance is still being transcribed
+    ending_inputs: list[VoiceInput] = []
+    speculative: SpeculativeReply | None = None
+    last_partial = ""
+    speculate = globals.config.getboolean("asr", "speculative", fallback=True)
+    barge_in = globals.config.getboolean("asr", "barge_in", fallback=True)
+
+    async def discard_speculation():
+        nonlocal speculative
+        if speculative:
+            reply, speculative = speculative, None
+            await reply.discard()
+            speculative_replies_total.inc(outcome="discarded")
+
+    async def on_voice_event(event, text):
+        """Voice input stages: transcripts go to the client, a pause starts the reply early, the endpoint commits it."""
+        nonlocal speculative, last_partial
+        if event == "start":
+            last_partial = ""
+            await websocket.send_json({"event": "speech_started"})
+            await discard_speculation()
+            if barge_in:
+                await cancel_turn()
+        elif event == "resume":
+            await discard_speculation()
+        elif event in ("partial", "pause"):
+            if text and text != last_partial:
+                last_partial = text
+                await websocket.send_json({"event": "transcript_partial", "text": text})
+            # the history must not change under a running turn, so only speculate between turns
+            if event == "pause" and speculate and text and not speculative and (not turn_task or turn_task.done()):
+                logger.debug("Speculative reply: websocket_id=%s message=%s", websocket_id, LogBody(text))
+                speculative = SpeculativeReply(session, text)
+        elif event == "final":
+            await websocket.send_json({"event": "transcript_final", "text": text})
+            reply = None
+            if speculative and text and speculative.matches(text):
+                reply, speculative = speculative, None
+                speculative_replies_total.inc(outcome="committed")
+            else:
+                await discard_speculation()
+            if not text.strip():
+                return
+            logger.info("User input: websocket_id=%s message=%s speculative=%s (voice)", websocket_id, LogBody(text), reply is not None)
+            await start_turn(text, TurnTimer(), reply)
 
     try:
         while True:
-            data = await websocket.receive_text()
-            msg = json.loads(data)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes") is not None:
+                # microphone audio after an audio_in action
+                if voice_input:
+                    voice_input.feed(message["bytes"])
+                else:
+                    await websocket.send_json({"event": "error", "message": "Send audio_in before audio"})
+                continue
+            msg = json.loads(message["text"])
             action = msg.get("action")
 
-            if action == "chat":
+            if action == "configure":
+                transport = msg.get("audio_transport", audio_sender.transport)
+                if transport not in AUDIO_TRANSPORTS:
+                    await websocket.send_json({"event": "error", "message": f"Unsupported audio transport: {transport}"})
+                    continue
+                voice = msg.get("voice", voice_id)
+                if tts_enabled and not backend.accepts_voice(voice):
+                    await websocket.send_json({"event": "error", "message": f"Unknown voice: {voice}"})
+                    continue
+                try:
+                    plan = negotiate_plan(
+                        msg.get("format", audio_plan.output_format),
+                        int(msg.get("sample_rate", audio_plan.sample_rate)),
+                        int(msg.get("channel", audio_plan.channels)),
+                        msg.get("bitrate", audio_plan.opus_bitrate if audio_plan.output_format == "opus" else None),
+                        msg.get("frame_duration", audio_plan.opus_frame_duration if audio_plan.output_format == "opus" else None),
+                    )
+                except ValueError as e:
+                    await websocket.send_json({"event": "error", "message": str(e)})
+                    continue
+                audio_sender.transport = transport
+                audio_plan = plan
+                voice_id = voice
+                logger.info("Audio configured: websocket_id=%s transport=%s voice=%s plan=%s", websocket_id, transport, voice_id, plan.to_dict())
+                await websocket.send_json({"event": "configured", "audio_transport": transport, "voice": voice_id, "audio": plan.to_dict()})
+
+            elif action == "chat":
+                timer = TurnTimer()
                 user_message = msg.get("message")
-                logger.info("User input: websocket_id=%s message=%s", websocket_id, user_message)
+                logger.info("User input: websocket_id=%s message=%s", websocket_id, LogBody(user_message))
 
-                session = session_manager.get_session(websocket_id)
-                if not session:
+                if not session_manager.get_session(websocket_id):
                     await websocket.send_json({"event": "error", "message": "Session not found"})
                     continue
+                await discard_speculation()
+                await start_turn(user_message, timer)
 
-                loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(None, session.chat, user_message)
-                logger.info("LLM reply: websocket_id=%s response=%s", websocket_id, response)
-
-                await websocket.send_json({
-                    "event": "text_response",
-                    "content": response
-                })
-
-                if tts_enabled:
-                    tts_ws = None
-                    try:
-                        tts_ws = await establish_minimax_connection(api_key)
-                        if tts_ws and await start_tts_task(tts_ws, voice_id):
-                            await stream_tts_to_client(tts_ws, response, websocket)
-                        else:
-                            logger.warning("TTS task start failed")
-                            await websocket.send_json({"event": "audio_done"})
-                    except Exception:
-                        logger.exception("TTS error")
-                        await websocket.send_json({"event": "audio_done"})
-                    finally:
-                        await close_minimax_connection(tts_ws)
-                else:
-                    await websocket.send_json({"event": "audio_done"})
+            elif action == "audio_in":
+                if not recognizer:
+                    await websocket.send_json({"event": "error", "message": "Voice input is not enabled"})
+                    continue
+                audio_format = msg.get("format", ASR_FORMAT)
+                sample_rate = int(msg.get("sample_rate", recognizer.sample_rate))
+                if audio_format != ASR_FORMAT or sample_rate != recognizer.sample_rate:
+                    await websocket.send_json({"event": "error", "message": f"Voice input must be {ASR_FORMAT} mono at {recognizer.sample_rate} Hz"})
+                    continue
+                if voice_input:
+                    await voice_input.close()
+                voice_input = VoiceInput(recognizer, on_voice_event)
+                logger.info("Voice input started: websocket_id=%s recognizer=%s", websocket_id, recognizer.name)
+                await websocket.send_json({"event": "audio_in_started", "format": ASR_FORMAT, "sample_rate": recognizer.sample_rate})
+
+            elif action == "audio_in_end":
+                # an utterance still open is transcribed and answered
+                if voice_input:
+                    voice_input.end()
+                    ending_inputs = [ending for ending in ending_inputs if not ending.done()] + [voice_input]
+                    voice_input = None
+
+            elif action == "interrupt":
+                if not await cancel_turn():
+                    await audio_sender.cancelled()
 
             else:
                 await websocket.send_json({"event": "error", "message": f"Unknown action: {action}"})
@@ -277,8 +894,31 @@ async def websocket_endpoint(websocket: WebSocket):
         logger.info("Client disconnected: websocket_id=%s client=%s:%s", websocket_id, client_host, client_port)
     except Exception:
         logger.exception("Connection error: websocket_id=%s client=%s:%s", websocket_id, client_host, client_port)
+    finally:
+        for pending_input in [voice_input, *ending_inputs]:
+            if pending_input:
+                await pending_input.close()
+        await discard_speculation()
+        if turn_task and not turn_task.done():
+            turn_task.cancel()
+        await audio_sender.close()
+        session_manager.remove_session(websocket_id)
+
+
+def main():
+    import uvicorn
+
+    host, port = globals.config.get("host", "ip"), globals.config.getint("host", "port")
+    workers = globals.config.getint("host", "workers", fallback=1)
+    if workers > 1:
+        if not session_manager.store.shared:
+            logger.warning("Session store '%s' is per process; resumes only work on the worker that saved the session",
+                           session_manager.store.name)
+        # workers re-import the app by name, one process per core
+        uvicorn.run("ws_server:app", host=host, port=port, workers=workers)
+    else:
+        uvicorn.run(app, host=host, port=port)
 
 
 if __name__ == "__main__":
-    globals.config.read("config/config.ini")
-    uvicorn.run(app, host=globals.config.get("host", "ip"), port=globals.config.getint("host", "port"))
+    main()